@@ -14,12 +14,36 @@
 # under the License.
 #
 
+import asyncio
+import concurrent.futures
+import fixtures
+import git
+import json
+import os
 import testtools
+import threading
 import unittest.mock
+import yaml
 
 import windlass.api
 import windlass.charts
+import windlass.exc
+import windlass.gitcache
+import windlass.history
 import windlass.images
+import windlass.journal
+import windlass.scheduler
+
+
+def fake_apply_async(func, args=(), kwds={}, callback=None,
+                     error_callback=None):
+    # Complete the task straight away, like a pool would in a worker
+    try:
+        result = func(*args, **kwds)
+    except Exception as e:
+        error_callback(e)
+    else:
+        callback(result)
 
 
 class TestAPI(testtools.TestCase):
@@ -55,6 +79,7 @@ class TestAPI(testtools.TestCase):
 
     @unittest.mock.patch('multiprocessing.Pool')
     def test_one_artifact_only(self, pool_mock):
+        pool_mock.return_value.apply_async.side_effect = fake_apply_async
         process = unittest.mock.MagicMock()
         self.windlass.run(process, artifact_name='some/chart')
         self.assertEqual(
@@ -62,8 +87,593 @@ class TestAPI(testtools.TestCase):
 
     @unittest.mock.patch('multiprocessing.Pool')
     def test_all_artifacts(self, pool_mock):
+        pool_mock.return_value.apply_async.side_effect = fake_apply_async
         process = unittest.mock.MagicMock()
         self.windlass.run(process)
         self.assertEqual(
             len(self.windlass.artifacts.items),
             len(pool_mock.return_value.apply_async.call_args_list))
+
+    @unittest.mock.patch('multiprocessing.Pool')
+    def test_error_terminates_pool(self, pool_mock):
+        pool_mock.return_value.apply_async.side_effect = fake_apply_async
+        process = unittest.mock.MagicMock(
+            side_effect=windlass.exc.WindlassPushPullException(
+                'Failed', out=[], errors=['Failed']))
+        self.assertRaises(
+            windlass.exc.WindlassPushPullException,
+            self.windlass.run, process)
+        pool_mock.return_value.terminate.assert_called_once_with()
+        self.assertFalse(self.windlass._running)
+
+
+class TestExecutors(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.artifacts = [
+            windlass.api.Artifact(dict(name='first')),
+            windlass.api.Artifact(dict(name='second', depends_on='first')),
+        ]
+
+    def test_thread_executor(self):
+        processed = []
+
+        def process(artifact, suffix):
+            processed.append(artifact.name)
+            return artifact.name + suffix
+
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts, executor='thread')
+        self.assertEqual(
+            g.run(process, suffix='-done'), ['first-done', 'second-done'])
+        self.assertEqual(processed, ['first', 'second'])
+
+    def test_thread_executor_error(self):
+        def process(artifact):
+            raise windlass.exc.WindlassPushPullException(
+                'Failed', out=[], errors=['Failed'])
+
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts, executor='thread')
+        self.assertRaises(
+            windlass.exc.WindlassPushPullException, g.run, process)
+        self.assertFalse(g._running)
+
+    def test_injected_executor(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            g = windlass.api.Windlass(
+                artifacts=self.artifacts, executor=executor)
+            self.assertEqual(
+                g.run(lambda a: a.name), ['first', 'second'])
+            # The executor is owned by the caller and is not shutdown
+            self.assertEqual(executor.submit(lambda: 1).result(), 1)
+
+    def test_unknown_executor(self):
+        self.assertRaises(
+            ValueError, windlass.api.Windlass,
+            artifacts=self.artifacts, executor='fibres')
+
+
+class TestAsync(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.artifacts = [
+            windlass.api.Artifact(dict(name='first')),
+            windlass.api.Artifact(dict(name='second', depends_on='first')),
+            windlass.api.Artifact(dict(name='third')),
+        ]
+        self.windlass = windlass.api.Windlass(
+            artifacts=self.artifacts, executor='asyncio')
+
+    def run_loop(self, coro):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        return loop.run_until_complete(coro)
+
+    def test_arun_coroutine(self):
+        processed = []
+
+        async def process(artifact):
+            processed.append(artifact.name)
+            await asyncio.sleep(0)
+            return artifact.name
+
+        self.assertEqual(
+            self.run_loop(self.windlass.arun(process, concurrency=10)),
+            ['first', 'second', 'third'])
+        self.assertLess(processed.index('first'), processed.index('second'))
+
+    def test_arun_concurrency(self):
+        running = 0
+        max_running = 0
+
+        async def process(artifact):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(running, max_running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        self.run_loop(self.windlass.arun(process, concurrency=1))
+        self.assertEqual(max_running, 1)
+
+    def test_blocking_calls_concurrent(self):
+        # More transfers than the pool size wait on the network at once
+        artifacts = [
+            windlass.api.Artifact(dict(name='image-%d' % i))
+            for i in range(8)]
+        g = windlass.api.Windlass(
+            artifacts=artifacts, executor='asyncio', pool_size=2,
+            concurrency=8)
+        barrier = threading.Barrier(8, timeout=5)
+        threads = set()
+
+        def upload(artifact, version=None, **kwargs):
+            threads.add(threading.current_thread())
+            barrier.wait()
+
+        with unittest.mock.patch.object(
+                windlass.api.Artifact, 'upload', autospec=True,
+                side_effect=upload):
+            g.upload(version='1.0.0')
+        self.assertEqual(8, len(threads))
+
+    def test_arun_error(self):
+        async def process(artifact):
+            if artifact.name == 'first':
+                raise windlass.exc.WindlassPushPullException(
+                    'Failed', out=[], errors=['Failed'])
+            await asyncio.sleep(10)
+
+        self.assertRaises(
+            windlass.exc.WindlassPushPullException,
+            self.run_loop, self.windlass.arun(process))
+        self.assertFalse(self.windlass._running)
+
+    def test_run_with_asyncio_executor(self):
+        self.assertEqual(
+            self.windlass.run(lambda a: a.name), ['first', 'second', 'third'])
+
+    def test_upload_with_asyncio_executor(self):
+        uploaded = []
+
+        def upload(artifact, version=None, **kwargs):
+            uploaded.append((artifact.name, version, kwargs))
+
+        with unittest.mock.patch.object(
+                windlass.api.Artifact, 'upload', autospec=True,
+                side_effect=upload):
+            self.windlass.upload(version='1.0.0', generic_url='url')
+        self.assertEqual(
+            sorted(uploaded),
+            [(name, '1.0.0', {'generic_url': 'url'})
+             for name in ('first', 'second', 'third')])
+
+
+class TestFollowups(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.artifacts = [
+            windlass.api.Artifact(dict(name='base')),
+            windlass.api.Artifact(dict(name='app', depends_on='base')),
+        ]
+        self.events = []
+
+    def build(self, artifact, tag):
+        self.events.append(('build', artifact.name, tag))
+        return artifact.name
+
+    def push(self, artifact, tag, registry):
+        self.events.append(('push', artifact.name, tag, registry))
+        return 'pushed'
+
+    def followups(self, artifact):
+        return [
+            windlass.scheduler.Task(
+                artifact, self.push, {'registry': registry}, key=registry)
+            for registry in ('one', 'two')
+        ]
+
+    def check_run(self, executor, parallel=True):
+        g = windlass.api.Windlass(artifacts=self.artifacts, executor=executor)
+        results = g.run(
+            self.build, parallel=parallel, followups=self.followups,
+            tag='latest')
+        self.assertEqual(results, ['base', 'app'])
+        self.assertEqual(len(self.events), 6)
+        for name in ('base', 'app'):
+            build = self.events.index(('build', name, 'latest'))
+            for registry in ('one', 'two'):
+                self.assertGreater(
+                    self.events.index(('push', name, 'latest', registry)),
+                    build)
+        # Dependants only wait for the artifact, not for its pushes
+        self.assertLess(
+            self.events.index(('build', 'base', 'latest')),
+            self.events.index(('build', 'app', 'latest')))
+
+    def test_thread(self):
+        self.check_run('thread')
+
+    def test_serial(self):
+        self.check_run('thread', parallel=False)
+
+    def test_asyncio(self):
+        self.check_run('asyncio')
+
+    def test_task_name(self):
+        task = self.followups(self.artifacts[0])[0]
+        self.assertEqual(task.name, 'base (one)')
+
+
+def artifact_name(artifact):
+    return artifact.name
+
+
+class TestPoolReuse(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.artifacts = [
+            windlass.api.Artifact(dict(name='first')),
+            windlass.api.Artifact(dict(name='second')),
+        ]
+
+    @unittest.mock.patch('multiprocessing.Pool')
+    def test_pool_closed_after_run(self, pool_mock):
+        pool_mock.return_value.apply_async.side_effect = fake_apply_async
+        g = windlass.api.Windlass(artifacts=self.artifacts)
+        g.run(artifact_name)
+        pool_mock.return_value.close.assert_called_once_with()
+        pool_mock.return_value.join.assert_called_once_with()
+
+    @unittest.mock.patch('multiprocessing.Pool')
+    def test_context_manager_reuses_pool(self, pool_mock):
+        pool_mock.return_value.apply_async.side_effect = fake_apply_async
+        with windlass.api.Windlass(artifacts=self.artifacts) as g:
+            g.run(artifact_name)
+            g.run(artifact_name)
+            self.assertEqual(pool_mock.call_count, 1)
+            pool_mock.return_value.close.assert_not_called()
+        pool_mock.return_value.close.assert_called_once_with()
+        pool_mock.return_value.join.assert_called_once_with()
+
+    @unittest.mock.patch('multiprocessing.Pool')
+    def test_context_manager_failed_run(self, pool_mock):
+        pool_mock.return_value.apply_async.side_effect = fake_apply_async
+        error = windlass.exc.WindlassPushPullException(
+            'Failed', out=[], errors=['Failed'])
+        with windlass.api.Windlass(artifacts=self.artifacts) as g:
+            self.assertRaises(
+                windlass.exc.WindlassPushPullException,
+                g.run, unittest.mock.MagicMock(side_effect=error))
+            pool_mock.return_value.terminate.assert_called_once_with()
+            # The terminated pool is replaced for the next run
+            self.assertEqual(g.run(artifact_name), ['first', 'second'])
+            self.assertEqual(pool_mock.call_count, 2)
+
+    def test_forkserver(self):
+        with windlass.api.Windlass(
+                artifacts=self.artifacts, pool_size=2,
+                start_method='forkserver') as g:
+            self.assertEqual(g.run(artifact_name), ['first', 'second'])
+            self.assertEqual(g.run(artifact_name), ['first', 'second'])
+
+    def test_unknown_start_method(self):
+        self.assertRaises(
+            ValueError, windlass.api.Windlass,
+            artifacts=self.artifacts, start_method='teleport')
+
+
+class TestPlan(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.artifacts = [
+            windlass.api.Artifact(dict(name='first', version='1.0')),
+            windlass.api.Artifact(dict(
+                name='second', version='1.0', depends_on='first')),
+            windlass.images.Image(dict(name='some/remote', remote='remote')),
+        ]
+        self.history = windlass.history.History(
+            os.path.join(tempdir, 'history.json'))
+        self.history.record('first', 'build', 10)
+        self.history.record('second', 'build', 30)
+        self.history.record('first', 'push', 5)
+        self.journal_path = os.path.join(tempdir, 'journal.jsonl')
+
+    def followups(self, artifact):
+        return [
+            windlass.scheduler.Task(
+                artifact, lambda a, registry: None, {'registry': registry},
+                key=registry, operation='push')
+            for registry in ('r1', 'r2')]
+
+    def plan(self, **kwargs):
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts, history=self.history, **kwargs)
+        return g.plan('build', followups=self.followups)
+
+    def test_plan(self):
+        plan = self.plan()
+        self.assertEqual(
+            ['first', 'second', 'some/remote'],
+            [entry['name'] for entry in plan['artifacts']])
+        first = plan['artifacts'][0]
+        self.assertEqual(
+            [('build', 'build', None, 10),
+             ('push', 'push', 'r1', 5),
+             ('push', 'push', 'r2', 5)],
+            [(a['operation'], a['action'], a['key'], a['expected_seconds'])
+             for a in first['actions']])
+        self.assertEqual(
+            ['pull', 'push', 'push'],
+            [a['action'] for a in plan['artifacts'][2]['actions']])
+        self.assertEqual(['first'], plan['artifacts'][1]['depends_on'])
+        # some/remote and the pushes of some/remote and second are unknown,
+        # and count as the average of their operation
+        self.assertEqual(5, plan['unknown_durations'])
+        self.assertEqual(10 + 30 + 20 + 5 * 6, plan['total_seconds'])
+        self.assertEqual(10 + 30 + 5, plan['critical_path_seconds'])
+        json.dumps(plan)
+
+    def test_plan_resumed(self):
+        journal = windlass.journal.Journal(self.journal_path)
+        journal.record('first', 'build', '1.0')
+        journal.record('first', 'push', '1.0', key='r1')
+        plan = self.plan(
+            journal=windlass.journal.Journal(self.journal_path, resume=True))
+        self.assertEqual(
+            [('skip-completed', 0), ('skip-completed', 0), ('push', 5)],
+            [(a['action'], a['expected_seconds'])
+             for a in plan['artifacts'][0]['actions']])
+
+    def test_plan_followups_only(self):
+        g = windlass.api.Windlass(artifacts=self.artifacts)
+        plan = g.plan(None, followups=self.followups)
+        self.assertEqual(
+            [['push', 'push']] * 3,
+            [[a['action'] for a in entry['actions']]
+             for entry in plan['artifacts']])
+        self.assertEqual(6, plan['unknown_durations'])
+
+
+class TestKeepGoing(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.artifacts = [
+            windlass.api.Artifact(dict(name='base')),
+            windlass.api.Artifact(dict(name='app', depends_on='base')),
+            windlass.api.Artifact(dict(name='other')),
+            windlass.api.Artifact(dict(name='broken')),
+        ]
+        self.processed = []
+
+    def build(self, artifact):
+        self.processed.append(artifact.name)
+        if artifact.name in ('base', 'broken'):
+            raise windlass.exc.WindlassPushPullException(
+                'failed', out=['output of %s' % artifact.name], errors=[])
+        return artifact.name
+
+    def check_run(self, executor, parallel=True):
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts, executor=executor, keep_going=True)
+        e = self.assertRaises(
+            windlass.exc.MultipleFailuresException,
+            g.run, self.build, parallel=parallel)
+        self.assertEqual(
+            sorted(name for name, _ in e.failures), ['base', 'broken'])
+        self.assertEqual(e.skipped, ['app'])
+        self.assertEqual(
+            sorted(self.processed), ['base', 'broken', 'other'])
+        message = e.debug_message()
+        self.assertIn('output of base', message)
+        self.assertIn('output of broken', message)
+
+    def test_thread(self):
+        self.check_run('thread')
+
+    def test_serial(self):
+        self.check_run('thread', parallel=False)
+
+    def test_asyncio(self):
+        self.check_run('asyncio')
+
+    def test_failed_followups_skipped(self):
+        def followups(artifact):
+            return [windlass.scheduler.Task(artifact, self.build, key='one')]
+
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts[2:], executor='thread', keep_going=True)
+        e = self.assertRaises(
+            windlass.exc.MultipleFailuresException,
+            g.run, self.build, parallel=False, followups=followups)
+        self.assertEqual(e.skipped, ['broken (one)'])
+        self.assertEqual(self.processed, ['other', 'broken', 'other'])
+
+
+class TestRemoteRepos(testtools.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        self.urls = [self.make_repo('repo-%d' % i, 3) for i in range(3)]
+
+    def make_repo(self, name, count):
+        path = os.path.join(self.tempdir, 'org', name)
+        self.commit(git.Repo.init(path), name, count)
+        return 'file://' + path
+
+    def commit(self, repo, name, count):
+        with open(os.path.join(repo.working_dir, 'artifacts.yaml'), 'w') as f:
+            yaml.dump(
+                {'images': [
+                    {'name': 'org/%s-%d' % (name, i), 'context': '.'}
+                    for i in range(count)]},
+                f)
+        repo.index.add(['artifacts.yaml'])
+        actor = git.Actor('windlass', 'windlass@example.com')
+        repo.index.commit('Add artifacts', author=actor, committer=actor)
+
+    def load(self, data, **kwargs):
+        return windlass.api.Artifacts(
+            data, git_cache=windlass.gitcache.GitCache(
+                os.path.join(self.tempdir, 'cache'), **kwargs))
+
+    def make_contexts(self, names):
+        repo = git.Repo.init(os.path.join(self.tempdir, 'org', 'contexts'))
+        for name in names:
+            os.makedirs(os.path.join(repo.working_dir, name))
+            with open(os.path.join(repo.working_dir, name, 'Dockerfile'),
+                      'w') as f:
+                f.write('FROM scratch\n')
+            repo.index.add([os.path.join(name, 'Dockerfile')])
+        with open(os.path.join(repo.working_dir, 'artifacts.yaml'), 'w') as f:
+            yaml.dump(
+                {'images': [
+                    {'name': 'org/%s' % name, 'context': name}
+                    for name in names]},
+                f)
+        repo.index.add(['artifacts.yaml'])
+        actor = git.Actor('windlass', 'windlass@example.com')
+        repo.index.commit('Add contexts', author=actor, committer=actor)
+        return repo.working_dir
+
+    def test_sparse_checkout(self):
+        path = self.make_contexts(['a', 'b', 'c'])
+        artifacts = self.load({'images': [
+            {'name': 'org/a', 'repo': 'file://' + path},
+            {'name': 'org/c', 'repo': 'file://' + path},
+        ]})
+        repopath = artifacts.items[0].metadata['repopath']
+        self.assertTrue(os.path.exists(os.path.join(repopath, 'a')))
+        self.assertFalse(os.path.exists(os.path.join(repopath, 'b')))
+        self.assertTrue(os.path.exists(os.path.join(repopath, 'c')))
+        self.assertEqual(
+            'file://' + path,
+            git.Repo(repopath).remote('origin').url)
+
+    def test_full_checkout(self):
+        path = self.make_contexts(['a', 'b'])
+        artifacts = self.load(
+            {'images': [{'name': 'org/a', 'repo': 'file://' + path}]},
+            partial=False, sparse=False)
+        repopath = artifacts.items[0].metadata['repopath']
+        self.assertTrue(os.path.exists(os.path.join(repopath, 'b')))
+
+    def test_each_repo_loaded_once(self):
+        data = {'images': [
+            {'name': 'org/repo-%d-%d' % (r, i), 'repo': url}
+            for r, url in enumerate(self.urls) for i in range(3)]}
+        data['images'].append({'name': 'org/local', 'context': '.'})
+
+        with unittest.mock.patch.object(
+                windlass.gitcache.GitCache, 'checkout',
+                autospec=True,
+                side_effect=windlass.gitcache.GitCache.checkout) as checkout:
+            artifacts = self.load(data)
+            list(artifacts)
+        self.assertEqual(3, checkout.call_count)
+        self.assertEqual(
+            [a.name for a in artifacts],
+            [entry['name'] for entry in data['images']])
+        for artifact in list(artifacts)[:3]:
+            self.assertEqual(
+                artifact.metadata['repopath'],
+                os.path.join(
+                    artifacts.tempdir, self.tempdir.lstrip('/'),
+                    'org', 'repo-0'))
+
+    def test_lazy_load(self):
+        data = {
+            'images': [
+                {'name': 'org/repo-%d-0' % r, 'repo': url}
+                for r, url in enumerate(self.urls)],
+            'charts': [{'name': 'chart', 'location': 'helm'}],
+        }
+        with unittest.mock.patch.object(
+                windlass.gitcache.GitCache, 'checkout',
+                autospec=True,
+                side_effect=windlass.gitcache.GitCache.checkout) as checkout:
+            artifacts = self.load(data)
+            self.assertEqual(
+                ['chart', 'org/repo-0-0', 'org/repo-1-0', 'org/repo-2-0'],
+                artifacts.names())
+            self.assertEqual(
+                ['chart'],
+                [a.name for a in artifacts.select(
+                    types=[windlass.charts.Chart])])
+            self.assertEqual(0, checkout.call_count)
+
+            selected = artifacts.select(names=['org/repo-1-0'])
+            self.assertEqual(['org/repo-1-0'], [a.name for a in selected])
+            self.assertEqual(1, checkout.call_count)
+            self.assertFalse(artifacts.loaded)
+
+            # Loaded artifacts are kept
+            self.assertIs(selected[0], list(artifacts)[2])
+            self.assertEqual(3, checkout.call_count)
+            self.assertTrue(artifacts.loaded)
+
+    def test_run_one_artifact(self):
+        data = {'images': [
+            {'name': 'org/repo-%d-0' % r, 'repo': url}
+            for r, url in enumerate(self.urls)]}
+        g = windlass.api.Windlass(
+            artifacts=self.load(data), executor='thread')
+        with unittest.mock.patch.object(
+                windlass.gitcache.GitCache, 'checkout',
+                autospec=True,
+                side_effect=windlass.gitcache.GitCache.checkout) as checkout:
+            self.assertEqual(
+                [None, None, 'org/repo-2-0'],
+                g.run(lambda a: a.name, artifact_name='org/repo-2-0'))
+        self.assertEqual(1, checkout.call_count)
+
+    def test_shard_without_checkout(self):
+        data = {'images': [
+            {'name': 'org/repo-%d-0' % r, 'repo': url}
+            for r, url in enumerate(self.urls)]}
+        g = windlass.api.Windlass(artifacts=self.load(data))
+        with unittest.mock.patch.object(
+                windlass.gitcache.GitCache, 'checkout') as checkout:
+            g.shard(2, 3)
+            self.assertEqual(['org/repo-1-0'], g.artifacts.names())
+        checkout.assert_not_called()
+
+    def test_missing_artifact(self):
+        data = {'images': [{'name': 'org/missing', 'repo': self.urls[0]}]}
+        e = self.assertRaises(Exception, list, self.load(data))
+        self.assertIn('Failed to find org/missing', str(e))
+
+    def test_mirror_fetched_incrementally(self):
+        data = {'images': [{'name': 'org/repo-0-3', 'repo': self.urls[0]}]}
+        self.assertRaises(Exception, list, self.load(data))
+
+        self.commit(
+            git.Repo(os.path.join(self.tempdir, 'org', 'repo-0')),
+            'repo-0', 4)
+        with unittest.mock.patch('git.Repo.clone_from',
+                                 side_effect=git.Repo.clone_from) as clone:
+            artifacts = list(self.load(data))
+        self.assertEqual(['org/repo-0-3'], [a.name for a in artifacts])
+        # Only the checkout was cloned, the mirror was fetched
+        self.assertEqual(1, clone.call_count)
+        self.assertTrue(clone.call_args[0][0].startswith(
+            'file://' + os.path.join(self.tempdir, 'cache')))
+
+    def test_branch(self):
+        repo = git.Repo(os.path.join(self.tempdir, 'org', 'repo-1'))
+        repo.git.checkout('-b', 'stable')
+        self.commit(repo, 'stable', 1)
+        data = {'images': [
+            {'name': 'org/stable-0', 'repo': self.urls[1],
+             'branch': 'stable'},
+            {'name': 'org/repo-1-0', 'repo': self.urls[1]},
+        ]}
+        repo.git.checkout('-')
+        artifacts = list(self.load(data))
+        self.assertEqual(
+            ['org/stable-0', 'org/repo-1-0'], [a.name for a in artifacts])
+        self.assertNotEqual(
+            artifacts[0].metadata['repopath'],
+            artifacts[1].metadata['repopath'])
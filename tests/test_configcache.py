@@ -0,0 +1,139 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import fixtures
+import os
+import testtools
+import unittest.mock
+import yaml
+
+import windlass.api
+import windlass.configcache
+import windlass.tools
+
+
+class TestConfigCache(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'config')
+        self.cache = windlass.configcache.ConfigCache(self.path)
+
+    def test_key(self):
+        key = self.cache.key(['a: 1', b'b: 2'])
+        self.assertEqual(key, self.cache.key(['a: 1', 'b: 2']))
+        self.assertNotEqual(key, self.cache.key(['a: 1b: 2']))
+        self.assertNotEqual(key, self.cache.key(['b: 2', 'a: 1']))
+
+    def test_load(self):
+        parse = unittest.mock.Mock(return_value={'images': [{'name': 'a'}]})
+        self.assertEqual(
+            {'images': [{'name': 'a'}]}, self.cache.load(['x'], parse))
+        self.assertEqual(
+            {'images': [{'name': 'a'}]}, self.cache.load(['x'], parse))
+        self.assertEqual(1, parse.call_count)
+        self.assertEqual(0o700, os.stat(self.path).st_mode & 0o777)
+
+    def test_unreadable_entry(self):
+        key = self.cache.key(['x'])
+        os.makedirs(self.path)
+        with open(os.path.join(self.path, key + '.pickle'), 'wb') as f:
+            f.write(b'not a pickle')
+        self.assertEqual({'a': 1}, self.cache.load(['x'], lambda: {'a': 1}))
+        self.assertEqual({'a': 1}, self.cache.get(key))
+
+
+class TestLoadConfig(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        self.cache = windlass.configcache.ConfigCache(
+            os.path.join(self.tempdir, 'config'))
+        self.products = []
+        for name, data in [
+                ('first', {'images': [{'name': 'a'}],
+                           'settings': {'x': 1, 'y': 1}}),
+                ('second', {'images': [{'name': 'b'}],
+                            'settings': {'y': 2}})]:
+            path = os.path.join(self.tempdir, name + '.yaml')
+            with open(path, 'w') as f:
+                yaml.dump(data, f)
+            self.products.append(path)
+
+    def load(self):
+        return windlass.api.Windlass(
+            self.products, config_cache=self.cache)
+
+    def test_deep_merge(self):
+        self.assertEqual(
+            {'images': [{'name': 'a'}, {'name': 'b'}],
+             'settings': {'x': 1, 'y': 2}},
+            windlass.tools.deep_merge(
+                {'images': [{'name': 'a'}], 'settings': {'x': 1, 'y': 1}},
+                {'images': [{'name': 'b'}], 'settings': {'y': 2}}))
+
+    def test_deep_merge_overrides_by_name(self):
+        self.assertEqual(
+            {'images': [{'name': 'a', 'context': 'new'}, {'name': 'b'}]},
+            windlass.tools.deep_merge(
+                {'images': [{'name': 'a', 'context': 'old'}]},
+                {'images': [{'name': 'a', 'context': 'new'},
+                            {'name': 'b'}]}))
+
+    def test_products_override(self):
+        path = os.path.join(self.tempdir, 'override.yaml')
+        with open(path, 'w') as f:
+            yaml.dump({'images': [{'name': 'a', 'context': 'override'}]}, f)
+        g = windlass.api.Windlass(self.products + [path])
+        self.assertEqual(['a', 'b'], g.artifacts.names())
+        self.assertEqual(
+            'override', g.artifacts.select(names=['a'])[0].data['context'])
+
+    def test_products_merged(self):
+        g = self.load()
+        self.assertEqual(['a', 'b'], g.artifacts.names())
+        self.assertEqual(self.products, g.configs)
+
+    def test_cached(self):
+        self.load()
+        with unittest.mock.patch('yaml.load') as load:
+            g = self.load()
+        load.assert_not_called()
+        self.assertEqual(['a', 'b'], g.artifacts.names())
+
+        # A change to a product is parsed again
+        with open(self.products[1], 'a') as f:
+            f.write('charts: [{name: c}]\n')
+        g = self.load()
+        self.assertEqual(['c', 'a', 'b'], g.artifacts.names())
+
+    def test_auto_config_cached(self):
+        repo = os.path.join(self.tempdir, 'org', 'repo')
+        os.makedirs(os.path.join(repo, '.git'))
+        for name in ('config', 'HEAD'):
+            with open(os.path.join(repo, '.git', name), 'w') as f:
+                f.write(name)
+        self.useFixture(fixtures.MonkeyPatch('os.getcwd', lambda: repo))
+        with unittest.mock.patch(
+                'windlass.api._read_auto_config',
+                return_value={'images': [{'name': 'org/repo'}]}) as read:
+            for _ in range(2):
+                g = windlass.api.Windlass([], config_cache=self.cache)
+                self.assertEqual(['org/repo'], g.artifacts.names())
+                self.assertEqual(['<auto config>'], g.configs)
+        self.assertEqual(1, read.call_count)
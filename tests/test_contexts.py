@@ -0,0 +1,118 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import fixtures
+import os
+import tarfile
+import testtools
+import unittest.mock
+
+import windlass.contexts
+
+DOCKERFILE = '''\
+FROM golang AS build
+COPY --chown=1000 go.mod go.sum /src/
+COPY ["cmd", "/src/cmd"]
+COPY --from=build /go/bin/app /app
+ADD https://example.com/file.tgz /tmp/
+ADD static/*.html /srv/
+RUN --mount=type=cache,target=/root/.cache go build ./...
+'''
+
+
+class TestCopySources(testtools.TestCase):
+
+    def test_sources(self):
+        self.assertEqual(
+            ['go.mod', 'go.sum', 'cmd', 'static/*.html'],
+            windlass.contexts.copy_sources(DOCKERFILE))
+
+    def test_unknown(self):
+        self.assertIsNone(windlass.contexts.copy_sources(
+            'ARG DIR\nFROM alpine\nCOPY $DIR /src\n'))
+        self.assertIsNone(windlass.contexts.copy_sources(
+            'FROM alpine\nRUN --mount=target=/src make\n'))
+
+    def test_narrow(self):
+        names = ['cmd', 'cmd/main.go', 'docs/big.pdf', 'go.mod',
+                 'static/index.html', 'static/logo.png']
+        self.assertEqual(
+            ['cmd', 'cmd/main.go', 'go.mod', 'static/index.html'],
+            windlass.contexts.narrow(
+                names, ['./go.mod', '/cmd/', 'static/*.html']))
+        self.assertEqual(
+            names, windlass.contexts.narrow(names, ['go.mod', '.']))
+
+
+class TestBuildContext(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tempdir = self.useFixture(fixtures.TempDir()).path
+        self.path = os.path.join(tempdir, 'context')
+        self.cache = windlass.contexts.ContextCache(
+            os.path.join(tempdir, 'cache'))
+        self.write('Dockerfile', DOCKERFILE)
+        self.write('.dockerignore', 'cmd/*.log\n')
+        self.write('go.mod', 'module app\n')
+        self.write('cmd/main.go', 'package main\n')
+        self.write('cmd/build.log', 'ignored\n')
+        self.write('docs/big.pdf', 'unused\n')
+
+    def write(self, name, content):
+        path = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def members(self, fileobj):
+        with fileobj, tarfile.open(fileobj=fileobj) as tar:
+            return tar.getnames()
+
+    def test_context(self):
+        self.assertEqual(
+            ['.dockerignore', 'Dockerfile', 'cmd', 'cmd/main.go', 'docs',
+             'docs/big.pdf', 'go.mod'],
+            self.members(windlass.contexts.build_context(self.path)))
+
+    def test_narrowed(self):
+        self.assertEqual(
+            ['.dockerignore', 'Dockerfile', 'cmd', 'cmd/main.go', 'go.mod'],
+            self.members(windlass.contexts.build_context(
+                self.path, narrowed=True)))
+
+    def test_cached(self):
+        first = self.members(windlass.contexts.build_context(
+            self.path, cache=self.cache))
+        with unittest.mock.patch(
+                'windlass.contexts.write_context') as write_context:
+            self.assertEqual(first, self.members(
+                windlass.contexts.build_context(self.path, cache=self.cache)))
+        write_context.assert_not_called()
+
+        # A changed file is a different tarball
+        self.write('docs/new.pdf', 'new\n')
+        self.assertIn('docs/new.pdf', self.members(
+            windlass.contexts.build_context(self.path, cache=self.cache)))
+        self.assertEqual(2, len(os.listdir(self.cache.path)))
+
+    def test_prune(self):
+        self.cache.max_bytes = 1
+        for name in ('a', 'b'):
+            self.write(name, name)
+            windlass.contexts.build_context(
+                self.path, cache=self.cache).close()
+        self.assertEqual([], os.listdir(self.cache.path))
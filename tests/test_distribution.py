@@ -0,0 +1,93 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import testtools
+import unittest.mock
+
+import windlass.distribution
+
+MANIFEST = {'config': {'digest': 'sha256:config'}}
+CONFIG = {'config': {'Labels': {'a': 'b'}}}
+
+
+def response(status_code=200, data=None, headers=None):
+    resp = unittest.mock.Mock(status_code=status_code, headers=headers or {})
+    resp.json.return_value = data
+    return resp
+
+
+class TestRegistryClient(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = windlass.distribution.RegistryClient(
+            'registry.example.com', 'user', 'secret')
+        self.client._session = self.session = unittest.mock.Mock()
+
+    def test_basic_auth(self):
+        self.session.request.side_effect = [
+            response(data=MANIFEST), response(data=CONFIG)]
+        self.assertEqual(
+            {'a': 'b'}, self.client.image_labels('org/image', '1.0'))
+        urls = [c[0][1] for c in self.session.request.call_args_list]
+        self.assertEqual([
+            'https://registry.example.com/v2/org/image/manifests/1.0',
+            'https://registry.example.com/v2/org/image/blobs/sha256:config',
+        ], urls)
+        for c in self.session.request.call_args_list:
+            self.assertEqual(('user', 'secret'), c[1]['auth'])
+
+    def test_bearer_token(self):
+        challenge = ('Bearer realm="https://auth.example.com/token",'
+                     'service="registry"')
+        self.session.request.side_effect = [
+            response(401, headers={'WWW-Authenticate': challenge}),
+            response(data=MANIFEST), response(data=CONFIG)]
+        self.session.get.return_value = response(data={'token': 'tok'})
+        self.assertEqual(
+            {'a': 'b'}, self.client.image_labels('org/image', '1.0'))
+        self.session.get.assert_called_once_with(
+            'https://auth.example.com/token',
+            params={'service': 'registry',
+                    'scope': 'repository:org/image:pull'},
+            auth=('user', 'secret'), timeout=30)
+        # The token is reused for the config
+        self.assertEqual(1, self.session.get.call_count)
+        self.assertEqual(
+            'Bearer tok',
+            self.session.request.call_args[1]['headers']['Authorization'])
+
+    def test_missing(self):
+        self.session.request.return_value = response(404)
+        self.assertIsNone(self.client.image_labels('org/image', '1.0'))
+        self.assertIsNone(self.client.manifest_digest('org/image', '1.0'))
+
+    def test_manifest_digest(self):
+        self.session.request.return_value = response(
+            headers={'Docker-Content-Digest': 'sha256:abc'})
+        self.assertEqual(
+            'sha256:abc', self.client.manifest_digest('org/image', '1.0'))
+        self.assertEqual('HEAD', self.session.request.call_args[0][0])
+
+    def test_insecure(self):
+        self.assertEqual(
+            'http://127.0.0.1:5000/v2/image/manifests/1.0',
+            windlass.distribution.RegistryClient('127.0.0.1:5000').url(
+                'image/manifests/1.0'))
+
+    def test_verify(self):
+        client = windlass.distribution.RegistryClient('registry.example.com')
+        self.assertEqual('/etc/ssl/certs', client.session.verify)
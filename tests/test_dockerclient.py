@@ -0,0 +1,72 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import concurrent.futures
+import fixtures
+import os
+import testtools
+import unittest.mock
+
+import windlass.api
+import windlass.dockerclient
+
+
+class TestDockerClient(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        windlass.dockerclient.close()
+        self.addCleanup(windlass.dockerclient.close)
+        self.useFixture(
+            fixtures.MonkeyPatch('windlass.dockerclient._version', None))
+        patcher = unittest.mock.patch('docker.from_env')
+        self.from_env = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.from_env.side_effect = lambda **kwargs: unittest.mock.Mock(
+            **{'api.api_version': '1.39'})
+
+    def test_reused(self):
+        client = windlass.dockerclient.client()
+        self.assertIs(client, windlass.dockerclient.client())
+        self.from_env.assert_called_once_with(version='auto', timeout=180)
+
+    def test_per_thread(self):
+        client = windlass.dockerclient.client()
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            other = executor.submit(windlass.dockerclient.client).result()
+        self.assertIsNot(client, other)
+        # The negotiated version is reused
+        self.from_env.assert_called_with(version='1.39', timeout=180)
+
+    def test_forked(self):
+        client = windlass.dockerclient.client()
+        with unittest.mock.patch('os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(client, windlass.dockerclient.client())
+            windlass.dockerclient.close()
+        # Only the clients of the process closing them are closed
+        client.close.assert_not_called()
+
+    def test_close(self):
+        client = windlass.dockerclient.client()
+        windlass.dockerclient.close()
+        client.close.assert_called_once_with()
+        self.assertIsNot(client, windlass.dockerclient.client())
+
+    def test_closed_by_run(self):
+        g = windlass.api.Windlass(artifacts=[])
+        client = windlass.dockerclient.client()
+        g.run(lambda artifact: None, parallel=False)
+        client.close.assert_called_once_with()
@@ -0,0 +1,99 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import fixtures
+import os
+import testtools
+
+import windlass.fingerprint
+
+
+class TestBaseImages(testtools.TestCase):
+
+    def test_stages(self):
+        self.assertEqual(
+            ['golang:1.12', 'alpine:3.9'],
+            windlass.fingerprint.base_images('''\
+# syntax comment
+FROM golang:1.12 AS build
+RUN go build \\
+    ./...
+FROM --platform=linux/amd64 alpine:3.9
+COPY --from=build /go/bin/app /app
+from build as test
+FROM scratch
+'''))
+
+    def test_args(self):
+        dockerfile = '''\
+ARG BASE=alpine
+ARG VERSION
+FROM ${BASE}:$VERSION
+ARG BASE=ignored
+'''
+        self.assertIsNone(windlass.fingerprint.base_images(dockerfile))
+        self.assertEqual(
+            ['alpine:3.9'],
+            windlass.fingerprint.base_images(dockerfile, {'VERSION': '3.9'}))
+        self.assertEqual(
+            ['debian:9'],
+            windlass.fingerprint.base_images(
+                'FROM ${BASE:-debian}:9', {}))
+
+
+class TestFingerprint(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.useFixture(fixtures.TempDir()).path
+        self.write('Dockerfile', 'FROM alpine\nCOPY . /src\n')
+        self.write('src/app.py', 'print(1)\n')
+        self.write('.dockerignore', '# comment\n*.log\n')
+
+    def write(self, name, content):
+        path = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def fingerprint(self, **kwargs):
+        kwargs.setdefault('base_digests', ['sha256:1'])
+        return windlass.fingerprint.fingerprint(self.path, **kwargs)
+
+    def test_context_files(self):
+        self.write('build.log', 'ignored')
+        self.assertEqual(
+            ['.dockerignore', 'Dockerfile', 'src/app.py'],
+            windlass.fingerprint.context_files(self.path))
+
+    def test_unchanged(self):
+        fingerprint = self.fingerprint()
+        self.assertEqual(fingerprint, self.fingerprint())
+        # Ignored files are not sent to docker
+        self.write('build.log', 'ignored')
+        self.assertEqual(fingerprint, self.fingerprint())
+
+    def test_changes(self):
+        fingerprint = self.fingerprint()
+        self.assertNotEqual(
+            fingerprint, self.fingerprint(buildargs={'http_proxy': 'x'}))
+        self.assertNotEqual(
+            fingerprint, self.fingerprint(base_digests=['sha256:2']))
+        os.chmod(os.path.join(self.path, 'src/app.py'), 0o755)
+        executable = self.fingerprint()
+        self.assertNotEqual(fingerprint, executable)
+        self.write('src/app.py', 'print(2)\n')
+        self.assertNotEqual(executable, self.fingerprint())
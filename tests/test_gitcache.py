@@ -0,0 +1,105 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import fixtures
+import git
+import os
+import testtools
+
+import windlass.gitcache
+
+AUTHOR = git.Actor('windlass', 'windlass@example.com')
+
+
+class TestGitCache(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        upstream = os.path.join(self.tempdir, 'upstream')
+        self.upstream = git.Repo.init(upstream)
+        with self.upstream.config_writer() as config:
+            config.set_value('uploadpack', 'allowFilter', 'true')
+        self.url = 'file://' + upstream
+        self.commit({
+            'README': 'top',
+            'context/Dockerfile': 'FROM alpine',
+            'other/file': 'other',
+        })
+        self.cachedir = os.path.join(self.tempdir, 'cache')
+
+    def commit(self, files):
+        for name, content in files.items():
+            path = os.path.join(self.upstream.working_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        self.upstream.index.add(list(files))
+        self.upstream.index.commit(
+            'update', author=AUTHOR, committer=AUTHOR)
+
+    def checkout(self, cache, name='checkout'):
+        destpath = os.path.join(self.tempdir, name)
+        cache.checkout(self.url, destpath)
+        return destpath
+
+    def missing(self, cache, path):
+        """Return the files of path the mirror has no contents of"""
+        mirror = git.Repo(cache.mirror_path(self.url))
+        tree = mirror.git.rev_parse('HEAD:' + path)
+        return [
+            line for line in mirror.git.rev_list(
+                '--objects', '--missing=print', tree).splitlines()
+            if line.startswith('?')]
+
+    def test_partial_sparse(self):
+        cache = windlass.gitcache.GitCache(self.cachedir)
+        destpath = self.checkout(cache)
+        self.assertEqual(['.git', 'README'], sorted(os.listdir(destpath)))
+
+        cache.add_paths(destpath, ['context'])
+        self.assertTrue(
+            os.path.exists(os.path.join(destpath, 'context', 'Dockerfile')))
+        self.assertFalse(os.path.exists(os.path.join(destpath, 'other')))
+        # The files checked out are in the mirror for later checkouts
+        self.assertEqual([], self.missing(cache, 'context'))
+        self.assertEqual(1, len(self.missing(cache, 'other')))
+
+        cache.add_paths(destpath, None)
+        self.assertTrue(
+            os.path.exists(os.path.join(destpath, 'other', 'file')))
+        self.assertEqual([], self.missing(cache, 'other'))
+
+    def test_update(self):
+        cache = windlass.gitcache.GitCache(self.cachedir)
+        self.checkout(cache, 'first')
+        self.commit({'context/new': 'new'})
+        destpath = self.checkout(cache, 'second')
+        cache.add_paths(destpath, ['context'])
+        self.assertTrue(
+            os.path.exists(os.path.join(destpath, 'context', 'new')))
+
+    def test_full(self):
+        cache = windlass.gitcache.GitCache(
+            self.cachedir, partial=False, sparse=False)
+        destpath = self.checkout(cache)
+        self.assertEqual(
+            ['.git', 'README', 'context', 'other'],
+            sorted(os.listdir(destpath)))
+        # Sharing the objects of the mirror
+        self.assertTrue(os.path.exists(os.path.join(
+            destpath, '.git', 'objects', 'info', 'alternates')))
+        self.assertEqual([], self.missing(cache, 'other'))
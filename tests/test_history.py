@@ -0,0 +1,154 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import fixtures
+import os
+import testtools
+
+import windlass.api
+import windlass.history
+import windlass.scheduler
+
+from tests.utils import make_artifact
+
+
+def artifact_name(artifact):
+    return artifact.name
+
+
+class TestHistory(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'cache', 'history.json')
+
+    def test_missing_file(self):
+        history = windlass.history.History(self.path)
+        self.assertIsNone(history.expected('a', 'build'))
+        self.assertIsNone(history.average('build'))
+
+    def test_unreadable_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('not json')
+        history = windlass.history.History(self.path)
+        self.assertIsNone(history.expected('a', 'build'))
+
+    def test_record_and_save(self):
+        history = windlass.history.History(self.path)
+        history.record('a', 'build', 10)
+        history.record('a', 'build', 20)
+        history.record('b', 'build', 2)
+        self.assertEqual(history.expected('a', 'build'), 15)
+        self.assertEqual(history.average('build'), 8.5)
+        self.assertIsNone(history.expected('a', 'push'))
+        history.save()
+
+        history = windlass.history.History(self.path)
+        self.assertEqual(history.expected('a', 'build'), 15)
+        self.assertEqual(history.expected('b', 'build'), 2)
+
+    def test_save_keeps_other_runs(self):
+        first = windlass.history.History(self.path)
+        second = windlass.history.History(self.path)
+        first.record('a', 'build', 10)
+        first.save()
+        second.record('b', 'build', 5)
+        second.save()
+
+        history = windlass.history.History(self.path)
+        self.assertEqual(history.expected('a', 'build'), 10)
+        self.assertEqual(history.expected('b', 'build'), 5)
+
+
+class TestPrioritise(testtools.TestCase):
+
+    def test_longest_first(self):
+        artifacts = [make_artifact(name) for name in 'abc']
+        costs = {'a': 1, 'b': 10, 'c': 5}
+        graph = windlass.scheduler.DependencyGraph.from_artifacts(artifacts)
+        graph.prioritise(lambda node: costs[node.name])
+        self.assertEqual(
+            [a.name for a in graph.ready()], ['b', 'c', 'a'])
+
+    def test_ties_keep_order(self):
+        artifacts = [make_artifact(name) for name in 'abc']
+        graph = windlass.scheduler.DependencyGraph.from_artifacts(artifacts)
+        graph.prioritise(lambda node: 1)
+        self.assertEqual(graph.ready(), artifacts)
+
+    def test_critical_path_first(self):
+        # a is quick but the long d depends on it, so it starts before b.
+        a = make_artifact('a')
+        b = make_artifact('b')
+        c = make_artifact('c')
+        d = make_artifact('d', depends_on=['a'])
+        costs = {'a': 1, 'b': 5, 'c': 2, 'd': 10}
+        graph = windlass.scheduler.DependencyGraph.from_artifacts(
+            [b, c, a, d])
+        graph.prioritise(lambda node: costs[node.name])
+        self.assertEqual(graph.ready(), [a, b, c])
+        graph.done(a)
+        self.assertEqual(graph.ready(), [d])
+
+
+class TestRunHistory(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'history.json')
+
+    def test_durations_recorded(self):
+        artifacts = [make_artifact('a'), make_artifact('b')]
+        g = windlass.api.Windlass(
+            artifacts=artifacts, executor='thread', history=self.path)
+        g.run(
+            artifact_name,
+            followups=lambda artifact: [windlass.scheduler.Task(
+                artifact, artifact_name, operation='push')])
+
+        history = windlass.history.History(self.path)
+        for name in ('a', 'b'):
+            self.assertIsNotNone(history.expected(name, 'artifact_name'))
+            self.assertIsNotNone(history.expected(name, 'push'))
+
+    def test_lpt_order(self):
+        history = windlass.history.History(self.path)
+        history.record('a', 'build', 1)
+        history.record('b', 'build', 10)
+        artifacts = [make_artifact('a'), make_artifact('b'),
+                     make_artifact('c')]
+        processed = []
+
+        def process(artifact):
+            processed.append(artifact.name)
+
+        g = windlass.api.Windlass(artifacts=artifacts, history=history)
+        g.run(process, parallel=False, operation='build')
+        # c is unknown so expected to take the average
+        self.assertEqual(processed, ['b', 'c', 'a'])
+
+        processed[:] = []
+        g = windlass.api.Windlass(
+            artifacts=artifacts, history=history, schedule='fifo')
+        g.run(process, parallel=False, operation='build')
+        self.assertEqual(processed, ['a', 'b', 'c'])
+
+    def test_unknown_schedule(self):
+        self.assertRaises(
+            ValueError, windlass.api.Windlass, artifacts=[], schedule='sjf')
@@ -14,12 +14,17 @@
 # under the License.
 #
 
+import fixtures
+import io
+import os
 import tarfile
 import tempfile
+import unittest.mock
 
 import docker
 import testtools
 
+import windlass.fingerprint
 import windlass.images
 
 
@@ -75,3 +80,244 @@ class TestImageAPI(testtools.TestCase):
                 members = [m.name for m in tf.getmembers()]
             self.assertThat(
                 members, testtools.matchers.Contains('manifest.json'))
+
+
+class TestFingerprintedImage(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = unittest.mock.patch('windlass.dockerclient.client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.client.api.pull.return_value = []
+        self.connector = unittest.mock.Mock(auth_config=None)
+        self.connector.remote_path.side_effect = \
+            lambda name: 'registry/' + name
+        self.remotes = [(self.connector, 'org/image', '1.0')]
+
+    def test_local(self):
+        image = unittest.mock.Mock()
+        self.client.images.list.return_value = [image]
+        self.assertIs(image, windlass.images.find_fingerprinted_image(
+            'org/image:latest', 'abc', self.remotes))
+        self.client.images.list.assert_called_once_with(
+            filters={'label': windlass.fingerprint.LABEL + '=abc'})
+        image.tag.assert_called_once_with('org/image', 'latest')
+        self.connector.image_labels.assert_not_called()
+
+    def test_remote(self):
+        self.client.images.list.return_value = []
+        self.connector.image_labels.return_value = {
+            windlass.fingerprint.LABEL: 'abc'}
+        image = windlass.images.find_fingerprinted_image(
+            'org/image:latest', 'abc', self.remotes)
+        self.connector.image_labels.assert_called_once_with(
+            'org/image', '1.0')
+        self.client.api.pull.assert_called_once_with(
+            'registry/org/image', '1.0', stream=True, auth_config=None)
+        self.client.images.get.assert_called_once_with(
+            'registry/org/image:1.0')
+        self.assertIs(self.client.images.get.return_value, image)
+        image.tag.assert_called_once_with('org/image', 'latest')
+
+    def test_not_found(self):
+        self.client.images.list.return_value = []
+        self.connector.image_labels.return_value = {
+            windlass.fingerprint.LABEL: 'other'}
+        self.assertIsNone(windlass.images.find_fingerprinted_image(
+            'org/image:latest', 'abc', self.remotes))
+        self.connector.image_labels.side_effect = Exception('unreachable')
+        self.assertIsNone(windlass.images.find_fingerprinted_image(
+            'org/image:latest', 'abc', self.remotes))
+        self.client.api.pull.assert_not_called()
+
+
+class TestPlanImage(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = unittest.mock.patch('windlass.dockerclient.client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.connector = unittest.mock.Mock(auth_config=None)
+        self.connector.remote_path.side_effect = \
+            lambda name: 'registry/' + name
+        self.registry = unittest.mock.Mock(connector=self.connector)
+        self.image = windlass.images.Image(dict(
+            name='org/image:latest', context='context'))
+        self.image.metadata['repopath'] = '/repo'
+
+    def test_up_to_date(self):
+        self.useFixture(fixtures.MockPatch(
+            'windlass.images.image_fingerprint', return_value='abc'))
+        self.client.images.list.return_value = []
+        self.connector.image_labels.return_value = {
+            windlass.fingerprint.LABEL: 'abc'}
+        self.assertEqual(
+            {'action': 'skip-up-to-date', 'bytes': 0},
+            self.image.plan(
+                'build', version='1.0',
+                docker_image_registries=[self.registry]))
+        self.connector.image_labels.assert_called_once_with(
+            'org/image', '1.0')
+        # Nothing is pulled or tagged
+        self.client.api.pull.assert_not_called()
+
+        self.assertEqual('build', self.image.plan(
+            'build', docker_image_registries=[self.registry],
+            skip_unchanged=False)['action'])
+        self.connector.image_labels.return_value = {}
+        self.assertEqual('build', self.image.plan(
+            'build', docker_image_registries=[self.registry])['action'])
+
+    def test_already_present(self):
+        local = self.client.images.get.return_value
+        local.attrs = {'Size': 1024}
+        self.connector.is_uploaded.return_value = True
+        self.assertEqual(
+            {'action': 'skip-already-present', 'bytes': 0},
+            self.image.plan(
+                'push', version='1.0', docker_image_registry=self.registry))
+        self.connector.is_uploaded.assert_called_once_with(
+            self.client, 'org/image:latest', 'registry/org/image', '1.0')
+
+        self.connector.is_uploaded.return_value = False
+        self.assertEqual(
+            {'action': 'push', 'bytes': 1024},
+            self.image.plan('push', docker_image_registry=self.registry))
+
+        # Not built yet
+        self.client.images.get.side_effect = Exception('not found')
+        self.assertEqual(
+            {'action': 'push', 'bytes': None},
+            self.image.plan('push', docker_image_registry=self.registry))
+
+
+class TestSourcePaths(testtools.TestCase):
+
+    def source_paths(self, **data):
+        data.setdefault('name', 'org/image')
+        return windlass.images.Image(data).source_paths()
+
+    def test_source_paths(self):
+        self.assertEqual(['image'], self.source_paths(context='image'))
+        self.assertEqual(['image'], self.source_paths(
+            context='image', dockerfile='docker/Dockerfile'))
+        self.assertEqual(['image', 'dockerfiles'], self.source_paths(
+            context='image', dockerfile='../dockerfiles/Dockerfile.image'))
+        self.assertEqual(['image/src', 'image'], self.source_paths(
+            context='image/src', dockerfile='../Dockerfile'))
+        self.assertEqual(['image'], self.source_paths(
+            context='image', dockerfile='../Dockerfile'))
+        self.assertIsNone(self.source_paths(
+            context='image', dockerfile='../../Dockerfile'))
+        self.assertIsNone(self.source_paths())
+        self.assertEqual([], self.source_paths(remote='org/image'))
+
+
+class TestBuildKit(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = unittest.mock.patch('windlass.dockerclient.client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        patcher = unittest.mock.patch('subprocess.Popen')
+        self.popen = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.popen.return_value.stdout = io.StringIO('#1 building\n#1 DONE\n')
+        self.popen.return_value.wait.return_value = 0
+        self.useFixture(fixtures.EnvironmentVariable(
+            'WINDLASS_BUILDARG_TOKEN', 'secret'))
+
+    def test_build(self):
+        image = windlass.images.build_buildkit(
+            'org/image:latest', '/src/image', labels={'a': 'b'},
+            cache_from=['type=registry,ref=cache'])
+        self.assertIs(self.client.images.get.return_value, image)
+        cmd = self.popen.call_args[0][0]
+        self.assertEqual(
+            ['docker', 'buildx', 'build', '--load', '--progress', 'plain',
+             '--tag', 'org/image:latest', '--file', '/src/image/Dockerfile'],
+            cmd[:10])
+        self.assertIn('TOKEN', cmd)
+        self.assertNotIn('secret', ' '.join(cmd))
+        self.assertEqual('secret', self.popen.call_args[1]['env']['TOKEN'])
+        self.assertEqual(
+            ['--label', 'a=b', '--pull',
+             '--cache-from', 'type=registry,ref=cache', '/src/image'],
+            cmd[-6:])
+
+    def test_failed(self):
+        self.popen.return_value.wait.return_value = 1
+        e = self.assertRaises(
+            windlass.exc.WindlassBuildException,
+            windlass.images.build_buildkit, 'org/image', '/src/image')
+        self.assertEqual(['#1 building', '#1 DONE'], e.out)
+
+    def test_cache_option(self):
+        self.assertEqual(
+            'type=registry,ref=registry/org/image:cache',
+            windlass.images.cache_option('registry/org/image:cache', '/r'))
+        self.assertEqual(
+            'type=registry,ref=registry/org/image:cache,mode=max',
+            windlass.images.cache_option(
+                'registry/org/image:cache', '/r', export=True))
+        self.assertEqual(
+            'type=local,src=/r/./cache',
+            windlass.images.cache_option('./cache', '/r'))
+        self.assertEqual(
+            'type=local,dest=/cache,mode=max',
+            windlass.images.cache_option('/cache', '/r', export=True))
+        self.assertEqual(
+            'type=gha', windlass.images.cache_option('type=gha', '/r'))
+
+    def test_image_settings(self):
+        im = windlass.images.Image(dict(
+            name='org/image', context='image',
+            cache_from='registry/org/image:cache'))
+        im.metadata['repopath'] = '/r'
+        with unittest.mock.patch(
+                'windlass.images.build_image_from_local_repo') as build:
+            im.build()
+        kwargs = build.call_args[1]
+        self.assertTrue(kwargs['buildkit'])
+        self.assertEqual(
+            ['type=registry,ref=registry/org/image:cache'],
+            kwargs['cache_from'])
+        self.assertEqual([], kwargs['cache_to'])
+
+
+class TestBuildVerbosly(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = unittest.mock.patch('windlass.dockerclient.client')
+        self.client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.path = self.useFixture(fixtures.TempDir()).path
+        for name in ('Dockerfile', 'app.py', 'unused.pdf'):
+            with open(os.path.join(self.path, name), 'w') as f:
+                f.write('COPY app.py /\n' if name == 'Dockerfile' else name)
+
+    def build(self, **kwargs):
+        members = []
+
+        def build(fileobj, **kwargs):
+            with tarfile.open(fileobj=fileobj) as tar:
+                members.extend(tar.getnames())
+            return [b'{"stream": "Successfully built"}\r\n']
+
+        self.client.api.build.side_effect = build
+        windlass.images.build_verbosly('org/image', self.path, **kwargs)
+        self.assertTrue(
+            self.client.api.build.call_args[1]['custom_context'])
+        return members
+
+    def test_context(self):
+        self.assertEqual(
+            ['Dockerfile', 'app.py', 'unused.pdf'], self.build())
+
+    def test_narrowed_context(self):
+        self.assertEqual(
+            ['Dockerfile', 'app.py'], self.build(narrow_context=True))
@@ -0,0 +1,203 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import fixtures
+import os
+import testtools
+
+import windlass.api
+import windlass.fingerprint
+import windlass.journal
+import windlass.scheduler
+import windlass.windlass
+
+from tests.utils import make_artifact
+
+
+class TestJournal(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'journal.jsonl')
+
+    def test_record_and_resume(self):
+        journal = windlass.journal.Journal(self.path)
+        journal.record('a', 'build', '1.0', digest='sha256:abc')
+        journal.record('a', 'push', '1.0', key='registry')
+
+        journal = windlass.journal.Journal(self.path, resume=True)
+        self.assertEqual(
+            journal.completed('a', 'build', '1.0')['digest'], 'sha256:abc')
+        self.assertIsNotNone(journal.completed('a', 'push', '1.0', 'registry'))
+        self.assertIsNone(journal.completed('a', 'push', '1.0', 'other'))
+        self.assertIsNone(journal.completed('a', 'build', '2.0'))
+
+    def test_not_resuming_starts_again(self):
+        journal = windlass.journal.Journal(self.path)
+        journal.record('a', 'build')
+        journal = windlass.journal.Journal(self.path)
+        self.assertIsNone(journal.completed('a', 'build'))
+        journal = windlass.journal.Journal(self.path, resume=True)
+        self.assertIsNone(journal.completed('a', 'build'))
+
+    def test_truncated_entry_ignored(self):
+        journal = windlass.journal.Journal(self.path)
+        journal.record('a', 'build')
+        with open(self.path, 'a') as f:
+            f.write('{"artifact": "b", "oper')
+        journal = windlass.journal.Journal(self.path, resume=True)
+        self.assertIsNotNone(journal.completed('a', 'build'))
+        self.assertIsNone(journal.completed('b', 'build'))
+
+    def test_excluded_from_context(self):
+        context = os.path.dirname(self.path)
+        with open(os.path.join(context, 'Dockerfile'), 'w') as f:
+            f.write('FROM alpine\n')
+        windlass.journal.Journal(self.path)
+        self.assertEqual(
+            ['Dockerfile'], windlass.fingerprint.context_files(context))
+
+    def test_default_path(self):
+        cache = self.useFixture(fixtures.TempDir()).path
+        self.useFixture(fixtures.EnvironmentVariable('XDG_CACHE_HOME', cache))
+        path = windlass.journal.default_path('/src', ['/src/products.yaml'])
+        self.assertEqual(
+            os.path.join(cache, 'windlass', 'journals'),
+            os.path.dirname(path))
+        self.assertEqual(path, windlass.journal.default_path(
+            '/src', ['/src/products.yaml']))
+        self.assertNotEqual(path, windlass.journal.default_path(
+            '/src', ['/src/other.yaml']))
+
+
+class TestRunResume(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'journal.jsonl')
+
+    def run_artifacts(self, executor, fail=None, resume=False):
+        artifacts = [
+            make_artifact('a'),
+            make_artifact('b', depends_on=['a']),
+            make_artifact('c'),
+        ]
+        processed = []
+
+        def build(artifact):
+            processed.append(artifact.name)
+            if artifact.name == fail:
+                raise Exception('failed %s' % artifact.name)
+            return artifact.name
+
+        def push(artifact):
+            processed.append('push %s' % artifact.name)
+
+        def followups(artifact):
+            return [windlass.scheduler.Task(artifact, push, key='registry')]
+
+        g = windlass.api.Windlass(
+            artifacts=artifacts,
+            executor=executor,
+            journal=windlass.journal.Journal(self.path, resume=resume))
+        results = g.run(build, parallel=False, followups=followups)
+        return processed, results
+
+    def test_resume_skips_completed(self):
+        self.assertRaises(
+            Exception, self.run_artifacts, 'thread', fail='b')
+
+        processed, results = self.run_artifacts('thread', resume=True)
+        self.assertEqual(processed, ['b', 'push a', 'push c', 'push b'])
+        self.assertEqual(results, [None, 'b', None])
+
+        processed, _ = self.run_artifacts('thread', resume=True)
+        self.assertEqual(processed, [])
+
+    def test_resume_asyncio(self):
+        self.assertRaises(
+            Exception, self.run_artifacts, 'asyncio', fail='c')
+
+        processed, _ = self.run_artifacts('asyncio', resume=True)
+        self.assertNotIn('a', processed)
+        self.assertIn('c', processed)
+        self.assertIn('push c', processed)
+
+    def test_without_resume_everything_runs(self):
+        self.run_artifacts('thread')
+        processed, _ = self.run_artifacts('thread')
+        self.assertEqual(
+            processed, ['a', 'c', 'b', 'push a', 'push c', 'push b'])
+
+
+class TestCommandLine(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        self.products = os.path.join(self.tempdir, 'products.yaml')
+        with open(self.products, 'w') as f:
+            f.write('generic:\n  - name: tool\n    filename: tool.tgz\n')
+        self.journal = os.path.join(self.tempdir, 'journal.jsonl')
+        self.uploads = []
+        self.useFixture(fixtures.MockPatch(
+            'windlass.generic.Generic.build', return_value=None))
+        self.useFixture(fixtures.MockPatch(
+            'windlass.generic.Generic.upload', side_effect=self.upload))
+
+    def upload(self, version=None, **kwargs):
+        self.uploads.append(version)
+        return 'https://generic.example.com/tool.tgz;version=%s' % version
+
+    def main(self, *args, journal=True):
+        argv = [
+            'windlass', '--no-parallel', '--no-config-cache',
+            '--history-file', os.path.join(self.tempdir, 'history.json'),
+            '--push-generic-url', 'https://generic.example.com',
+            self.products] + list(args)
+        if journal:
+            argv += ['--journal', self.journal]
+        with fixtures.MonkeyPatch('sys.argv', argv):
+            windlass.windlass.main()
+
+    def test_push_version_recorded(self):
+        self.main('--push-version', '1.0')
+        journal = windlass.journal.Journal(self.journal, resume=True)
+        entry = journal.completed(
+            'tool', 'push', '1.0', 'registry.hub.docker.com')
+        self.assertEqual(
+            entry['digest'],
+            'https://generic.example.com/tool.tgz;version=1.0')
+
+        # Resuming with another version pushes it
+        self.main('--push-version', '2.0', '--resume')
+        self.assertEqual(self.uploads, ['1.0', '2.0'])
+        self.main('--push-version', '2.0', '--resume')
+        self.assertEqual(self.uploads, ['1.0', '2.0'])
+
+    def test_default_journal_in_cache(self):
+        cache = os.path.join(self.tempdir, 'cache')
+        self.useFixture(fixtures.EnvironmentVariable('XDG_CACHE_HOME', cache))
+        workdir = self.useFixture(fixtures.TempDir()).path
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        self.addCleanup(os.chdir, cwd)
+        self.main('--push-version', '1.0', journal=False)
+        self.assertEqual([], os.listdir(workdir))
+        self.main('--push-version', '1.0', '--resume', journal=False)
+        self.assertEqual(self.uploads, ['1.0'])
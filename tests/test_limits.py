@@ -0,0 +1,110 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import threading
+import time
+
+import testtools
+
+import windlass.api
+import windlass.limits
+
+
+def limited_sleep(artifact, resource, url=None):
+    with windlass.limits.limit(resource, url):
+        time.sleep(0.05)
+    return windlass.limits._semaphores is not None
+
+
+class Counter(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.maximum = 0
+
+    def __call__(self, artifact, resource, url=None):
+        with windlass.limits.limit(resource, url):
+            with self.lock:
+                self.current += 1
+                self.maximum = max(self.maximum, self.current)
+            time.sleep(0.02)
+            with self.lock:
+                self.current -= 1
+
+
+class TestLimits(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.artifacts = [
+            windlass.api.Artifact(dict(name='artifact-%d' % i))
+            for i in range(6)]
+
+    def test_host_of(self):
+        self.assertEqual(
+            windlass.limits.host_of('https://example.com/charts/a.tgz'),
+            'example.com')
+        self.assertEqual(
+            windlass.limits.host_of('127.0.0.1:5000/org/image'),
+            '127.0.0.1:5000')
+        self.assertEqual(
+            windlass.limits.host_of('org/image'),
+            windlass.limits.DEFAULT_REGISTRY_HOST)
+
+    def test_no_limits(self):
+        self.assertIsNone(windlass.limits._semaphores)
+        with windlass.limits.limit('build'):
+            pass
+
+    def test_thread_limit(self):
+        counter = Counter()
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts, executor='thread', pool_size=6,
+            limits={'build': 2})
+        g.run(counter, resource='build')
+        self.assertEqual(counter.maximum, 2)
+        self.assertIsNone(windlass.limits._semaphores)
+
+    def test_unlimited_resource(self):
+        counter = Counter()
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts, executor='thread', pool_size=6,
+            limits={'build': 1})
+        g.run(counter, resource='http')
+        self.assertEqual(counter.maximum, 6)
+
+    def test_per_host_limit(self):
+        counter = Counter()
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts, executor='thread', pool_size=6,
+            limits={'host': 3})
+        g.run(counter, resource='docker', url='registry.example.com/image')
+        self.assertEqual(counter.maximum, 3)
+
+    def test_process_limit(self):
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts, executor='process', pool_size=6,
+            limits={'build': 1})
+        start = time.time()
+        # Workers are configured with the shared limits
+        self.assertEqual(
+            g.run(limited_sleep, resource='build'), [True] * 6)
+        self.assertGreaterEqual(time.time() - start, 0.3)
+
+    def test_unknown_resource(self):
+        self.assertRaises(
+            ValueError, windlass.api.Windlass,
+            artifacts=self.artifacts, limits={'disk': 1})
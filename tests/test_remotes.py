@@ -14,6 +14,7 @@
 # under the License.
 #
 
+import asyncio
 import base64
 import unittest
 
@@ -21,6 +22,7 @@ import boto3
 import botocore.stub
 import testtools
 
+import windlass.distribution
 import windlass.remotes
 
 aws_region = 'test-region'
@@ -266,3 +268,63 @@ class TestAWSRemote(TestECRConnectorBase):
         self.assertEqual(
             self.remote.ecr.new_repo_lifecycle_policy, policy['lifecycle']
         )
+
+
+class TestConnectorAsyncUpload(testtools.TestCase):
+
+    def test_aupload(self):
+        connector = windlass.remotes.HTTPBasicAuthConnector(
+            'https://example.com/generic', 'user', 'password')
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with unittest.mock.patch('requests.put') as put_mock:
+            put_mock.return_value.status_code = 201
+            url = loop.run_until_complete(
+                connector.aupload('file.tgz', b'data'))
+        self.assertEqual(url, 'https://example.com/generic/file.tgz')
+        put_mock.assert_called_once_with(
+            url, data=b'data', auth=unittest.mock.ANY,
+            verify='/etc/ssl/certs')
+
+
+class TestDockerConnectorUpload(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = unittest.mock.patch('windlass.dockerclient.client')
+        self.dcli = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.dcli.images.get.return_value.attrs = {'RepoDigests': [
+            'other.example.com/org/image@sha256:abc']}
+        self.dcli.images.push.return_value = []
+        patcher = unittest.mock.patch.object(
+            windlass.distribution.RegistryClient, 'manifest_digest')
+        self.manifest_digest = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connector = windlass.remotes.DockerConnector(
+            'registry.example.com', 'user', 'secret')
+
+    def test_already_uploaded(self):
+        self.manifest_digest.return_value = 'sha256:abc'
+        self.assertEqual(
+            'registry.example.com/org/image:1.0',
+            self.connector.upload('org/image:1.0'))
+        self.manifest_digest.assert_called_once_with('org/image', '1.0')
+        self.dcli.api.tag.assert_not_called()
+        self.dcli.images.push.assert_not_called()
+
+    def test_changed(self):
+        self.manifest_digest.return_value = 'sha256:def'
+        self.connector.upload('org/image:1.0')
+        self.dcli.images.push.assert_called_once_with(
+            'registry.example.com/org/image', '1.0',
+            auth_config={'username': 'user', 'password': 'secret'},
+            stream=True)
+        self.dcli.api.remove_image.assert_called_once_with(
+            'registry.example.com/org/image:1.0')
+
+    def test_never_pushed(self):
+        self.dcli.images.get.return_value.attrs = {'RepoDigests': []}
+        self.connector.upload('org/image:1.0')
+        self.manifest_digest.assert_not_called()
+        self.dcli.images.push.assert_called_once()
@@ -0,0 +1,159 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import os
+import testtools
+import time
+
+import windlass.api
+import windlass.exc
+import windlass.scheduler
+
+from tests.utils import make_artifact
+
+# The benchmarks depend on the load of the machine, so only run on request
+BENCHMARKS = os.environ.get('WINDLASS_BENCHMARKS')
+
+
+def noop(artifact):
+    return artifact.name
+
+
+class TestDependencyGraph(testtools.TestCase):
+
+    def test_no_dependencies(self):
+        artifacts = [make_artifact('a'), make_artifact('b')]
+        graph = windlass.scheduler.DependencyGraph.from_artifacts(artifacts)
+        self.assertEqual(graph.ready(), artifacts)
+        self.assertEqual(graph.ready(), [])
+        self.assertFalse(graph.finished())
+        for artifact in artifacts:
+            graph.done(artifact)
+        self.assertTrue(graph.finished())
+
+    def test_depends_on(self):
+        a = make_artifact('a', depends_on=['b'])
+        b = make_artifact('b')
+        c = make_artifact('c')
+        graph = windlass.scheduler.DependencyGraph.from_artifacts([a, b, c])
+        self.assertEqual(graph.ready(), [b, c])
+        graph.done(c)
+        self.assertEqual(graph.ready(), [])
+        graph.done(b)
+        self.assertEqual(graph.ready(), [a])
+
+    def test_depends_on_string(self):
+        a = make_artifact('a', depends_on='b')
+        self.assertEqual(a.depends_on, ['b'])
+
+    def test_missing_dependency_is_ignored(self):
+        a = make_artifact('a', depends_on=['not-processed'])
+        graph = windlass.scheduler.DependencyGraph.from_artifacts([a])
+        self.assertEqual(graph.ready(), [a])
+
+    def test_priority_converted_to_dependencies(self):
+        low = make_artifact('low')
+        high = make_artifact('high', priority=10)
+        other_high = make_artifact('other-high', priority=10)
+        middle = make_artifact('middle', priority=5)
+        graph = windlass.scheduler.DependencyGraph.from_artifacts(
+            [low, high, other_high, middle])
+        self.assertEqual(graph.ready(), [high, other_high])
+        graph.done(high)
+        self.assertEqual(graph.ready(), [])
+        graph.done(other_high)
+        self.assertEqual(graph.ready(), [middle])
+        graph.done(middle)
+        self.assertEqual(graph.ready(), [low])
+
+    def test_fail_skips_dependants(self):
+        a = make_artifact('a')
+        b = make_artifact('b', depends_on=['a'])
+        c = make_artifact('c', depends_on=['b'])
+        d = make_artifact('d')
+        graph = windlass.scheduler.DependencyGraph.from_artifacts(
+            [a, b, c, d])
+        self.assertEqual(graph.ready(), [a, d])
+        self.assertEqual(graph.fail(a), [b, c])
+        self.assertFalse(graph.finished())
+        graph.done(d)
+        self.assertEqual(graph.ready(), [])
+        self.assertTrue(graph.finished())
+
+    def test_cycle(self):
+        artifacts = [
+            make_artifact('a', depends_on=['b']),
+            make_artifact('b', depends_on=['c']),
+            make_artifact('c', depends_on=['a']),
+            make_artifact('d'),
+        ]
+        e = self.assertRaises(
+            windlass.exc.DependencyCycleException,
+            windlass.scheduler.DependencyGraph.from_artifacts,
+            artifacts)
+        self.assertEqual(set(e.nodes), set(artifacts[:3]))
+        self.assertIn('a', e.debug_message())
+
+
+class TestRunDependencies(testtools.TestCase):
+
+    def test_serial_run_order(self):
+        artifacts = [
+            make_artifact('a', depends_on=['b']),
+            make_artifact('b', depends_on=['c']),
+            make_artifact('c'),
+        ]
+        processed = []
+
+        def process(artifact):
+            processed.append(artifact.name)
+            return artifact.name
+
+        g = windlass.api.Windlass(artifacts=artifacts)
+        results = g.run(process, parallel=False)
+        self.assertEqual(processed, ['c', 'b', 'a'])
+        self.assertEqual(results, ['a', 'b', 'c'])
+
+
+@testtools.skipUnless(BENCHMARKS, 'set WINDLASS_BENCHMARKS to run')
+class TestSchedulerOverhead(testtools.TestCase):
+    """Benchmark the cost of scheduling artifacts that do no work"""
+
+    def run_noop(self, artifacts):
+        g = windlass.api.Windlass(artifacts=artifacts, pool_size=4)
+        start = time.time()
+        results = g.run(noop)
+        elapsed = time.time() - start
+        self.assertEqual(results, [a.name for a in artifacts])
+        self.addDetail(
+            'elapsed', testtools.content.text_content(
+                '%d no-op artifacts scheduled in %.3fs' % (
+                    len(artifacts), elapsed)))
+        return elapsed
+
+    def test_1000_noop_artifacts(self):
+        artifacts = [make_artifact('noop-%d' % i) for i in range(1000)]
+        # Polling added up to 200ms per batch of work, the scheduler should
+        # only be paying for the pool round trips.
+        self.assertLess(self.run_noop(artifacts), 10)
+
+    def test_1000_noop_artifacts_chain(self):
+        artifacts = [make_artifact('noop-0')] + [
+            make_artifact('noop-%d' % i, depends_on=['noop-%d' % (i - 1)])
+            for i in range(1, 1000)]
+        # Every artifact waits on the previous one, with polling this
+        # would take several minutes.
+        self.assertLess(self.run_noop(artifacts), 10)
@@ -0,0 +1,218 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import fixtures
+import json
+import os
+import testtools
+
+import windlass.api
+import windlass.history
+import windlass.images
+import windlass.scheduler
+import windlass.sharding
+
+from tests.utils import make_artifact
+
+
+class TestSharding(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tempdir = self.useFixture(fixtures.TempDir()).path
+        self.history = windlass.history.History(
+            os.path.join(self.tempdir, 'history.json'))
+
+    def test_parse_shard(self):
+        self.assertEqual(windlass.sharding.parse_shard('2/5'), (2, 5))
+        for value in ('0/5', '6/5', '1', 'a/b', '1/0'):
+            self.assertRaises(
+                ValueError, windlass.sharding.parse_shard, value)
+
+    def test_balanced_by_history(self):
+        durations = {'big': 100, 'a': 40, 'b': 30, 'c': 20, 'd': 10}
+        for name, seconds in durations.items():
+            self.history.record(name, 'build', seconds)
+        artifacts = [make_artifact(name) for name in sorted(durations)]
+
+        shards = windlass.sharding.split(artifacts, 2, self.history)
+        self.assertEqual(
+            [[a.name for a in shard] for shard in shards],
+            [['big'], ['a', 'b', 'c', 'd']])
+
+    def test_every_artifact_in_one_shard(self):
+        artifacts = [make_artifact('image-%d' % i) for i in range(23)]
+        shards = [
+            windlass.sharding.select(artifacts, index, 5)
+            for index in range(1, 6)]
+        names = [a.name for shard in shards for a in shard]
+        self.assertEqual(sorted(names), sorted(a.name for a in artifacts))
+        # Without any costs the shards are balanced by count
+        self.assertEqual(
+            sorted(len(shard) for shard in shards), [4, 4, 5, 5, 5])
+
+    def test_deterministic(self):
+        artifacts = [make_artifact('image-%d' % i) for i in range(10)]
+        copies = [make_artifact('image-%d' % i) for i in range(10)]
+        self.assertEqual(
+            [a.name for a in windlass.sharding.select(artifacts, 2, 3)],
+            [a.name for a in windlass.sharding.select(copies, 2, 3)])
+
+    def test_dependencies_kept_together(self):
+        artifacts = [
+            make_artifact('base'),
+            make_artifact('app', depends_on=['base']),
+            make_artifact('other'),
+            make_artifact('tool', depends_on='app'),
+        ]
+        shards = windlass.sharding.split(artifacts, 2)
+        self.assertEqual(
+            [[a.name for a in shard] for shard in shards],
+            [['base', 'app', 'tool'], ['other']])
+
+    def test_priorities_ordered_in_shard(self):
+        artifacts = [
+            make_artifact('base', priority=1),
+            make_artifact('app'),
+            make_artifact('other', priority=1),
+            make_artifact('tool'),
+        ]
+        shards = windlass.sharding.split(artifacts, 2)
+        self.assertEqual(
+            [[a.name for a in shard] for shard in shards],
+            [['app', 'other'], ['base', 'tool']])
+        # Each shard processes its higher priority artifacts first
+        for shard in shards:
+            graph = windlass.scheduler.DependencyGraph.from_artifacts(shard)
+            first, second = shard
+            self.assertEqual(
+                [first if first.priority else second],
+                graph.ready())
+
+    def test_context_size(self):
+        for name, size in (('small', 10), ('large', 1000)):
+            os.makedirs(os.path.join(self.tempdir, name))
+            with open(os.path.join(self.tempdir, name, 'file'), 'w') as f:
+                f.write('x' * size)
+        artifacts = []
+        for name in ('small', 'large', 'remote'):
+            data = {'name': 'org/%s' % name, 'context': name}
+            if name == 'remote':
+                data['remote'] = 'org/remote'
+            image = windlass.images.Image(data)
+            image.metadata['repopath'] = self.tempdir
+            artifacts.append(image)
+
+        self.assertEqual(artifacts[1].build_size(), 1000)
+        self.assertIsNone(artifacts[2].build_size())
+        costs = windlass.sharding.costs(artifacts)
+        self.assertEqual(
+            [costs[a] for a in artifacts], [10, 1000, 505])
+
+    def test_windlass_shard(self):
+        artifacts = [make_artifact('image-%d' % i) for i in range(4)]
+        g = windlass.api.Windlass(artifacts=artifacts)
+        self.assertEqual(
+            ['image-%d' % i for i in range(4)], g.shard(2, 2))
+        self.assertEqual(
+            [a.name for a in g.artifacts], ['image-1', 'image-3'])
+
+    def test_read_only_history(self):
+        self.history.record('a', 'build', 10)
+        self.history.save()
+        snapshot = windlass.history.History(
+            self.history.path, read_only=True)
+        snapshot.record('a', 'build', 20)
+        snapshot.save()
+        self.assertEqual(
+            10, windlass.history.History(self.history.path).total('a'))
+        self.assertEqual({'build': {'a': {'mean': 15.0, 'count': 2}}},
+                         snapshot.updates)
+
+    def write_summaries(self, artifacts, count=2, names=None,
+                        prefix='shard'):
+        if names is None:
+            names = [artifact.name for artifact in artifacts]
+        paths = []
+        for index in range(1, count + 1):
+            shard = windlass.sharding.select(artifacts, index, count)
+            history = windlass.history.History(
+                os.path.join(self.tempdir, 'history-%d.json' % index))
+            for artifact in shard:
+                history.record(artifact.name, 'build', 1)
+            path = os.path.join(
+                self.tempdir, '%s-%d.json' % (prefix, index))
+            windlass.sharding.write_summary(
+                path, index, count, shard, names, history,
+                succeeded=index == 1, failed=['d'] if index == 2 else [])
+            paths.append(path)
+        return paths
+
+    def test_summaries(self):
+        paths = self.write_summaries([make_artifact(name) for name in 'abcd'])
+
+        merged = windlass.sharding.merge_summaries(paths)
+        self.assertFalse(merged['succeeded'])
+        self.assertEqual(sorted(merged['artifacts']), list('abcd'))
+        self.assertEqual(merged['failed'], ['d'])
+        self.assertEqual(sorted(merged['durations']['build']), list('abcd'))
+
+        e = self.assertRaises(
+            ValueError, windlass.sharding.merge_summaries, paths[:1])
+        self.assertIn('Missing summaries of shards 2', str(e))
+        e = self.assertRaises(
+            ValueError, windlass.sharding.merge_summaries, paths + paths[:1])
+        self.assertIn('are both shard 1', str(e))
+
+    def test_summaries_cover_run(self):
+        artifacts = [make_artifact(name) for name in 'abcd']
+        paths = self.write_summaries(artifacts, names='abcde')
+        e = self.assertRaises(
+            ValueError, windlass.sharding.merge_summaries, paths)
+        self.assertEqual('e are in no shard', str(e))
+
+        paths = self.write_summaries(artifacts, names='abc')
+        e = self.assertRaises(
+            ValueError, windlass.sharding.merge_summaries, paths)
+        self.assertEqual('d are not artifacts of the run', str(e))
+
+        # Shards of different splits
+        first = self.write_summaries(artifacts)[0]
+        second = self.write_summaries(
+            artifacts, count=3, prefix='other')[1]
+        e = self.assertRaises(
+            ValueError, windlass.sharding.merge_summaries, [first, second])
+        self.assertIn('is a shard of 3, not 2', str(e))
+        second = self.write_summaries(
+            artifacts, names='abcdf', prefix='third')[1]
+        e = self.assertRaises(
+            ValueError, windlass.sharding.merge_summaries, [first, second])
+        self.assertIn('was split from other artifacts', str(e))
+
+    def test_merge_command(self):
+        paths = self.write_summaries([make_artifact(name) for name in 'abcd'])
+        output = os.path.join(self.tempdir, 'merged.json')
+        argv = ['windlass-merge-shards', '--output', output,
+                '--history-file', self.history.path] + paths
+        with fixtures.MonkeyPatch('sys.argv', argv):
+            e = self.assertRaises(SystemExit, windlass.sharding.main)
+        # Shard 2 failed
+        self.assertEqual(1, e.code)
+        with open(output) as f:
+            self.assertEqual(['d'], json.load(f)['failed'])
+        history = windlass.history.History(self.history.path)
+        self.assertEqual(
+            [1, 1, 1, 1], [history.total(name) for name in 'abcd'])
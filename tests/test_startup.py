@@ -0,0 +1,81 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import json
+import os
+import subprocess
+import sys
+import testtools
+
+# Imported only on the code paths that use them, not to start the tools.
+HEAVY_MODULES = [
+    'boto3', 'botocore', 'docker', 'git', 'jinja2', 'prettytable',
+    'requests', 'ruamel.yaml', 'urllib3',
+]
+
+# The benchmarks depend on the load of the machine, so only run on request
+BENCHMARKS = os.environ.get('WINDLASS_BENCHMARKS')
+
+# Seconds importing the command line tools may take, the best of a few
+# runs. Override with WINDLASS_IMPORT_BUDGET on slow machines.
+IMPORT_BUDGET = float(os.environ.get('WINDLASS_IMPORT_BUDGET', 0.5))
+
+MEASURE = '''
+import json, sys, time
+start = time.perf_counter()
+import %s
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+
+def measure(module):
+    output = subprocess.check_output(
+        [sys.executable, '-c', MEASURE % module],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(output.decode())
+
+
+class TestStartup(testtools.TestCase):
+
+    def check_startup(self, module):
+        modules = measure(module)['modules']
+        imported = [name for name in HEAVY_MODULES if name in modules]
+        self.assertEqual([], imported)
+
+    def test_windlass(self):
+        self.check_startup('windlass.windlass')
+
+    def test_pindiff(self):
+        self.check_startup('windlass.pindiff')
+
+
+@testtools.skipUnless(BENCHMARKS, 'set WINDLASS_BENCHMARKS to run')
+class TestStartupBenchmark(testtools.TestCase):
+
+    def check_startup(self, module):
+        best = min(measure(module)['seconds'] for _ in range(3))
+        self.assertLess(
+            best, IMPORT_BUDGET,
+            'Importing %s took %.3fs' % (module, best))
+
+    def test_windlass(self):
+        self.check_startup('windlass.windlass')
+
+    def test_pindiff(self):
+        self.check_startup('windlass.pindiff')
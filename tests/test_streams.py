@@ -0,0 +1,125 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import json
+import os
+import time
+
+import testtools
+import yaml
+
+import windlass.exc
+import windlass.images
+
+# Output recorded from docker building and pushing an image
+STREAMS = os.path.join(os.path.dirname(__file__), 'streams')
+
+# How many times the recorded streams are replayed to benchmark decoding
+REPEAT = 5
+
+# The benchmarks depend on the load of the machine, so only run on request
+BENCHMARKS = os.environ.get('WINDLASS_BENCHMARKS')
+
+
+def recorded(name):
+    """Return the lines of a recorded stream, as docker sends them"""
+    with open(os.path.join(STREAMS, name), 'rb') as f:
+        return f.read().splitlines(keepends=True)
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def best_time(function, *args):
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class TestJSONStream(testtools.TestCase):
+
+    def test_lines(self):
+        lines = recorded('push.json')
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            list(windlass.images.json_stream(lines)))
+
+    def test_chunks(self):
+        data = '{"stream": "café"}\r\n{"status": "a"}{"status": "b"}'
+        objects = [{'stream': 'café'}, {'status': 'a'}, {'status': 'b'}]
+        for size in (1, 3, 7, len(data)):
+            self.assertEqual(objects, list(windlass.images.json_stream(
+                chunks(data.encode('utf-8'), size))))
+            self.assertEqual(
+                objects, list(windlass.images.json_stream(chunks(data, size))))
+
+    def test_invalid(self):
+        self.assertRaises(
+            ValueError, list,
+            windlass.images.json_stream([b'{"status": "a"}\n', b'{"st']))
+
+
+class TestCheckDockerStream(testtools.TestCase):
+
+    def test_error_context(self):
+        lines = [
+            json.dumps({'status': 'Pushing', 'id': str(n)}).encode()
+            for n in range(windlass.images.STREAM_CONTEXT * 2)]
+        lines += lines
+        lines.append(b'{"error": "denied"}')
+        e = self.assertRaises(
+            windlass.exc.WindlassPushPullException,
+            windlass.images.check_docker_stream, lines)
+        self.assertEqual(['denied'], e.errors)
+        self.assertEqual(windlass.images.STREAM_CONTEXT, len(e.out))
+        self.assertTrue(e.out[-1].endswith(
+            'layer %d: Pushing' % (windlass.images.STREAM_CONTEXT * 2 - 1)))
+
+    def test_recorded(self):
+        windlass.images.check_docker_stream(recorded('push.json'))
+
+
+@testtools.skipUnless(BENCHMARKS, 'set WINDLASS_BENCHMARKS to run')
+class TestStreamBenchmark(testtools.TestCase):
+    """Decoding the recorded streams, compared with parsing them as YAML"""
+
+    def check_faster(self, name):
+        lines = recorded(name) * REPEAT
+
+        def decode_yaml():
+            for line in lines:
+                yaml.load(line.decode(), Loader=yaml.SafeLoader)
+
+        def decode_json():
+            for _ in windlass.images.json_stream(lines):
+                pass
+
+        yaml_time = best_time(decode_yaml)
+        json_time = best_time(decode_json)
+        self.assertLess(
+            json_time * 5, yaml_time,
+            'Decoding %d lines of %s took %.3fs, %.3fs as YAML' % (
+                len(lines), name, json_time, yaml_time))
+
+    def test_build(self):
+        self.check_faster('build.json')
+
+    def test_push(self):
+        self.check_faster('push.json')
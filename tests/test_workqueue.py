@@ -0,0 +1,197 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import collections
+import concurrent.futures
+import fixtures
+import testtools
+import threading
+import time
+
+import windlass.api
+import windlass.exc
+import windlass.scheduler
+import windlass.workqueue
+
+from tests.utils import make_artifact
+
+
+class WorkQueueTests(object):
+    """Behaviour shared by every work queue backend"""
+
+    def test_claim(self):
+        self.assertIsNone(self.queue.state('a')['state'])
+        self.assertTrue(self.queue.claim('a', 'one'))
+        self.assertFalse(self.queue.claim('a', 'two'))
+        state = self.queue.state('a')
+        self.assertEqual(state['state'], windlass.workqueue.LEASED)
+        self.assertEqual(state['owner'], 'one')
+        self.assertTrue(self.queue.renew('a', 'one'))
+        self.assertFalse(self.queue.renew('a', 'two'))
+
+    def test_complete(self):
+        self.queue.claim('a', 'one')
+        self.queue.complete('a', 'one')
+        self.assertEqual(
+            self.queue.state('a')['state'], windlass.workqueue.DONE)
+        self.assertFalse(self.queue.claim('a', 'two'))
+
+    def test_fail(self):
+        self.queue.claim('a', 'one')
+        self.queue.fail('a', 'one', 'broken')
+        state = self.queue.state('a')
+        self.assertEqual(state['state'], windlass.workqueue.FAILED)
+        self.assertEqual(state['message'], 'broken')
+        self.assertFalse(self.queue.claim('a', 'two'))
+
+    def test_expired_lease_reclaimed(self):
+        self.queue.ttl = 0
+        self.assertTrue(self.queue.claim('a', 'dead'))
+        self.assertEqual(
+            self.queue.state('a')['state'], windlass.workqueue.EXPIRED)
+        self.queue.ttl = 60
+        self.assertTrue(self.queue.claim('a', 'alive'))
+        self.assertEqual(self.queue.state('a')['owner'], 'alive')
+        self.assertFalse(self.queue.renew('a', 'dead'))
+
+
+class TestMemoryWorkQueue(WorkQueueTests, testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.queue = windlass.workqueue.MemoryWorkQueue()
+
+
+class TestDirectoryWorkQueue(WorkQueueTests, testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.queue = windlass.workqueue.DirectoryWorkQueue(
+            self.useFixture(fixtures.TempDir()).path, poll_interval=0.01)
+
+    def test_item_names_quoted(self):
+        self.assertTrue(self.queue.claim('build:some/image', 'one'))
+        self.queue.complete('build:some/image', 'one')
+        self.assertEqual(
+            self.queue.state('build:some/image')['state'],
+            windlass.workqueue.DONE)
+
+    def test_late_renew_during_reclaim(self):
+        self.queue.ttl = 0
+        self.assertTrue(self.queue.claim('a', 'late'))
+        self.queue.ttl = 60
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            with self.queue._locked('a'):
+                # The renewal waits for the reclaim holding the lock
+                renewed = pool.submit(self.queue.renew, 'a', 'late')
+                time.sleep(0.1)
+                self.assertFalse(renewed.done())
+                self.queue._write(
+                    self.queue._path('a', 'lease'),
+                    self.queue._lease('alive'))
+            self.assertFalse(renewed.result())
+        self.assertEqual(self.queue.state('a')['owner'], 'alive')
+
+
+class TestDistributedRun(testtools.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.queue = windlass.workqueue.MemoryWorkQueue()
+        self.lock = threading.Lock()
+        self.processed = collections.Counter()
+        self.pushed = collections.Counter()
+        self.broken = False
+
+    def artifacts(self):
+        # Each node loads its own copy of the products
+        return [make_artifact('base')] + [
+            make_artifact('image-%d' % i, depends_on=['base'])
+            for i in range(10)]
+
+    def build(self, artifact):
+        time.sleep(0.01)
+        with self.lock:
+            self.processed[artifact.name] += 1
+        if artifact.name == 'image-3' and self.broken:
+            raise Exception('image-3 failed')
+        return artifact.name
+
+    def push(self, artifact):
+        with self.lock:
+            self.pushed[artifact.name] += 1
+
+    def followups(self, artifact):
+        return [windlass.scheduler.Task(artifact, self.push, key='registry')]
+
+    def run_node(self, keep_going=False):
+        g = windlass.api.Windlass(
+            artifacts=self.artifacts(), executor='thread', pool_size=2,
+            work_queue=self.queue, keep_going=keep_going)
+        return g.run(self.build, followups=self.followups)
+
+    def run_nodes(self, count, keep_going=False):
+        with concurrent.futures.ThreadPoolExecutor(count) as executor:
+            futures = [
+                executor.submit(self.run_node, keep_going)
+                for _ in range(count)]
+        return futures
+
+    def test_each_artifact_processed_once(self):
+        futures = self.run_nodes(3)
+        for future in futures:
+            future.result()
+        expected = ['base'] + ['image-%d' % i for i in range(10)]
+        self.assertEqual(sorted(self.processed), sorted(expected))
+        self.assertEqual(set(self.processed.values()), {1})
+        self.assertEqual(self.pushed, self.processed)
+
+    def test_remote_failure(self):
+        self.broken = True
+        futures = self.run_nodes(2, keep_going=True)
+        for future in futures:
+            e = self.assertRaises(
+                windlass.exc.MultipleFailuresException, future.result)
+            self.assertEqual(e.skipped, ['image-3 (registry)'])
+        self.assertEqual(self.processed['image-3'], 1)
+        self.assertNotIn('image-3', self.pushed)
+
+    def test_expired_lease_reclaimed(self):
+        self.queue.ttl = 0
+        self.queue.claim('build:base', 'dead')
+        self.queue.ttl = 60
+        self.run_node()
+        self.assertEqual(self.processed['base'], 1)
+
+    def test_waits_for_other_node(self):
+        self.queue.claim('build:base', 'other')
+
+        def finish_base():
+            time.sleep(0.1)
+            self.queue.complete('build:base', 'other')
+
+        thread = threading.Thread(target=finish_base)
+        thread.start()
+        results = self.run_node()
+        thread.join()
+        self.assertNotIn('base', self.processed)
+        self.assertEqual(self.processed['image-0'], 1)
+        self.assertIsNone(results[0])
+
+    def test_asyncio_not_supported(self):
+        self.assertRaises(
+            ValueError, windlass.api.Windlass, artifacts=[],
+            executor='asyncio', work_queue=self.queue)
@@ -14,24 +14,71 @@
 # under the License.
 #
 
+import asyncio
 from collections import defaultdict
+from collections import OrderedDict
+import concurrent.futures
+import contextlib
+import contextvars
 import functools
-import git
 import logging
 import multiprocessing
 import os.path
+import queue
 import re
 import shutil
 import tempfile
+import time
 import urllib.parse
 import yaml
 
+import windlass.dockerclient
 import windlass.exc
+import windlass.fingerprint
+import windlass.gitcache
+import windlass.history
+import windlass.journal
+import windlass.limits
+import windlass.scheduler
+import windlass.sharding
+import windlass.tools
+import windlass.workqueue
 
 DEFAULT_PRODUCT_FILES = ['artifacts.yaml', '.windlass.yaml']
 # Pick the first of these as the canonical name.
 CANONICAL_PRODUCT_FILE = DEFAULT_PRODUCT_FILES[0]
 
+EXECUTORS = ['process', 'thread', 'asyncio']
+
+# Transfers the asyncio executor runs at once, each on a thread of its own.
+DEFAULT_CONCURRENCY = 64
+
+# Executor the blocking calls of the artifacts processed by arun run on.
+_blocking_executor = contextvars.ContextVar(
+    'windlass_blocking_executor', default=None)
+
+# Number of repositories checked out at the same time when loading.
+REPO_LOAD_WORKERS = 8
+
+# Order artifacts are started in, as they become ready or longest first.
+SCHEDULES = ['fifo', 'lpt']
+
+# Parse products with libyaml when it is available.
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Modules imported by the forkserver so workers start with them loaded.
+PRELOAD_MODULES = [
+    'windlass.charts',
+    'windlass.generic',
+    'windlass.images',
+    'windlass.pins',
+    'windlass.registries',
+    'windlass.remotes',
+    'docker',
+    'boto3',
+    'git',
+]
+
 
 class Artifact(object):
     """Artifact type
@@ -67,6 +114,9 @@ class Artifact(object):
         self.name = data['name']
         self.version = data.get('version', None)
         self.priority = data.get('priority', 0)
+        self.depends_on = data.get('depends_on', [])
+        if not isinstance(self.depends_on, list):
+            self.depends_on = [self.depends_on]
 
     def set_version(self, version):
         """Set vesrion of artifact.
@@ -78,10 +128,12 @@ class Artifact(object):
     def url(self, version=None):
         raise NotImplementedError('url not implemented')
 
-    def build(self):
+    def build(self, **kwargs):
         """Build the artifact
 
-        This builds the artifact for use by a developer
+        This builds the artifact for use by a developer. Types ignore the
+        keyword arguments they don't use, such as the registries an image
+        built from the same sources may already be in.
         """
         raise NotImplementedError('build not implemented')
 
@@ -104,6 +156,22 @@ class Artifact(object):
         """
         raise NotImplementedError('upload not implemented')
 
+    async def adownload(self, version=None, **kwargs):
+        """Download the versioned artifact without blocking the event loop
+
+        Same as download, by default the download runs with run_blocking, on a
+        thread of the run when processed by Windlass.arun.
+        """
+        return await run_blocking(self.download, version=version, **kwargs)
+
+    async def aupload(self, version=None, **kwargs):
+        """Upload the artifact without blocking the event loop
+
+        Same as upload, by default the upload runs with run_blocking, on a
+        thread of the run when processed by Windlass.arun.
+        """
+        return await run_blocking(self.upload, version=version, **kwargs)
+
     def delete(self, version=None, **kwargs):
         """Delete any downloaded artifacts on the host
 
@@ -112,6 +180,34 @@ class Artifact(object):
         """
         raise NotImplementedError('delete not implemented')
 
+    def source_paths(self):
+        """Return the paths in its repository the artifact is built from
+
+        Paths are relative to the top of the repository. None means the
+        whole repository is needed.
+        """
+        return None
+
+    def build_size(self):
+        """Return the size in bytes of what the artifact is built from
+
+        Used to estimate how long the artifact takes when there are no
+        recorded durations, None if it is not known.
+        """
+        return None
+
+    def plan(self, operation, **kwargs):
+        """Return what operation would do to the artifact, without doing it
+
+        Returns a dictionary with the action, e.g. the operation itself or
+        a reason it would be skipped, and the bytes it would transfer or
+        None if that isn't known. kwargs are those operation would get.
+        """
+        return {
+            'action': operation,
+            'bytes': self.build_size() if operation == 'build' else None,
+        }
+
     def update_version(self, version):
         """Update an artifact's version, rewriting it if necessary"""
         # Make the default behaviour same as set_version()
@@ -142,26 +238,252 @@ class Artifact(object):
         return self.export(export_dir, export_name, version)
 
 
+def _repo_of(artifact_def):
+    """Return the (url, branch) of the repository defining an entry"""
+    repourl = artifact_def.get('repo', None)
+    if not repourl or repourl == '.':
+        return None
+    return repourl, artifact_def.get('branch', None)
+
+
+def _source_paths(repopath, artifacts):
+    """Return the paths in repopath the artifacts need, None if all of it"""
+    paths = []
+    for artifact in artifacts:
+        if artifact.metadata.get('repopath') != repopath:
+            # Loaded from another repository that it refers to
+            continue
+        source_paths = artifact.source_paths()
+        if source_paths is None:
+            return None
+        paths.extend(source_paths)
+    return paths
+
+
+def read_product_files(paths):
+    """Return the data of the product files in paths that exist"""
+    data = {}
+    for path in paths:
+        if os.path.exists(path):
+            logging.debug("Reading file '%s' for config data", path)
+            with open(path, 'r') as f:
+                data = windlass.tools.deep_merge(
+                    data, yaml.load(f.read(), Loader=YAML_LOADER) or {})
+    return data
+
+
+def _git_state(path):
+    """Return what auto config depends on in the repository at path
+
+    This is the path of the repository, its config and HEAD, and whether
+    it has a Dockerfile. Returns None if path isn't the top of a
+    repository with a plain .git directory.
+    """
+    path = os.path.abspath(path)
+    gitdir = os.path.join(path, '.git')
+    if not os.path.isdir(gitdir):
+        # Not a repository, or a worktree or submodule, leave it to git
+        return None
+    state = [path]
+    for name in ('config', 'HEAD'):
+        try:
+            with open(os.path.join(gitdir, name), 'rb') as f:
+                state.append(f.read())
+        except OSError:
+            return None
+    state.append(str(os.path.exists(os.path.join(path, 'Dockerfile'))))
+    return state
+
+
+def _read_auto_config():
+    import git
+
+    # check if in a git repo to define the image name based on an
+    # assumed <org>/<repo> naming, if there is a way to get the base
+    # url it would make it easier to handle hosting services that
+    # support multiple levels of nesting
+    try:
+        repo = git.Repo()
+    except git.exc.InvalidGitRepositoryError:
+        # not a git repo so can't perform any further auto config
+        return {}
+
+    logging.info("Auto config from repo")
+    # handle multiple remotes for dev envs
+    try:
+        remote = repo.head.reference.tracking_branch().remote_name
+    except Exception:
+        remote = 'origin'
+    # consider replacing with giturlparse or git-url-parse if any
+    # issues encountered with parsing
+    repourl = next(repo.remotes[remote].urls)
+    urlparts = re.split(':|/', re.sub('.git$', '', repourl))
+    name = '/'.join(urlparts[-2:])
+
+    if os.path.exists(os.path.join(repo.working_dir, 'Dockerfile')):
+        return {
+            'images': [
+                {
+                    'name': name.lower(),  # docker limitation
+                    'context': '.',
+                    'floating_tag': 'latest',
+                }
+            ]
+        }
+    return {}
+
+
+class _Definition(object):
+    """An entry of the products, and its artifact once loaded"""
+
+    def __init__(self, cls, data):
+        self.cls = cls
+        self.data = data
+        self.name = data['name']
+        self.repo = _repo_of(data)
+        self.artifact = None
+
+
 class Artifacts(object):
 
-    def __init__(self, data=None, workspace=None, artifacts=None):
+    def __init__(self, data=None, workspace=None, artifacts=None,
+                 git_cache=None):
+        """Manage the artifacts defined in data
+
+        The artifacts are loaded when they are first used. select and
+        narrow pick artifacts by name and type from the definitions, so
+        only the repositories of the artifacts used are checked out.
+
+        git_cache - windlass.gitcache.GitCache remote repositories are
+                    checked out from, defaults to one in the windlass
+                    cache directory.
+        """
 
         self.data = {}
         self.tempdir = tempfile.mkdtemp()
-
+        self.git_cache = git_cache or windlass.gitcache.GitCache()
+        # Index of the artifacts by name of each repository loaded, and
+        # the checkouts made by loading them.
+        self._repos = {}
+        self._checkouts = set()
+
+        self.workspace = workspace
+        # Default metadata to assign to arifacts
+        self.repopath = os.path.abspath('.')
         if artifacts:
             self.items = artifacts
         else:
-            self.items = self.load(
-                data or {},
-                workspace=workspace,
-                # Default metadata to assign to arifacts
-                repopath=os.path.abspath('.'))
+            self._items = None
+            self._definitions = [
+                _Definition(cls, artifact_def)
+                for cls, artifact_def in self._entries(data or {})]
 
     def __del__(self):
         if os.path.exists(self.tempdir):
             shutil.rmtree(self.tempdir)
 
+    @property
+    def loaded(self):
+        """Whether every artifact is loaded"""
+        return self._items is not None
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = self._load_definitions(self._definitions)
+            self._definitions = None
+        return self._items
+
+    @items.setter
+    def items(self, items):
+        self._items = items
+        self._definitions = None
+
+    def names(self):
+        """Return the names of the artifacts, without loading them"""
+        if self.loaded:
+            return [artifact.name for artifact in self._items]
+        return [definition.name for definition in self._definitions]
+
+    def _matching(self, names=None, types=None):
+        """Return a filter on the artifacts, or their definitions"""
+        def match(item):
+            if names is not None and item.name not in names:
+                return False
+            if types is not None:
+                cls = item.cls if isinstance(item, _Definition) \
+                    else type(item)
+                return issubclass(cls, tuple(types))
+            return True
+        return match
+
+    def select(self, names=None, types=None):
+        """Return the artifacts named one of names and of one of types
+
+        Only the artifacts selected are loaded, the others stay as they
+        are defined. None selects any name or type.
+        """
+        match = self._matching(names, types)
+        if self.loaded:
+            return [artifact for artifact in self._items if match(artifact)]
+        return self._load_definitions([
+            definition for definition in self._definitions
+            if match(definition)])
+
+    def narrow(self, names=None, types=None):
+        """Drop the artifacts not named one of names or of one of types
+
+        Unlike filtering the items, this doesn't load the artifacts.
+        """
+        match = self._matching(names, types)
+        if self.loaded:
+            self._items = [
+                artifact for artifact in self._items if match(artifact)]
+        else:
+            self._definitions = [
+                definition for definition in self._definitions
+                if match(definition)]
+
+    def outlines(self):
+        """Return the artifacts without checking out any repository
+
+        Artifacts from other repositories that aren't loaded yet are
+        returned as a plain Artifact of their entry in the products, with
+        only the name and dependencies the entry has.
+        """
+        if self.loaded:
+            return list(self._items)
+        self._load_definitions([
+            definition for definition in self._definitions
+            if definition.repo is None])
+        return [
+            definition.artifact or Artifact(definition.data)
+            for definition in self._definitions]
+
+    def _load_definitions(self, definitions):
+        """Load the artifacts of definitions not loaded yet"""
+        pending = [
+            definition for definition in definitions
+            if definition.artifact is None]
+        if pending:
+            artifacts = self._load_entries(
+                [(definition.cls, definition.data) for definition in pending],
+                workspace=self.workspace,
+                repopath=self.repopath)
+            for definition, artifact in zip(pending, artifacts):
+                definition.artifact = artifact
+        return [definition.artifact for definition in definitions]
+
+    @staticmethod
+    def _entries(data):
+        """Return the (class, definition) of each artifact in data"""
+        entries = []
+        for key, cls in _products_registry.items():
+            if key in data:
+                for artifact_def in data[key]:
+                    entries.append((cls, artifact_def))
+        return entries
+
     def load(self,
              data,
              workspace=None,
@@ -171,79 +493,150 @@ class Artifacts(object):
 
         Requires dictionary containing the list of artifact entries
         to be loaded.
+
+        Entries with a repo are found in the artifacts of that repository,
+        checked out at the entry's branch if it has one. All the
+        repositories are checked out in parallel first, and each one's
+        product files are only loaded once.
         """
-        artifacts = []
+        return self._load_entries(
+            self._entries(data), workspace, repopath, **metadata)
+
+    def _load_entries(self, entries, workspace=None, repopath=None,
+                      **metadata):
+        # Names of the artifacts wanted from each repository
+        repos = OrderedDict()
+        for cls, artifact_def in entries:
+            repo = _repo_of(artifact_def)
+            if repo:
+                repos.setdefault(repo, []).append(artifact_def['name'])
+        self._load_repos(repos, workspace, metadata)
 
-        for key, cls in _products_registry.items():
-            if key in data:
-                for artifact_def in data[key]:
-                    repourl = artifact_def.get('repo', None)
-                    if repourl and repourl != '.':
-                        # checkout repo and load
-                        # path begins with / and can end with a .git, both
-                        # of which we remove
-                        path = urllib.parse.urlparse(repourl).path. \
-                            rsplit('.git', 1)[0]. \
-                            split('/', 1)[1]
-
-                        # See if we have the remote repository checked out
-                        # in the workspace, otherwise check it out.
-                        destpath = None
-                        if workspace:
-                            local_dev_path = os.path.join(
-                                workspace,
-                                path.split('/', 1).pop())
-
-                            if os.path.exists(local_dev_path):
-                                destpath = local_dev_path
-                        if not destpath:
-                            destpath = os.path.join(self.tempdir, path)
-                            if not os.path.exists(destpath):
-                                git.Repo.clone_from(
-                                    repourl,
-                                    destpath,
-                                    depth=1,
-                                    single_branch=True)
-
-                        items = self.load(
-                            map(
-                                lambda conf: os.path.join(
-                                    destpath, conf),
-                                DEFAULT_PRODUCT_FILES),
-                            # Override default system metadata
-                            repopath=destpath,
-                            **metadata
-                        )
-                        if not items:
-                            logging.warning(
-                                'No artifacts found in %s - missing %s?',
-                                repourl, CANONICAL_PRODUCT_FILE
-                            )
-                        nameditems = [
-                            item for item in items
-                            if item.name == artifact_def.get('name')]
-                        if not nameditems:
-                            raise Exception(
-                                'Failed to find %s in %s - check %s' % (
-                                    artifact_def['name'], repourl,
-                                    CANONICAL_PRODUCT_FILE))
-                        elif len(nameditems) > 1:
-                            raise Exception(
-                                'Found %d of %s in %s' % (
-                                    len(nameditems),
-                                    artifact_def['name'],
-                                    repourl))
-
-                        artifact = nameditems[0]
-                    else:
-                        artifact = cls(artifact_def)
-                        artifact.metadata['repopath'] = repopath
-                        artifact.metadata.update(metadata)
+        artifacts = []
+        for cls, artifact_def in entries:
+            repo = _repo_of(artifact_def)
+            if repo:
+                artifact = self._find_artifact(repo, artifact_def['name'])
+            else:
+                artifact = cls(artifact_def)
+                artifact.metadata['repopath'] = repopath
+                artifact.metadata.update(metadata)
 
-                    artifacts.append(artifact)
+            artifacts.append(artifact)
 
         return artifacts
 
+    def _load_repos(self, repos, workspace, metadata):
+        """Check out the repositories and index the artifacts of each
+
+        repos is a dictionary of (url, branch) tuples to the names of the
+        artifacts wanted from it. Repositories the git cache checks out
+        sparsely are extended with the paths these artifacts need.
+        """
+        wanted = repos
+        repos = [repo for repo in repos if repo not in self._repos]
+
+        # Different urls of the same repository share one checkout
+        checkouts = OrderedDict()
+        for repo in repos:
+            checkouts.setdefault(
+                self._repo_path(repo, workspace), []).append(repo)
+
+        if checkouts:
+            workers = min(len(checkouts), REPO_LOAD_WORKERS)
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                futures = [
+                    executor.submit(self._checkout, urls[0], destpath)
+                    for destpath, urls in checkouts.items()]
+            for future in futures:
+                # Raise any failure to check out a repository
+                future.result()
+
+        for destpath, urls in checkouts.items():
+            for repo in urls:
+                # Mark as loading, so a repository referring back to one
+                # being loaded doesn't recurse forever.
+                self._repos[repo] = None
+            items = self.load(
+                read_product_files(
+                    os.path.join(destpath, conf)
+                    for conf in DEFAULT_PRODUCT_FILES),
+                # Override default system metadata
+                repopath=destpath,
+                **metadata
+            )
+            if not items:
+                logging.warning(
+                    'No artifacts found in %s - missing %s?',
+                    urls[0][0], CANONICAL_PRODUCT_FILE
+                )
+            index = defaultdict(list)
+            for item in items:
+                index[item.name].append(item)
+            for repo in urls:
+                self._repos[repo] = index
+
+        # Check out what the wanted artifacts are built from, including
+        # repositories loaded before for other artifacts.
+        for repo, names in wanted.items():
+            destpath = self._repo_path(repo, workspace)
+            index = self._repos[repo]
+            if destpath in self._checkouts and index is not None:
+                self.git_cache.add_paths(destpath, _source_paths(
+                    destpath,
+                    [item for name in names for item in index.get(name, [])]))
+
+    def _repo_path(self, repo, workspace):
+        """Return where the repository is, or is to be, checked out"""
+        repourl, branch = repo
+        # path begins with / and can end with a .git, both
+        # of which we remove
+        path = urllib.parse.urlparse(repourl).path. \
+            rsplit('.git', 1)[0]. \
+            split('/', 1)[1]
+
+        # See if we have the remote repository checked out
+        # in the workspace, otherwise check it out.
+        if workspace:
+            local_dev_path = os.path.join(
+                workspace,
+                path.split('/', 1).pop())
+
+            if os.path.exists(local_dev_path):
+                return local_dev_path
+        if branch:
+            path = '%s@%s' % (path, branch)
+        return os.path.join(self.tempdir, path)
+
+    def _checkout(self, repo, destpath):
+        if not os.path.exists(destpath):
+            repourl, branch = repo
+            logging.debug('Checking out %s to %s', repourl, destpath)
+            self.git_cache.checkout(repourl, destpath, branch)
+            self._checkouts.add(destpath)
+
+    def _find_artifact(self, repo, name):
+        repourl, branch = repo
+        if branch:
+            repourl = '%s (%s)' % (repourl, branch)
+        index = self._repos[repo]
+        if index is None:
+            raise Exception(
+                'Repository %s refers back to itself' % repourl)
+        nameditems = index.get(name, [])
+        if not nameditems:
+            raise Exception(
+                'Failed to find %s in %s - check %s' % (
+                    name, repourl,
+                    CANONICAL_PRODUCT_FILE))
+        elif len(nameditems) > 1:
+            raise Exception(
+                'Found %d of %s in %s' % (
+                    len(nameditems),
+                    name,
+                    repourl))
+        return nameditems[0]
+
     def __iter__(self):
         for item in self.items:
             yield item
@@ -332,32 +725,104 @@ class fall_back(object):
         return fall_back_f
 
 
-class DummyResult(object):
-
-    def __init__(self, result):
-        self._value = result
-
-    def get(self, timeout=None):
-        return self._value
-
-    def ready(self):
-        return False
-
-    def wait(self):
-        return
-
-
 class Windlass(object):
 
     def __init__(self,
                  products_to_parse=None,
                  artifacts=None,
                  workspace=None,
-                 pool_size=4):
+                 pool_size=4,
+                 executor='process',
+                 limits=None,
+                 start_method=None,
+                 schedule='lpt',
+                 history=None,
+                 journal=None,
+                 keep_going=False,
+                 work_queue=None,
+                 git_cache=None,
+                 config_cache=None,
+                 concurrency=DEFAULT_CONCURRENCY):
+        """Manage a set of artifacts
+
+        executor - how artifacts are processed in parallel. 'process' uses a
+                   pool of worker processes, 'thread' uses a pool of threads
+                   which avoids forking and pickling the arguments for work
+                   that is waiting on the docker daemon or http. 'asyncio'
+                   processes artifacts with arun on an event loop, up to
+                   concurrency at once rather than pool_size. A
+                   concurrent.futures.Executor can also be passed in.
+
+        limits   - dictionary capping how many workers use a resource at the
+                   same time, across all workers. See windlass.limits for
+                   the resources, e.g. {'build': 2, 'docker': 8, 'host': 4}.
+                   Limits are shared with worker processes of the 'process'
+                   executor, an executor passed in must run in this process
+                   for them to apply.
+
+        start_method - multiprocessing start method of the 'process'
+                   executor's workers. With 'forkserver' the workers are
+                   forked from a server process that has preloaded windlass
+                   and its dependencies, so they start warm and fork-safe.
+
+        schedule - 'lpt' starts the artifacts with the most expected work
+                   left on their path through the dependencies first,
+                   based on the durations in history. 'fifo' starts them
+                   in the order they become ready.
+
+        history  - windlass.history.History, or the path of its file, the
+                   duration of each operation on each artifact is recorded
+                   in. No durations are recorded if this is None.
+
+        journal  - windlass.journal.Journal each completed operation is
+                   written to as it finishes. If the journal is resuming
+                   the operations already in it are skipped, so a rerun
+                   after a failure only does the remaining work.
+
+        keep_going - carry on processing after a failure, letting the work
+                   already started finish and skipping only what depends
+                   on the failure. A MultipleFailuresException with every
+                   failure is raised at the end, instead of the first
+                   failure terminating the pool.
+
+        work_queue - windlass.workqueue.WorkQueue shared with windlass
+                   processes on other hosts running the same products.
+                   Each artifact is processed by the process that claims
+                   it in the queue, and run returns once all the artifacts
+                   are done in every process. Not supported by the
+                   'asyncio' executor.
+
+        git_cache - windlass.gitcache.GitCache the repositories of remote
+                   artifacts are checked out from.
+
+        config_cache - windlass.configcache.ConfigCache the configuration
+                   merged from products_to_parse is kept in, keyed by
+                   their contents, so later runs don't parse them again.
+
+        concurrency - how many artifacts the 'asyncio' executor transfers
+                   at the same time, bounded by limits. See arun.
+
+        Used as a context manager Windlass keeps one pool of workers for
+        all the runs, e.g. build() followed by upload(), otherwise a pool
+        is created for each run.
+        """
 
         self.pool_size = pool_size
+        if executor not in EXECUTORS and not isinstance(
+                executor, concurrent.futures.Executor):
+            raise ValueError('Unknown executor %s, expected one of %s' % (
+                executor, ', '.join(EXECUTORS)))
+        self.executor = executor
+        self.concurrency = concurrency
+
+        self.limits = limits or {}
+        for resource in self.limits:
+            if resource not in windlass.limits.RESOURCES:
+                raise ValueError('Unknown resource %s, expected one of %s' % (
+                    resource, ', '.join(windlass.limits.RESOURCES)))
 
         self.configs = []
+        self.config_cache = config_cache
         self.max_retries = 3
         self.retry_backoff = 5
 
@@ -366,89 +831,200 @@ class Windlass(object):
         else:
             self.artifacts = Artifacts(
                 self._load_config(products_to_parse),
-                workspace
+                workspace,
+                git_cache=git_cache
             )
 
+        if start_method is not None and \
+                start_method not in multiprocessing.get_all_start_methods():
+            raise ValueError('Unknown start method %s' % start_method)
+        self.start_method = start_method
+
+        if schedule not in SCHEDULES:
+            raise ValueError('Unknown schedule %s, expected one of %s' % (
+                schedule, ', '.join(SCHEDULES)))
+        self.schedule = schedule
+        if isinstance(history, str):
+            history = windlass.history.History(history)
+        self.history = history
+        self.journal = journal
+        self.keep_going = keep_going
+
+        if work_queue is not None and executor == 'asyncio':
+            raise ValueError(
+                'A work queue is not supported by the asyncio executor')
+        self.work_queue = work_queue
+
         self._running = False
-        self._failed = False
 
-    def _load_config(self, configs):
-        data = {}
+        # Set while used as a context manager
+        self._pool = None
+        self._pool_context = None
+        self._semaphores = None
 
+    def _load_config(self, configs):
+        sources = []
         for cfile in configs:
             if os.path.exists(cfile):
                 logging.debug("Reading file '%s' for config data", cfile)
                 with open(cfile, 'r') as f:
-                    conf_data = yaml.load(f.read(), Loader=yaml.SafeLoader)
+                    sources.append(f.read())
                 self.configs.append(cfile)
             elif hasattr(cfile, 'read'):
                 logging.debug("Reading object '%s' for config data", cfile)
-                conf_data = yaml.load(cfile.read(), Loader=yaml.SafeLoader)
+                sources.append(cfile.read())
                 self.configs.append(str(cfile))
             else:
                 logging.debug(
                     "Config '%s' is not a valid file or file like object, "
                     "skipping", cfile
                 )
-                continue
 
-            # TODO(kerrin) this is not a deep merge, and is pretty poor.
-            # Will lose data on you.
-            data.update(conf_data)
+        def parse():
+            data = {}
+            for source in sources:
+                data = windlass.tools.deep_merge(
+                    data, yaml.load(source, Loader=YAML_LOADER) or {})
+            return data
+
+        if self.config_cache is not None and sources:
+            data = self.config_cache.load(sources, parse)
+        else:
+            data = parse()
 
         # if nothing loaded, provide some automatic configuration
         if not data:
-            # check if in a git repo to define the image name based on an
-            # assumed <org>/<repo> naming, if there is a way to get the base
-            # url it would make it easier to handle hosting services that
-            # support multiple levels of nesting
-            try:
-                repo = git.Repo()
-            except git.exc.InvalidGitRepositoryError:
-                # not a git repo so can't perform any further auto config
-                return data
-
-            logging.info("Auto config from repo")
-            # handle multiple remotes for dev envs
-            try:
-                remote = repo.head.reference.tracking_branch().remote_name
-            except Exception:
-                remote = 'origin'
-            # consider replacing with giturlparse or git-url-parse if any
-            # issues encountered with parsing
-            repourl = next(repo.remotes[remote].urls)
-            urlparts = re.split(':|/', re.sub('.git$', '', repourl))
-            name = '/'.join(urlparts[-2:])
-
-            if os.path.exists(os.path.join(repo.working_dir, 'Dockerfile')):
-
-                data = {
-                    'images': [
-                        {
-                            'name': name.lower(),  # docker limitation
-                            'context': '.',
-                            'floating_tag': 'latest',
-                        }
-                    ]
-                }
-                self.configs.append("<auto config>")
+            data = self._auto_config()
 
         logging.debug("final config: %s", data)
         return data
 
-    def _er_cb(self, result):
-        # Runs in same process as the run method, but not the main thread
-        logging.error("Error callback called processing artifacts")
-        # This is an error, so save the error so that we can raise
-        # it later. Provides more useful error handling
-        self._failed = result
+    def _auto_config(self):
+        """Return the configuration of the current repository if it has a
+        Dockerfile, cached by the state of the repository it depends on.
+        """
+        state = None
+        if self.config_cache is not None:
+            state = _git_state(os.getcwd())
+        if state is None:
+            data = _read_auto_config()
+        else:
+            data = self.config_cache.load(state, _read_auto_config)
+        if data:
+            self.configs.append("<auto config>")
+        return data
 
-    def run(self, processor, type=None, artifact_name=None, parallel=True,
-            **kwargs):
-        if self._running:
-            raise Exception('Windlass is already processing these artifacts')
-        d = defaultdict(list)
-        for artifact in self.artifacts:
+    @contextlib.contextmanager
+    def _configure_limits(self, shared=False):
+        """Enforce self.limits for the duration of a run
+
+        If shared the semaphores are kept in a manager process so they can
+        be passed to worker processes. Yields the semaphores, or None when
+        there are no limits.
+        """
+        if not self.limits:
+            yield None
+            return
+
+        manager = None
+        if shared:
+            manager = windlass.limits.LimitsManager()
+            manager.start()
+            semaphores = manager.Semaphores(self.limits)
+        else:
+            semaphores = windlass.limits.Semaphores(self.limits)
+        # Work run in this process, threads or serially, is limited too.
+        windlass.limits.configure(semaphores)
+        try:
+            yield semaphores
+        finally:
+            windlass.limits.configure(None)
+            if manager:
+                manager.shutdown()
+
+    def __enter__(self):
+        self._pool_context = contextlib.ExitStack()
+        self._semaphores = self._pool_context.enter_context(
+            self._configure_limits(shared=self.executor == 'process'))
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shutdown the pool kept when used as a context manager"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self._pool_context is not None:
+            self._pool_context.close()
+            self._pool_context = None
+            self._semaphores = None
+
+    @contextlib.contextmanager
+    def _run_pool(self, parallel=True):
+        """Provide the pool for a run, None when not running in parallel"""
+        if self._pool_context is not None:
+            # Reuse the pool across runs. A failed run terminates the pool,
+            # so it is created again by the next run.
+            if parallel and self._pool is None:
+                self._pool = self._create_pool(self._semaphores)
+            try:
+                yield self._pool if parallel else None
+            except BaseException:
+                if self._pool is not None:
+                    self._terminate_pool(self._pool)
+                    self._pool = None
+                raise
+            return
+
+        shared = parallel and self.executor == 'process'
+        with self._configure_limits(shared=shared) as semaphores:
+            pool = self._create_pool(semaphores) if parallel else None
+            try:
+                yield pool
+            except BaseException:
+                if pool is not None:
+                    self._terminate_pool(pool)
+                raise
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def _terminate_pool(self, pool):
+        # pool.join will not abort running jobs
+        logging.error("Terminating pool")
+        pool.terminate()
+        logging.debug("Pool terminated")
+
+    def _create_pool(self, semaphores=None):
+        if self.executor == 'process':
+            initargs = {
+                'initializer': _init_worker,
+                'initargs': (semaphores, windlass.fingerprint.excluded()),
+            }
+            if self.start_method is None:
+                return multiprocessing.Pool(self.pool_size, **initargs)
+            context = multiprocessing.get_context(self.start_method)
+            if self.start_method == 'forkserver':
+                context.set_forkserver_preload(PRELOAD_MODULES)
+            return context.Pool(self.pool_size, **initargs)
+        elif self.executor == 'thread':
+            return windlass.scheduler.ExecutorPool(
+                concurrent.futures.ThreadPoolExecutor(self.pool_size),
+                owned=True)
+        return windlass.scheduler.ExecutorPool(self.executor)
+
+    def _select_artifacts(self, type=None, artifact_name=None):
+        candidates = self.artifacts
+        if isinstance(self.artifacts, Artifacts):
+            # Only load the artifacts selected
+            candidates = self.artifacts.select(
+                names=None if artifact_name is None else [artifact_name],
+                types=None if type is None else [type])
+        artifacts = []
+        for artifact in candidates:
             if artifact_name is not None and artifact.name != artifact_name:
                 logging.debug(
                     'Skipping artifact %s (--artifact-name)' % artifact.name)
@@ -457,69 +1033,355 @@ class Windlass(object):
                 logging.debug(
                     'Skipping artifact %s because wrong type' % artifact.name)
                 continue
-            k = artifact.priority
-            d[k].append(artifact)
-
-        # Reset events.
-        results = []
-
-        self._failed = False
-        pool = multiprocessing.Pool(self.pool_size)
-        for i in reversed(sorted(d.keys())):
-            for artifact in d[i]:
-                if parallel:
-                    result = pool.apply_async(
-                        processor,
-                        args=(
-                            artifact,
-                        ),
-                        kwds=kwargs,
-                        error_callback=self._er_cb)
-                    self._running = True
-                else:
-                    # Call processor and wrap the result in a
-                    # dummy result object
-                    result = DummyResult(
-                        processor(artifact, **kwargs)
-                    )
+            artifacts.append(artifact)
+        return artifacts
 
-                result.artifact = artifact
-                results.append(result)
-
-            # pool.join will not abort running jobs
-            def finished():
-                return len([r for r in results if not r.ready()]) == 0
-
-            # Wait for the current priority artifacts to be processed
-            while self._running and not self._failed and not finished():
-                for result in results:
-                    if not result.ready():
-                        result.wait(.2)
-
-            if self._failed:
-                # The error callback was called. This sets _failed to the
-                # exception object raised by the process
-                # Wait for pool to terminate and then raise exception
-                logging.error("Terminating pool")
-                pool.terminate()
-                logging.debug("Pool terminated")
-                self._running = False
+    def _create_graph(self, artifacts, followups=None, operation=None):
+        # Each artifact is started as soon as the artifacts it depends on
+        # are processed, priorities are converted to dependencies.
+        graph = windlass.scheduler.DependencyGraph.from_artifacts(artifacts)
+        if followups is not None:
+            for artifact in artifacts:
+                for task in followups(artifact):
+                    graph.add(task, [artifact])
+        if self.schedule == 'lpt' and self.history is not None:
+            graph.prioritise(
+                functools.partial(self._expected_duration, operation))
+        return graph
+
+    def _expected_duration(self, operation, node):
+        name, operation = _operation(node, operation)
+        seconds = self.history.expected(name, operation)
+        if seconds is None:
+            # Artifacts that haven't been seen before are assumed to take
+            # as long as the others.
+            seconds = self.history.average(operation) or 0
+        return seconds
+
+    def _record_duration(self, node, operation, seconds):
+        if self.history is not None:
+            name, operation = _operation(node, operation)
+            self.history.record(name, operation, seconds)
+
+    def _journal_entry(self, node, operation, kwargs):
+        artifact, _, kwds = _task(node, None, kwargs)
+        name, operation = _operation(node, operation)
+        key = getattr(node, 'key', None)
+        return {
+            'artifact': name,
+            'operation': operation,
+            'version': kwds.get('version') or artifact.version,
+            'key': None if key is None else str(key),
+        }
+
+    def _skip_completed(self, node, operation, kwargs):
+        """Return True if the journal has node as completed already"""
+        if self.journal is None or not self.journal.resume:
+            return False
+        entry = self._journal_entry(node, operation, kwargs)
+        if self.journal.completed(**entry) is None:
+            return False
+        logging.info(
+            '%s: %s already completed, skipping',
+            node.name, entry['operation'])
+        return True
+
+    def _journal_completed(self, node, operation, kwargs, result):
+        if self.journal is not None:
+            self.journal.record(
+                digest=result if isinstance(result, str) else None,
+                **self._journal_entry(node, operation, kwargs))
+
+    def _failure(self, graph, failures, node, error):
+        """Record a failure of a keep going run, skipping its dependants"""
+        logging.error('%s: failed: %s', node.name, error)
+        skipped = graph.fail(node)
+        for dependant in skipped:
+            logging.warning(
+                '%s: skipped as it depends on %s', dependant.name, node.name)
+        failures.append((node, error, skipped))
+
+    def _raise_failures(self, failures):
+        if not failures:
+            return
+        e = windlass.exc.MultipleFailuresException(
+            '%d failed: %s' % (
+                len(failures),
+                ', '.join(node.name for node, _, _ in failures)),
+            failures=[(node.name, error) for node, error, _ in failures],
+            skipped=[
+                dependant.name
+                for _, _, skipped in failures for dependant in skipped])
+        logging.error(e.debug_message())
+        raise e
+
+    def _save_history(self):
+        if self.history is not None:
+            try:
+                self.history.save()
+            except OSError as e:
+                logging.warning('Failed to save durations: %s', e)
+
+    def run(self, processor, type=None, artifact_name=None, parallel=True,
+            followups=None, operation=None, **kwargs):
+        """Call processor(artifact, **kwargs) for each artifact
+
+        followups - optional callable returning a list of
+                    windlass.scheduler.Task for an artifact. These are
+                    scheduled as separate work once the artifact has been
+                    processed, so they run in parallel with each other and
+                    with other artifacts. The Task kwargs are added to the
+                    kwargs passed here.
+
+        operation - name the durations of processor are recorded under in
+                    the history, defaults to the name of processor.
+
+        Returns the result of processor for each artifact.
+        """
+        operation = operation or _operation_name(processor)
+        if self.executor == 'asyncio':
+            return asyncio.run(self.arun(
+                processor,
+                type=type,
+                artifact_name=artifact_name,
+                concurrency=None if parallel else 1,
+                followups=followups,
+                operation=operation,
+                **kwargs))
 
-                if isinstance(self._failed, (
-                        windlass.exc.WindlassException
-                )):
-                    logging.error(self._failed.debug_message())
+        if self._running:
+            raise Exception('Windlass is already processing these artifacts')
+        artifacts = self._select_artifacts(type, artifact_name)
+        graph = self._create_graph(artifacts, followups, operation)
+
+        # Worker callbacks run in a thread of this process and push
+        # (node, result, error) events here, so we can block until
+        # something finishes instead of polling every result.
+        events = queue.Queue()
 
-                raise self._failed
+        def done_cb(node, result):
+            events.put((node, result, None))
+
+        def error_cb(node, error):
+            events.put((node, None, error))
+
+        retd = {}
+        failures = []
+        running = 0
+        coordinator = None
+
+        def submit(node):
+            nonlocal running
+            artifact, func, kwds = _task(node, processor, kwargs)
+            if parallel:
+                pool.apply_async(
+                    _timed,
+                    args=(
+                        func,
+                        artifact,
+                        kwds,
+                    ),
+                    callback=functools.partial(done_cb, node),
+                    error_callback=functools.partial(error_cb, node))
+                self._running = True
+                running += 1
+                return
+            try:
+                result = _timed(func, artifact, kwds)
+            except Exception as e:
+                failed(node, e)
+            else:
+                succeeded(node, result)
+
+        def succeeded(node, result):
+            result, seconds = result
+            self._record_duration(node, operation, seconds)
+            self._journal_completed(node, operation, kwargs, result)
+            if not isinstance(node, windlass.scheduler.Task):
+                retd[node.name] = result
+            if coordinator is not None:
+                coordinator.done(node)
+            graph.done(node)
+
+        def failed(node, error):
+            if coordinator is not None:
+                coordinator.failed(node, error)
+            if self.keep_going:
+                self._failure(graph, failures, node, error)
+                return
+
+            # Raising the error terminates the pool.
+            self._running = False
+            if isinstance(error, windlass.exc.WindlassException):
+                logging.error(error.debug_message())
+            raise error
+
+        try:
+            with contextlib.ExitStack() as stack:
+                pool = stack.enter_context(self._run_pool(parallel))
+                if self.work_queue is not None:
+                    coordinator = stack.enter_context(
+                        windlass.workqueue.Coordinator(
+                            self.work_queue, graph, operation))
+
+                while not graph.finished():
+                    for node in graph.ready():
+                        if self._skip_completed(node, operation, kwargs):
+                            graph.done(node)
+                        elif coordinator is None or coordinator.claim(node):
+                            submit(node)
+
+                    timeout = None
+                    if coordinator is not None:
+                        finished, reclaimed = coordinator.poll()
+                        for node, error in finished:
+                            if error is None:
+                                graph.done(node)
+                            else:
+                                failed(node, error)
+                        for node in reclaimed:
+                            submit(node)
+                        if finished or reclaimed:
+                            continue
+                        if coordinator.waiting:
+                            # Check on the other processes while waiting
+                            timeout = self.work_queue.poll_interval
+
+                    if not running:
+                        if timeout:
+                            time.sleep(timeout)
+                        continue
+
+                    # Wait for the next artifact to be processed
+                    try:
+                        node, result, error = events.get(timeout=timeout)
+                    except queue.Empty:
+                        continue
+                    running -= 1
+                    if error is None:
+                        succeeded(node, result)
+                    else:
+                        failed(node, error)
+        finally:
+            # Keep the durations of the work that finished even on failure
+            self._save_history()
+            # The docker clients of this process, e.g. of threads in the
+            # pool, are only reused within a run
+            windlass.dockerclient.close()
 
         # Allow future calls to run on the same set of artifacts to work
         self._running = False
+        self._raise_failures(failures)
+
+        return [retd.get(name) for name in self._artifact_names()]
+
+    async def arun(self, processor, type=None, artifact_name=None,
+                   concurrency=None, followups=None, operation=None,
+                   **kwargs):
+        """Process the artifacts on the running asyncio event loop
+
+        processor may be a coroutine function, such as an artifact's
+        aupload, otherwise it is run with run_blocking. At most
+        concurrency artifacts, defaulting to self.concurrency, are
+        processed at the same time, and the blocking calls they make run
+        on a pool of as many threads, so each transfer has a thread while
+        the limits bound how many use a host or the docker daemon at once.
+        See run for followups and operation.
+        """
+        if self._running:
+            raise Exception('Windlass is already processing these artifacts')
+        operation = operation or _operation_name(processor)
+        artifacts = self._select_artifacts(type, artifact_name)
+        graph = self._create_graph(artifacts, followups, operation)
+        concurrency = concurrency or self.concurrency
+        semaphore = asyncio.Semaphore(concurrency)
+        executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+        # Tasks created from here on copy the context, and with it this
+        executor_token = _blocking_executor.set(executor)
+
+        async def process(node):
+            artifact, func, kwds = _task(node, processor, kwargs)
+            async with semaphore:
+                start = time.monotonic()
+                if asyncio.iscoroutinefunction(func):
+                    result = await func(artifact, **kwds)
+                else:
+                    result = await run_blocking(func, artifact, **kwds)
+                self._record_duration(
+                    node, operation, time.monotonic() - start)
+                self._journal_completed(node, operation, kwargs, result)
+                return result
 
         retd = {}
-        for result in results:
-            retd[result.artifact.name] = result.get()
+        tasks = {}
+        failures = []
+        self._running = True
+        with self._configure_limits():
+            try:
+                while not graph.finished():
+                    for node in graph.ready():
+                        if self._skip_completed(node, operation, kwargs):
+                            graph.done(node)
+                            continue
+                        tasks[asyncio.ensure_future(process(node))] = node
+                    if not tasks:
+                        continue
+
+                    done, _ = await asyncio.wait(
+                        tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        node = tasks.pop(task)
+                        if task.exception() is not None:
+                            if not self.keep_going:
+                                raise task.exception()
+                            self._failure(
+                                graph, failures, node, task.exception())
+                            continue
+                        if not isinstance(node, windlass.scheduler.Task):
+                            retd[node.name] = task.result()
+                        graph.done(node)
+            except Exception as e:
+                logging.error("Cancelling remaining artifacts")
+                for task in tasks:
+                    task.cancel()
+                if tasks:
+                    await asyncio.wait(tasks)
+                if isinstance(e, windlass.exc.WindlassException):
+                    logging.error(e.debug_message())
+                raise
+            finally:
+                self._running = False
+                _blocking_executor.reset(executor_token)
+                # Calls of cancelled tasks finish on their own, without
+                # blocking the event loop
+                executor.shutdown(wait=False)
+                self._save_history()
+                windlass.dockerclient.close()
+
+        self._raise_failures(failures)
+        return [retd.get(name) for name in self._artifact_names()]
+
+    async def adownload(self, version=None, type=None, concurrency=None,
+                        **kwargs):
+        """Download the artifacts concurrently on the asyncio event loop"""
+        return await self.arun(
+            _adownload_artifact,
+            type=type,
+            concurrency=concurrency,
+            operation='download',
+            version=version,
+            **kwargs)
 
-        return [retd.get(a.name) for a in self.artifacts]
+    async def aupload(self, version=None, type=None, concurrency=None,
+                      **kwargs):
+        """Upload the artifacts concurrently on the asyncio event loop"""
+        return await self.arun(
+            _aupload_artifact,
+            type=type,
+            concurrency=concurrency,
+            operation='upload',
+            version=version,
+            **kwargs)
 
     def set_version(self, version):
         for artifact in self.artifacts:
@@ -533,8 +1395,83 @@ class Windlass(object):
 
         return list_items
 
+    def plan(self, operation='build', type=None, artifact_name=None,
+             followups=None, **kwargs):
+        """Return what run would do, without processing any artifact
+
+        Takes the arguments of the run it plans, with operation naming
+        what is done to each artifact, e.g. 'build' or 'download', or None
+        if only the followups are run. Returns a json serialisable
+        dictionary of the actions on each artifact, with their expected
+        seconds from the history and the bytes they transfer, None when
+        not known. Actions completed in a resumed journal are
+        'skip-completed'.
+
+        total_seconds is the expected work of the run, and
+        critical_path_seconds the longest chain of work that depends on
+        each other, i.e. how long the run takes with enough workers.
+        Actions with no recorded durations count as the average of their
+        operation, and are counted in unknown_durations.
+        """
+        artifacts = self._select_artifacts(type, artifact_name)
+        graph = self._create_graph(artifacts, followups, operation)
+        planned = OrderedDict(
+            (artifact, {
+                'name': artifact.name,
+                'type': artifact.__class__.__name__,
+                'depends_on': list(artifact.depends_on),
+                'actions': [],
+            }) for artifact in artifacts)
+        # Each artifact followed by its tasks, in the order they were added
+        position = {artifact: i for i, artifact in enumerate(artifacts)}
+        nodes = sorted(graph.depends, key=lambda node: (
+            position[_task(node, None, {})[0]],
+            isinstance(node, windlass.scheduler.Task)))
+
+        costs = {}
+        unknown = 0
+        for node in nodes:
+            artifact, _, kwds = _task(node, None, kwargs)
+            name, op = _operation(node, operation)
+            entry = planned[artifact]
+            if op is None:
+                costs[node] = 0
+                continue
+
+            if self._skip_completed(node, operation, kwargs):
+                action = {'action': 'skip-completed', 'bytes': 0}
+            else:
+                action = artifact.plan(op, **kwds)
+            seconds = None
+            if action['action'].startswith('skip'):
+                seconds = 0
+            elif self.history is not None:
+                seconds = self.history.expected(name, op)
+            if seconds is None:
+                unknown += 1
+            costs[node] = seconds if seconds is not None else (
+                self.history.average(op) or 0
+                if self.history is not None else 0)
+
+            key = getattr(node, 'key', None)
+            action.update({
+                'operation': op,
+                'key': None if key is None else str(key),
+                'expected_seconds': seconds,
+            })
+            entry['actions'].append(action)
+
+        graph.prioritise(costs.get)
+        return {
+            'operation': operation,
+            'artifacts': list(planned.values()),
+            'total_seconds': sum(costs.values()),
+            'critical_path_seconds': max(graph.ranks.values(), default=0),
+            'unknown_durations': unknown,
+        }
+
     def build(self, parallel=True, **kwargs):
-        self.run(_build_artifact, parallel=parallel)
+        self.run(_build_artifact, parallel=parallel, operation='build')
 
     def download(self, version=None, type=None, parallel=True, **kwargs):
         """Download the artifact
@@ -544,9 +1481,11 @@ class Windlass(object):
         version - override the version of the artifacts
         """
         return self.run(
-            _download_artifact,
+            _adownload_artifact if self.executor == 'asyncio'
+            else _download_artifact,
             type=type,
             parallel=parallel,
+            operation='download',
             **kwargs)
 
     def upload(self, version=None, type=None, parallel=True, **kwargs):
@@ -560,9 +1499,11 @@ class Windlass(object):
         version - override the version of the artifacts
         """
         return self.run(
-            _upload_artifact,
+            _aupload_artifact if self.executor == 'asyncio'
+            else _upload_artifact,
             type=type,
             parallel=parallel,
+            operation='upload',
             version=version,
             **kwargs)
 
@@ -571,9 +1512,15 @@ class Windlass(object):
             _delete_artifact,
             type=type,
             parallel=parallel,
+            operation='delete',
             version=version,
             **kwargs)
 
+    def _artifact_names(self):
+        if isinstance(self.artifacts, Artifacts):
+            return self.artifacts.names()
+        return [artifact.name for artifact in self.artifacts]
+
     def filter_artifacts_in_place(self, filter_func):
         """Filter the artifacts list based on the supplied filter function.
 
@@ -581,9 +1528,46 @@ class Windlass(object):
         for each artifact.  Those artifacts for which the function returns
         True are kept and the others dropped.
         """
-        self.artifacts.items = [
-            i for i in self.artifacts.items if filter_func(i)
-        ]
+        if isinstance(self.artifacts, Artifacts):
+            self.artifacts.items = [
+                i for i in self.artifacts.items if filter_func(i)
+            ]
+        else:
+            self.artifacts = [i for i in self.artifacts if filter_func(i)]
+
+    def shard(self, index, count, history=None):
+        """Keep only the artifacts of shard index (from 1) of count
+
+        The artifacts are split by their durations in history, or the
+        size of what they are built from, so the shards take about the
+        same time. The history must be the same for every shard, so it is
+        not self.history, which the shards record their durations in. See
+        windlass.sharding.
+
+        Artifacts from other repositories that aren't loaded yet are
+        sharded by their entry in the products, without checking them
+        out, so their cost is only known from the history.
+
+        Returns the names of the artifacts of every shard.
+        """
+        if isinstance(self.artifacts, Artifacts):
+            artifacts = self.artifacts.outlines()
+            selected = windlass.sharding.select(
+                artifacts, index, count, history)
+            self.artifacts.narrow(
+                names=[artifact.name for artifact in selected])
+        else:
+            artifacts = list(self.artifacts)
+            selected = set(windlass.sharding.select(
+                artifacts, index, count, history))
+            self.filter_artifacts_in_place(lambda i: i in selected)
+        return [artifact.name for artifact in artifacts]
+
+
+def _init_worker(semaphores, excluded):
+    """Set up a worker process with the limits and exclusions of the run"""
+    windlass.limits.configure(semaphores)
+    windlass.fingerprint.exclude(*excluded)
 
 
 def _build_artifact(artifact):
@@ -602,6 +1586,52 @@ def _delete_artifact(artifact, version=None, **kwargs):
     return artifact.delete(version=version, **kwargs)
 
 
+async def _adownload_artifact(artifact, version=None, **kwargs):
+    return await artifact.adownload(version=version, **kwargs)
+
+
+async def _aupload_artifact(artifact, version=None, **kwargs):
+    return await artifact.aupload(version=version, **kwargs)
+
+
+def _task(node, processor, kwargs):
+    """Return the artifact, processor and kwargs to process a graph node"""
+    if isinstance(node, windlass.scheduler.Task):
+        kwds = dict(kwargs)
+        kwds.update(node.kwargs)
+        return node.artifact, node.processor, kwds
+    return node, processor, kwargs
+
+
+def _timed(func, artifact, kwargs):
+    """Return the result of processing artifact, and how long it took"""
+    start = time.monotonic()
+    result = func(artifact, **kwargs)
+    return result, time.monotonic() - start
+
+
+def _operation_name(processor):
+    return getattr(processor, '__name__', type(processor).__name__)
+
+
+def _operation(node, operation=None):
+    """Return the name of the artifact and operation of a graph node"""
+    if isinstance(node, windlass.scheduler.Task):
+        return node.artifact.name, node.operation
+    return node.name, operation
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking function without blocking the event loop
+
+    Within arun it runs on the threads of the run, sized to its
+    concurrency, otherwise on the default executor of the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _blocking_executor.get(), functools.partial(func, *args, **kwargs))
+
+
 def download(artifacts, parallel=True, **kwargs):
     g = Windlass(artifacts=artifacts)
     return g.download(parallel=parallel, **kwargs)
@@ -17,9 +17,6 @@
 import io
 import logging
 import os
-import requests
-import requests.auth
-import ruamel.yaml
 import subprocess
 import tarfile
 import tempfile
@@ -27,6 +24,7 @@ import yaml
 
 import windlass.api
 import windlass.exc
+import windlass.limits
 import windlass.retry
 
 
@@ -55,6 +53,9 @@ class Chart(windlass.api.Artifact):
         repopath = os.path.abspath('.')
         return os.path.join(repopath, self.data.get('location', ''), self.name)
 
+    def source_paths(self):
+        return [os.path.join(self.data.get('location', ''), self.name)]
+
     def get_chart_name(self, version):
         return '%s-%s.tgz' % (self.name, version)
 
@@ -65,7 +66,7 @@ class Chart(windlass.api.Artifact):
 
         return chart['version']
 
-    def build(self):
+    def build(self, **kwargs):
         "Builds local chart with developer specified version"
         chartdir = self.get_chart_dir()
         logging.info('Building %s in %s' % (self.name, chartdir))
@@ -79,6 +80,8 @@ class Chart(windlass.api.Artifact):
     @windlass.retry.simple()
     @windlass.api.fall_back('charts_url')
     def download(self, version=None, charts_url=None, **kwargs):
+        import requests
+
         if version is None and self.version is None:
             raise Exception('Must specify version of chart to download.')
 
@@ -88,9 +91,10 @@ class Chart(windlass.api.Artifact):
                 'charts_url is not specified. Unable to download charts')
 
         chart_url = self.url(version or self.version, charts_url)
-        resp = requests.get(
-            chart_url,
-            verify='/etc/ssl/certs')
+        with windlass.limits.limit('http', chart_url):
+            resp = requests.get(
+                chart_url,
+                verify='/etc/ssl/certs')
         if resp.status_code != 200:
             raise windlass.exc.RetryableFailure(
                 'Failed to download chart %s' % chart_url)
@@ -124,6 +128,8 @@ class Chart(windlass.api.Artifact):
         Internal method to make it easier to hanle closing
         the tarfile passed here automatically on exit.
         '''
+        import ruamel.yaml
+
         def get_data(filename):
             membername = os.path.join(self.name, filename)
             yaml = tarfile.extractfile(membername)
@@ -225,6 +231,8 @@ class Chart(windlass.api.Artifact):
                docker_user=None, docker_password=None,
                docker_image_registry=None,
                **kwargs):
+        import requests
+
         if 'remote' in kwargs:
             stream = None
             try:
@@ -288,15 +296,16 @@ class Chart(windlass.api.Artifact):
                 # Chart already exists so don't try and upload it again
                 logging.info('%s: Chart already exists at %s' % (
                     self.name, upload_chart_url))
-                return
+                return upload_chart_url
 
         # Artifact does not exist or we allow clobber, push it up.
         auth = requests.auth.HTTPBasicAuth(docker_user, docker_password)
-        resp = requests.put(
-            upload_chart_url,
-            data=data,
-            auth=auth,
-            verify='/etc/ssl/certs')
+        with windlass.limits.limit('http', upload_chart_url):
+            resp = requests.put(
+                upload_chart_url,
+                data=data,
+                auth=auth,
+                verify='/etc/ssl/certs')
         if resp.status_code in (
                 requests.codes.unauthorized, requests.codes.forbidden):
             # No retries in this case.
@@ -308,6 +317,7 @@ class Chart(windlass.api.Artifact):
                     resp.status_code, upload_chart_url))
 
         logging.info('%s: Successfully pushed chart' % self.name)
+        return upload_chart_url
 
     @windlass.api.fall_back('charts_url')
     def delete(self, version=None, charts_url=None, **kwargs):
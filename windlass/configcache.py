@@ -0,0 +1,91 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import windlass.tools
+
+DEFAULT_CONFIG_CACHE = windlass.tools.cache_dir('config')
+
+# Changed whenever what is cached for the same sources changes, e.g. how
+# products files are merged, so older entries are not used.
+FORMAT = b'windlass-config-2'
+
+
+class ConfigCache(object):
+    """Configuration parsed by earlier runs, keyed by what it was parsed from
+
+    Each entry is a pickle named by the hash of its sources, so a change
+    to any of them is a different entry and entries are never invalidated.
+    The directory is private to the user as the pickles are trusted.
+    """
+
+    def __init__(self, path=DEFAULT_CONFIG_CACHE):
+        self.path = path
+
+    @staticmethod
+    def key(sources):
+        """Return the key of the configuration parsed from sources
+
+        sources is a list of the str or bytes the configuration depends on.
+        """
+        digest = hashlib.sha256(FORMAT)
+        for source in sources:
+            if isinstance(source, str):
+                source = source.encode('utf-8')
+            # Prefix the length so different splits don't collide
+            digest.update(b'%d:' % len(source))
+            digest.update(source)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.path, key + '.pickle')
+
+    def get(self, key):
+        """Return the cached configuration of key, or None"""
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, OSError) as e:
+            logging.warning('Ignoring unreadable config cache %s: %s', key, e)
+            return None
+
+    def put(self, key, data):
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                'wb', dir=self.path, prefix='.', delete=False) as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, self._path(key))
+
+    def load(self, sources, parse):
+        """Return the configuration of sources, calling parse on a miss"""
+        key = self.key(sources)
+        data = self.get(key)
+        if data is None:
+            data = parse()
+            try:
+                self.put(key, data)
+            except OSError as e:
+                logging.warning('Not caching config %s: %s', key, e)
+        else:
+            logging.debug('Using cached config %s', key)
+        return data
@@ -0,0 +1,221 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import tempfile
+
+import windlass.fingerprint
+import windlass.tools
+
+DEFAULT_CONTEXT_CACHE = windlass.tools.cache_dir('contexts')
+
+# Changed whenever the tarballs made from the same files change
+FORMAT = b'windlass-context-1'
+
+# Bytes of tarballs kept in the cache, the least recently used are removed
+MAX_CACHE_BYTES = 4 << 30
+
+
+def _mount_uses_context(arguments):
+    for word in arguments.split():
+        if word.startswith('--mount='):
+            options = dict(
+                option.partition('=')[::2]
+                for option in word[len('--mount='):].split(','))
+            if options.get('type', 'bind') == 'bind' and \
+                    'from' not in options:
+                return True
+    return False
+
+
+def copy_sources(dockerfile):
+    """Return the sources in the context of COPY and ADD in a Dockerfile
+
+    Returns None if they can't all be worked out, e.g. if one uses an ARG,
+    or if a RUN mounts the context.
+    """
+    sources = []
+    for instruction, arguments in windlass.fingerprint.instructions(
+            dockerfile):
+        if instruction == 'RUN' and _mount_uses_context(arguments):
+            return None
+        if instruction not in ('COPY', 'ADD'):
+            continue
+        words = arguments.split()
+        flags = [word for word in words if word.startswith('--')]
+        if any(flag.startswith('--from=') for flag in flags):
+            # Copied from another stage or image
+            continue
+        arguments = ' '.join(word for word in words if word not in flags)
+        if arguments.startswith('['):
+            words = json.loads(arguments)
+        else:
+            words = arguments.split()
+        for source in words[:-1]:
+            if '$' in source or source.startswith('<<'):
+                return None
+            if '://' not in source:
+                sources.append(source)
+    return sources
+
+
+def narrow(names, sources):
+    """Return the names, paths in a context, used by any of sources
+
+    Matching is looser than docker's, so more may be used, never fewer.
+    """
+    patterns = []
+    for source in sources:
+        source = os.path.normpath(source.lstrip('/'))
+        if source == '.':
+            return list(names)
+        patterns.append(source)
+
+    def used(name):
+        parts = name.split('/')
+        for i in range(1, len(parts) + 1):
+            prefix = '/'.join(parts[:i])
+            for pattern in patterns:
+                if prefix == pattern or fnmatch.fnmatchcase(prefix, pattern):
+                    return True
+        return False
+
+    return [name for name in names if used(name)]
+
+
+def context_names(path, dockerfile=None, narrowed=False):
+    """Return the paths in the context of building path
+
+    If narrowed, these are only the paths copied by the Dockerfile, when
+    they can be worked out (see copy_sources).
+    """
+    dockerfile = dockerfile or 'Dockerfile'
+    names = windlass.fingerprint.context_files(
+        path, dockerfile, directories=True)
+    if not narrowed:
+        return names
+    with open(os.path.join(path, dockerfile)) as f:
+        sources = copy_sources(f.read())
+    if sources is None:
+        logging.debug('Sending all of context %s', path)
+        return names
+    kept = set(narrow(names, sources))
+    kept.update(set([dockerfile, '.dockerignore']) & set(names))
+    return sorted(kept)
+
+
+def write_context(path, names, fileobj):
+    with tarfile.open(fileobj=fileobj, mode='w') as tar:
+        for name in names:
+            tar.add(os.path.join(path, name), arcname=name, recursive=False)
+
+
+class ContextCache(object):
+    """Tarballs of build contexts, keyed by the stat of what is in them
+
+    Unchanged contexts reuse the tarball made by an earlier build. The
+    least recently used are removed to keep the cache under max_bytes.
+    """
+
+    def __init__(self, path=DEFAULT_CONTEXT_CACHE, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(path, names):
+        digest = hashlib.sha256(FORMAT)
+        for name in names:
+            st = os.lstat(os.path.join(path, name))
+            digest.update(('%s\0%o\0%d\0%d\0' % (
+                name, st.st_mode, st.st_size, st.st_mtime_ns)).encode(
+                    'utf-8', 'surrogateescape'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.path, key + '.tar')
+
+    def open(self, path, names):
+        """Return the tarball of names in path opened for reading"""
+        key = self.key(path, names)
+        try:
+            fileobj = open(self._path(key), 'rb')
+        except FileNotFoundError:
+            pass
+        else:
+            logging.debug('Using cached context %s of %s', key, path)
+            # Marks it as recently used, for prune
+            try:
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                pass
+            return fileobj
+
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                'wb', dir=self.path, prefix='.', delete=False) as f:
+            write_context(path, names, f)
+        os.replace(f.name, self._path(key))
+        fileobj = open(self._path(key), 'rb')
+        self.prune()
+        return fileobj
+
+    def prune(self):
+        """Remove the least recently used tarballs over max_bytes"""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.tar'):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_bytes:
+                logging.debug('Removing cached context %s', path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def in_context(dockerfile):
+    """Return whether a Dockerfile, relative to the context, is in it"""
+    dockerfile = os.path.normpath(dockerfile or 'Dockerfile')
+    return not os.path.isabs(dockerfile) and \
+        dockerfile.split(os.sep)[0] != os.pardir
+
+
+def build_context(path, dockerfile=None, narrowed=False, cache=None):
+    """Return the tarball docker is sent to build path, opened for reading
+
+    This honours .dockerignore, and if narrowed only has the files the
+    Dockerfile copies (see context_names). It is taken from, or added to,
+    cache, a ContextCache, if given.
+    """
+    names = context_names(path, dockerfile, narrowed)
+    if cache is not None:
+        return cache.open(path, names)
+    fileobj = tempfile.TemporaryFile()
+    write_context(path, names, fileobj)
+    fileobj.seek(0)
+    return fileobj
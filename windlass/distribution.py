@@ -0,0 +1,154 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import logging
+import re
+
+import windlass.limits
+
+MANIFEST_TYPES = [
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+]
+
+# Also accepted for digests, as images pulled for several platforms are
+# known by the digest of their list
+MANIFEST_LIST_TYPES = [
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+]
+
+CHALLENGE_PARAM = re.compile(r'(\w+)="([^"]*)"')
+
+
+def insecure(registry):
+    """Return whether docker talks to registry without TLS by default"""
+    host = registry.split(':', 1)[0]
+    return host == 'localhost' or host.startswith('127.')
+
+
+class RegistryClient(object):
+    """Read images from a docker registry using its HTTP API (v2)
+
+    The credentials are sent to registries asking for basic authentication,
+    or to the token service of those asking for bearer tokens, as for ECR,
+    Artifactory and Docker Hub.
+    """
+
+    def __init__(self, registry, username=None, password=None, timeout=30):
+        self.registry = registry
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self._tokens = {}
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            # As for the other registry calls
+            self._session.verify = '/etc/ssl/certs'
+        return self._session
+
+    def url(self, path):
+        scheme = 'http' if insecure(self.registry) else 'https'
+        return '%s://%s/v2/%s' % (scheme, self.registry, path)
+
+    def _token(self, challenge, scope):
+        params = dict(CHALLENGE_PARAM.findall(challenge))
+        realm = params.pop('realm')
+        params.setdefault('scope', scope)
+        auth = None
+        if self.username is not None:
+            auth = (self.username, self.password)
+        resp = self.session.get(
+            realm, params=params, auth=auth, timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        return data.get('token') or data.get('access_token')
+
+    def request(self, method, repository, path, headers=None):
+        """Make a request about repository, authenticating as asked"""
+        scope = 'repository:%s:pull' % repository
+        url = self.url('%s/%s' % (repository, path))
+        headers = dict(headers or {})
+        auth = None
+        if scope in self._tokens:
+            headers['Authorization'] = 'Bearer %s' % self._tokens[scope]
+        elif self.username is not None:
+            auth = (self.username, self.password)
+        with windlass.limits.limit('http', url):
+            resp = self.session.request(
+                method, url, headers=headers, auth=auth,
+                timeout=self.timeout)
+            challenge = resp.headers.get('WWW-Authenticate', '')
+            if resp.status_code == 401 and \
+                    challenge.lower().startswith('bearer '):
+                self._tokens[scope] = self._token(challenge, scope)
+                headers['Authorization'] = 'Bearer %s' % self._tokens[scope]
+                resp = self.session.request(
+                    method, url, headers=headers, timeout=self.timeout)
+        return resp
+
+    def manifest(self, repository, reference):
+        """Return the manifest of repository:reference, or None if missing
+
+        Only single image manifests are returned, not lists of them.
+        """
+        resp = self.request(
+            'GET', repository, 'manifests/%s' % reference,
+            headers={'Accept': ', '.join(MANIFEST_TYPES)})
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        manifest = resp.json()
+        if 'config' not in manifest:
+            logging.debug(
+                '%s/%s:%s is not a single image', self.registry, repository,
+                reference)
+            return None
+        return manifest
+
+    def manifest_digest(self, repository, reference):
+        """Return the digest of repository:reference, or None if missing"""
+        resp = self.request(
+            'HEAD', repository, 'manifests/%s' % reference,
+            headers={'Accept': ', '.join(
+                MANIFEST_TYPES + MANIFEST_LIST_TYPES)})
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        return resp.headers.get('Docker-Content-Digest')
+
+    def image_config(self, repository, reference):
+        """Return the configuration of repository:reference, or None"""
+        manifest = self.manifest(repository, reference)
+        if manifest is None:
+            return None
+        resp = self.request(
+            'GET', repository, 'blobs/%s' % manifest['config']['digest'])
+        resp.raise_for_status()
+        return resp.json()
+
+    def image_labels(self, repository, reference):
+        """Return the labels of repository:reference, or None if missing"""
+        config = self.image_config(repository, reference)
+        if config is None:
+            return None
+        return config.get('config', {}).get('Labels') or {}
@@ -0,0 +1,85 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import logging
+import os
+import threading
+
+TIMEOUT = 180
+
+_local = threading.local()
+_lock = threading.Lock()
+# The clients of every thread of this process, closed together
+_clients = []
+# Incremented by close, so threads don't use the clients it closed
+_generation = 0
+# The API version negotiated by the first client, used by later ones
+_version = None
+
+
+def _reset_after_fork():
+    global _lock, _clients
+    # Another thread may have held the lock, and the clients use the
+    # connections of the parent.
+    _lock = threading.Lock()
+    _clients = []
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def client():
+    """Return the docker client of this thread, creating it when needed
+
+    Clients are kept per thread, as they are not safe to share, and per
+    process, so forked workers don't use the connections of their parent.
+    They are not to be closed by their users, see close.
+    """
+    global _version
+
+    pid = os.getpid()
+    cached = getattr(_local, 'client', None)
+    if cached is not None and cached[:2] == (pid, _generation):
+        return cached[2]
+
+    import docker
+
+    new = docker.from_env(version=_version or 'auto', timeout=TIMEOUT)
+    if _version is None:
+        _version = new.api.api_version
+        logging.debug('Using docker API version %s', _version)
+    with _lock:
+        _clients.append((pid, new))
+    _local.client = (pid, _generation, new)
+    return new
+
+
+def close():
+    """Close the docker clients of this process
+
+    Windlass.run calls this once it has processed the artifacts. Later calls
+    to client create new clients, reusing the negotiated API version.
+    """
+    global _clients, _generation
+
+    pid = os.getpid()
+    with _lock:
+        clients, _clients = _clients, []
+        _generation += 1
+    for pid_of, old in clients:
+        if pid_of == pid:
+            old.close()
@@ -156,3 +156,56 @@ class MissingEntryInChartValues(WindlassException):
                 'that matches one in values.yaml' % (
                     self.missing_key, self.chart_name))
         return msg
+
+
+class DependencyCycleException(WindlassException):
+    "Exception raised when artifacts depend on each other in a cycle"
+    def __init__(self, *args, **kwargs):
+        self.nodes = kwargs.pop('nodes', [])
+        super().__init__(*args, **kwargs)
+
+    def debug_message(self):
+        msg = 'Artifacts can not be ordered, check depends_on and priority:\n'
+        for node in self.nodes:
+            msg += '%s\n' % getattr(node, 'name', node)
+        return msg
+
+
+class MultipleFailuresException(WindlassException):
+    """Exception raised at the end of a keep going run with failures
+
+    failures is a list of (name, exception) for each failed artifact or
+    task, skipped the names of those not processed because they depend on
+    a failure.
+    """
+    def __init__(self, *args, **kwargs):
+        self.failures = kwargs.pop('failures', [])
+        self.skipped = kwargs.pop('skipped', [])
+        super().__init__(*args, **kwargs)
+
+    def debug_message(self):
+        msg = '%d failed:\n' % len(self.failures)
+        for name, error in self.failures:
+            msg += '%s: %s\n' % (name, error)
+            if isinstance(error, WindlassException):
+                try:
+                    msg += '%s\n' % error.debug_message()
+                except TypeError:
+                    # debug_message is not implemented
+                    pass
+        if self.skipped:
+            msg += 'Skipped as they depend on a failure:\n'
+            for name in self.skipped:
+                msg += '%s\n' % name
+        return msg
+
+
+class RemoteFailureException(WindlassException):
+    "Exception raised when an artifact failed in another process of a run"
+    def __init__(self, *args, **kwargs):
+        self.owner = kwargs.pop('owner', None)
+        self.message = kwargs.pop('message', None)
+        super().__init__(*args, **kwargs)
+
+    def debug_message(self):
+        return 'Failed on %s:\n%s\n' % (self.owner, self.message)
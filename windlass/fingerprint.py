@@ -0,0 +1,186 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import hashlib
+import os
+import re
+import stat
+
+# Label of images holding the fingerprint of what they were built from
+LABEL = 'windlass.fingerprint'
+
+# Changed whenever what goes into a fingerprint changes, so images built
+# by older versions are not mistaken for up to date ones.
+FORMAT = b'windlass-fingerprint-1'
+
+VARIABLE = re.compile(r'\$(?:\{(\w+)(?::-([^}]*))?\}|(\w+))')
+
+# Files windlass writes while running, e.g. the journal, left out of every
+# context so a run does not change what the next one fingerprints
+_excluded = set()
+
+
+def exclude(*paths):
+    """Leave the files at paths out of the contexts of this process"""
+    _excluded.update(os.path.abspath(path) for path in paths)
+
+
+def excluded():
+    """Return the files left out of the contexts, see exclude"""
+    return sorted(_excluded)
+
+
+def read_dockerignore(path):
+    """Return the patterns in the .dockerignore file of the context path"""
+    try:
+        with open(os.path.join(path, '.dockerignore')) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    # The same as docker.api.build reads them
+    return [
+        line.strip() for line in lines
+        if line.strip() and not line.strip().startswith('#')]
+
+
+def context_files(path, dockerfile=None, directories=False):
+    """Return the sorted paths of the files sent to docker to build path
+
+    The paths are relative to path, and exclude those .dockerignore does
+    and those given to exclude. Directories are only included if
+    directories is set.
+    """
+    from docker.utils.build import exclude_paths
+
+    included = exclude_paths(
+        path, read_dockerignore(path), dockerfile=dockerfile)
+    top = os.path.abspath(path)
+    return sorted(
+        name for name in included
+        if os.path.join(top, name) not in _excluded and (
+            directories or not os.path.isdir(os.path.join(path, name)) or
+            os.path.islink(os.path.join(path, name))))
+
+
+def instructions(dockerfile):
+    """Yield the (instruction, arguments) of the text of a Dockerfile"""
+    line = ''
+    for part in dockerfile.splitlines():
+        stripped = part.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        if stripped.endswith('\\'):
+            line += stripped[:-1] + ' '
+            continue
+        line += stripped
+        words = line.split(None, 1)
+        yield words[0].upper(), words[1] if len(words) > 1 else ''
+        line = ''
+
+
+def substitute(value, args):
+    """Return value with the args in it replaced, None if one is unset"""
+    missing = []
+
+    def replace(match):
+        name = match.group(1) or match.group(3)
+        if args.get(name) is not None:
+            return args[name]
+        if match.group(2) is not None:
+            return match.group(2)
+        missing.append(name)
+        return ''
+
+    value = VARIABLE.sub(replace, value)
+    return None if missing else value
+
+
+def base_images(dockerfile, buildargs=None):
+    """Return the images the stages of the text of a Dockerfile start from
+
+    Stages starting from an earlier stage, or from scratch, are left out.
+    Returns None if an image can't be worked out, e.g. from an ARG with no
+    value.
+    """
+    buildargs = buildargs or {}
+    args = {}
+    stages = set()
+    images = []
+    started = False
+    for instruction, arguments in instructions(dockerfile):
+        if instruction == 'ARG' and not started:
+            # Only the ARGs before the first FROM apply to FROM lines
+            name, _, default = arguments.partition('=')
+            name = name.strip()
+            args[name] = buildargs.get(
+                name, default.strip().strip('"\'') if default else None)
+        elif instruction == 'FROM':
+            started = True
+            words = [
+                word for word in arguments.split()
+                if not word.startswith('--')]
+            image = substitute(words[0], args)
+            if image is None:
+                return None
+            if image.lower() not in stages and image != 'scratch':
+                images.append(image)
+            if len(words) > 2 and words[1].lower() == 'as':
+                stages.add(words[2].lower())
+    return images
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path, dockerfile=None, buildargs=None, base_digests=()):
+    """Return the fingerprint of building the context path
+
+    This covers the Dockerfile, the files docker is sent, the build args and
+    the digests of the base images, so images with the same fingerprint
+    were built from the same sources. Only whether files are executable is
+    included, not their whole mode, which depends on the umask of checkouts.
+    """
+    digest = hashlib.sha256(FORMAT)
+
+    def update(*values):
+        for value in values:
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            # Prefix the length so different splits don't collide
+            digest.update(b'%d:' % len(value))
+            digest.update(value)
+
+    dockerfile = dockerfile or 'Dockerfile'
+    update('dockerfile', dockerfile, file_digest(
+        os.path.join(path, dockerfile)))
+    for name in context_files(path, dockerfile):
+        filename = os.path.join(path, name)
+        mode = os.lstat(filename).st_mode
+        if stat.S_ISLNK(mode):
+            update('link', name, os.readlink(filename))
+        else:
+            update('file', name, 'x' if mode & stat.S_IXUSR else '-',
+                   file_digest(filename))
+    for name, value in sorted((buildargs or {}).items()):
+        update('arg', name, value)
+    for base_digest in base_digests:
+        update('base', base_digest)
+    return digest.hexdigest()
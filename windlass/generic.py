@@ -19,9 +19,8 @@ import glob
 import logging
 import os
 
-import requests
-
 import windlass.api
+import windlass.limits
 
 
 class LocalArtifactCopyMissing(Exception):
@@ -90,6 +89,8 @@ class Generic(windlass.api.Artifact):
         return filenames[0]
 
     def url(self, version=None, generic_url=None, **kwargs):
+        import requests
+
         if version and generic_url:
             # This requires Arfifactory and remotes should replace it
             safe_url = generic_url.rstrip('/')
@@ -127,12 +128,15 @@ class Generic(windlass.api.Artifact):
                  version=None,
                  generic_url=None,
                  **kwargs):
+        import requests
+
         artifact_url = self.url(version or self.version, generic_url)
 
-        resp = requests.get(
-            artifact_url,
-            verify='/etc/ssl/certs',
-            timeout=5)
+        with windlass.limits.limit('http', artifact_url):
+            resp = requests.get(
+                artifact_url,
+                verify='/etc/ssl/certs',
+                timeout=5)
         if resp.status_code != 200:
             raise windlass.exc.RetryableFailure(
                 'Failed to download artifact %s' % (
@@ -148,6 +152,7 @@ class Generic(windlass.api.Artifact):
                generic_url=None,
                docker_user=None, docker_password=None,
                **kwargs):
+        import requests
 
         local_filename = self.get_filename()
         with open(local_filename, 'rb') as fp:
@@ -182,11 +187,12 @@ class Generic(windlass.api.Artifact):
         auth = requests.auth.HTTPBasicAuth(docker_user, docker_password)
 
         # This fails with a 403 if we try and upload the same artifact twice.
-        resp = requests.put(
-            upload_url,
-            data=data,
-            auth=auth,
-            verify='/etc/ssl/certs')
+        with windlass.limits.limit('http', upload_url):
+            resp = requests.put(
+                upload_url,
+                data=data,
+                auth=auth,
+                verify='/etc/ssl/certs')
         if resp.status_code in (
                 requests.codes.unauthorized, requests.codes.forbidden):
             # No retries in this case.
@@ -198,6 +204,7 @@ class Generic(windlass.api.Artifact):
                     resp.status_code, upload_url))
 
         logging.info('%s: Successfully pushed artifact' % self.name)
+        return upload_url
 
     @windlass.api.fall_back('generic_url')
     def delete(self, version=None, generic_url=None, **kwargs):
@@ -222,7 +229,10 @@ class Generic(windlass.api.Artifact):
             f.write(self.export_stream().read())
         return export_path
 
-    def build(self):
+    def source_paths(self):
+        return []
+
+    def build(self, **kwargs):
         logging.warning(
             '%s is generic artifact and windlass will not build it' % self.name
         )
@@ -0,0 +1,179 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import urllib.parse
+
+import windlass.tools
+
+DEFAULT_GIT_CACHE = windlass.tools.cache_dir('git')
+
+# How many files are fetched into a partial mirror by each git fetch
+FETCH_BATCH = 1000
+
+# Remote of a partial checkout its files are fetched from
+MIRROR_REMOTE = 'mirror'
+
+
+class GitCache(object):
+    """Bare mirrors of remote repositories kept between runs
+
+    The first checkout of a repository clones a mirror of it into the
+    cache, later checkouts only fetch what changed since. Checkouts are
+    clones sharing the objects of the mirror, or partial clones of a
+    partial mirror, so they are quick and take little space, but must not
+    outlive the mirror.
+
+    Mirrors are locked while they are updated, so runs on the same host
+    can share the cache.
+
+    partial - mirror without file contents (--filter=blob:none) until they
+              are checked out. The files a checkout needs are fetched into
+              the mirror first, and the checkout gets them from there, so
+              each version of a file is only fetched from the remote once.
+
+    sparse  - start checkouts with only the files at the top of the
+              repository, add_paths checks out the directories needed.
+    """
+
+    def __init__(self, path=DEFAULT_GIT_CACHE, partial=True, sparse=True):
+        self.path = path
+        self.partial = partial
+        self.sparse = sparse
+
+    def mirror_path(self, url):
+        name = os.path.basename(
+            urllib.parse.urlparse(url).path.rstrip('/')).rsplit('.git', 1)[0]
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.path, '%s-%s.git' % (name, digest))
+
+    @contextlib.contextmanager
+    def _locked(self, path):
+        os.makedirs(self.path, exist_ok=True)
+        with open(path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def update(self, url):
+        """Create or fetch the mirror of url, returning its path"""
+        import git
+
+        path = self.mirror_path(url)
+        with self._locked(path):
+            if os.path.exists(path):
+                logging.debug('Fetching %s into %s', url, path)
+                git.Repo(path).git.fetch('--prune', 'origin')
+            else:
+                logging.debug('Mirroring %s to %s', url, path)
+                kwargs = {'mirror': True}
+                if self.partial:
+                    kwargs['filter'] = 'blob:none'
+                repo = git.Repo.clone_from(url, path, **kwargs)
+                # Let checkouts clone the mirror without file contents
+                with repo.config_writer() as config:
+                    config.set_value('uploadpack', 'allowFilter', 'true')
+        return path
+
+    def fetch_files(self, mirror, rev, paths=None):
+        """Fetch the files of rev in paths into a partial mirror
+
+        If paths is None every file of rev is fetched, files the mirror
+        already has are skipped by git.
+        """
+        import git
+
+        repo = git.Repo(mirror)
+        args = ['-r'] if paths is None or paths else []
+        entries = repo.git.ls_tree(
+            rev, *args, '--', *(paths or [])).splitlines()
+        blobs = []
+        for entry in entries:
+            info, _ = entry.split('\t', 1)
+            _, kind, sha = info.split()
+            if kind == 'blob':
+                blobs.append(sha)
+        with self._locked(mirror):
+            for start in range(0, len(blobs), FETCH_BATCH):
+                repo.git.fetch(
+                    'origin', '--no-tags', '--no-write-fetch-head',
+                    '--filter=blob:none', *blobs[start:start + FETCH_BATCH])
+
+    def checkout(self, url, destpath, branch=None):
+        """Check out branch, or the default branch, of url in destpath"""
+        import git
+
+        mirror = self.update(url)
+        kwargs = {'no_checkout': True}
+        if branch:
+            kwargs['branch'] = branch
+        if self.partial:
+            # The checkout fetches its files from the mirror, which can't
+            # fetch them from the remote for it, so they are fetched into
+            # the mirror before they are checked out. origin is left as
+            # the remote, for anything looking at where it is from.
+            repo = git.Repo.clone_from(
+                'file://' + os.path.abspath(mirror), destpath,
+                filter='blob:none', origin=MIRROR_REMOTE, **kwargs)
+            repo.create_remote('origin', url)
+            self.fetch_files(
+                mirror, repo.head.commit.hexsha,
+                [] if self.sparse else None)
+        else:
+            repo = git.Repo.clone_from(mirror, destpath, shared=True, **kwargs)
+        if self.sparse:
+            repo.git.sparse_checkout('set', '--cone')
+        repo.git.checkout()
+        return repo
+
+    def _mirror_of(self, repo):
+        """Return the partial mirror repo was cloned from, or None"""
+        if not self.partial or MIRROR_REMOTE not in repo.remotes:
+            return None
+        return repo.remote(MIRROR_REMOTE).url[len('file://'):]
+
+    def add_paths(self, destpath, paths):
+        """Check out paths in a sparse checkout of destpath
+
+        If paths is None, or includes the top of the repository, the whole
+        repository is checked out.
+        """
+        if not self.sparse:
+            return
+        import git
+
+        repo = git.Repo(destpath)
+        paths = None if paths is None else [
+            os.path.normpath(path) for path in paths]
+        if paths is not None and os.curdir in paths:
+            paths = None
+        if paths == []:
+            return
+        mirror = self._mirror_of(repo)
+        if mirror is not None:
+            self.fetch_files(mirror, repo.head.commit.hexsha, paths)
+        if paths is None:
+            repo.git.sparse_checkout('disable')
+        else:
+            logging.debug(
+                'Checking out %s in %s', ', '.join(paths), destpath)
+            repo.git.sparse_checkout('add', *paths)
@@ -0,0 +1,117 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import json
+import logging
+import os
+import tempfile
+
+import windlass.tools
+
+DEFAULT_HISTORY_FILE = windlass.tools.cache_dir('history.json')
+
+# Weight of the latest duration in the moving average of an operation.
+RECENT_WEIGHT = 0.5
+
+
+class History(object):
+    """Durations of previous operations on artifacts
+
+    Kept in a json file, by default in the windlass cache directory, as a
+    moving average of the seconds each operation took for each artifact.
+    Used to start the longest artifacts first.
+
+    A read_only history is never written by save, e.g. the snapshot every
+    job of a sharded run splits the artifacts by, its updates are only
+    kept for the summary of the job.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_FILE, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.durations = self._read()
+        # Entries recorded by this process, written by save
+        self.updates = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f).get('durations', {})
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as e:
+            logging.warning(
+                'Ignoring unreadable history file %s: %s', self.path, e)
+            return {}
+
+    def expected(self, name, operation):
+        """Return the expected seconds of operation on name, or None"""
+        entry = self.durations.get(operation, {}).get(name)
+        if entry is None:
+            return None
+        return entry['mean']
+
+    def average(self, operation):
+        """Return the average seconds of operation over all artifacts"""
+        entries = self.durations.get(operation, {}).values()
+        if not entries:
+            return None
+        return sum(entry['mean'] for entry in entries) / len(entries)
+
+    def total(self, name):
+        """Return the expected seconds of all operations on name, or None"""
+        means = [
+            entries[name]['mean'] for entries in self.durations.values()
+            if name in entries]
+        if not means:
+            return None
+        return sum(means)
+
+    def record(self, name, operation, seconds):
+        entry = self.durations.setdefault(operation, {}).get(name)
+        if entry is None:
+            entry = {'mean': seconds, 'count': 1}
+        else:
+            entry = {
+                'mean': (
+                    RECENT_WEIGHT * seconds +
+                    (1 - RECENT_WEIGHT) * entry['mean']),
+                'count': entry['count'] + 1,
+            }
+        self.durations[operation][name] = entry
+        self.updates.setdefault(operation, {})[name] = entry
+
+    def merge(self, durations):
+        """Add the entries recorded by other processes, written by save"""
+        for operation, entries in durations.items():
+            self.durations.setdefault(operation, {}).update(entries)
+            self.updates.setdefault(operation, {}).update(entries)
+
+    def save(self):
+        """Write the recorded durations, keeping entries from other runs"""
+        if not self.updates or self.read_only:
+            return
+        durations = self._read()
+        for operation, entries in self.updates.items():
+            durations.setdefault(operation, {}).update(entries)
+
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dirname, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                'w', dir=dirname, delete=False) as f:
+            json.dump({'durations': durations}, f, indent=2, sort_keys=True)
+        os.replace(f.name, self.path)
+        self.durations = durations
@@ -14,32 +14,70 @@
 # under the License.
 #
 
+import codecs
+import collections
+import json
 import logging
 import multiprocessing
 import os
-
-import docker
-from git import Repo
-import yaml
+import re
+import subprocess
 
 import windlass.api
+import windlass.contexts
+import windlass.dockerclient
 import windlass.exc
+import windlass.fingerprint
+import windlass.limits
 import windlass.tools
 
 BUILDARG_PREFIX = 'WINDLASS_BUILDARG_'
 
+# How many of the last messages from docker are kept to report an error
+STREAM_CONTEXT = 100
+BUILD_OUTPUT_CONTEXT = 1000
+
+WHITESPACE = re.compile(r'\s*')
+
+
+def json_stream(stream):
+    """Yield the objects in a stream of JSON from docker
+
+    The stream is of str or bytes chunks, each of which can hold several
+    objects or only part of one.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    for chunk in stream:
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk)
+        buffer += chunk
+        pos = 0
+        while True:
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            try:
+                data, pos = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # Wait for the rest of the object
+                break
+            yield data
+        buffer = buffer[pos:]
+    if buffer.strip():
+        # Raises the error decoding it
+        json.loads(buffer)
+
 
 def check_docker_stream(stream):
     # Read output from docker command and raise exception
     # if docker hit an error processing the command.
     # Also log messages if debugging is turned on.
     name = multiprocessing.current_process().name
-    last_msgs = []
-    for line in stream:
-        if not line:
-            continue
-
-        data = yaml.load(line, Loader=yaml.SafeLoader)
+    seen = set()
+    last_msgs = collections.deque(maxlen=STREAM_CONTEXT)
+    for data in json_stream(stream):
         if 'status' in data:
             if 'id' in data:
                 msg = '%s layer %s: %s' % (name,
@@ -47,8 +85,9 @@ def check_docker_stream(stream):
                                            data['status'])
             else:
                 msg = '%s: %s' % (name, data['status'])
-            if msg not in last_msgs:
+            if msg not in seen:
                 logging.debug(msg)
+                seen.add(msg)
                 last_msgs.append(msg)
         if 'error' in data:
             logging.error("Error processing image %s:%s" % (
@@ -57,28 +96,26 @@ def check_docker_stream(stream):
                 '%s ERROR from docker: %s' % (
                     name, data['error']
                 ),
-                out=last_msgs,
+                out=list(last_msgs),
                 errors=[data['error']],
             )
 
 
 def push_image(imagename, push_tag='latest', auth_config=None):
     output = None
-    client = docker.from_env(
-        version='auto',
-        timeout=180)
+    client = windlass.dockerclient.client()
     try:
         name = multiprocessing.current_process().name
         logging.info('%s: Pushing as %s:%s', name, imagename, push_tag)
 
-        output = client.images.push(
-            imagename, push_tag, auth_config=auth_config,
-            stream=True)
-        check_docker_stream(output)
+        with windlass.limits.limit('docker', imagename):
+            output = client.images.push(
+                imagename, push_tag, auth_config=auth_config,
+                stream=True)
+            check_docker_stream(output)
     finally:
         if output:
             output.close()
-        client.close()
 
     return True
 
@@ -94,67 +131,291 @@ def clean_tag(tag):
     return clean[:128]
 
 
+def build_args():
+    """Return the build args passed to docker, from the environment"""
+    bargs = windlass.tools.load_proxy()
+    for envvar in os.environ:
+        if envvar.startswith(BUILDARG_PREFIX):
+            bargs[envvar[len(BUILDARG_PREFIX):]] = os.environ[envvar]
+    return bargs
+
+
 def build_verbosly(name, path, nocache=False, dockerfile=None,
-                   pull=True):
-    client = docker.from_env(
-        version='auto',
-        timeout=180
-    )
+                   pull=True, labels=None, narrow_context=False,
+                   context_cache=None):
+    """Build an image with docker
+
+    The context sent to docker is made by windlass.contexts.build_context,
+    only with the files the Dockerfile copies if narrow_context is set,
+    and taken from context_cache if given.
+    """
+    client = windlass.dockerclient.client()
+    bargs = build_args()
+    errors = []
+    # capture the last of the output in case of error
+    output = collections.deque(maxlen=BUILD_OUTPUT_CONTEXT)
+    context = None
+    if windlass.contexts.in_context(dockerfile):
+        context = windlass.contexts.build_context(
+            path, dockerfile, narrow_context, context_cache)
+        source = {'fileobj': context, 'custom_context': True}
+    else:
+        source = {'path': path}
     try:
-        bargs = windlass.tools.load_proxy()
-        for envvar in os.environ:
-            if envvar.startswith(BUILDARG_PREFIX):
-                bargs[envvar[len(BUILDARG_PREFIX):]] = os.environ[envvar]
-        logging.info("Building %s from path %s", name, path)
-        stream = client.api.build(path=path,
-                                  tag=name,
-                                  nocache=nocache,
-                                  buildargs=bargs,
-                                  dockerfile=dockerfile,
-                                  pull=pull)
-        errors = []
-        output = []
-        for line in stream:
-            data = yaml.load(line.decode(), Loader=yaml.SafeLoader)
-            if 'stream' in data:
-                for out in data['stream'].split('\n\r'):
-                    logging.debug('%s: %s', name, out.strip())
-                    # capture detailed output in case of error
-                    output.append(out.strip())
-            elif 'error' in data:
-                errors.append(data['error'])
-        if errors:
-            logging.error(
-                'Failed to build %s. Error details will be shown at the end.',
-                name)
-            debug_data = {'buildargs.%s' % k: v for k, v in bargs.items()}
-            debug_data['dockerfile'] = dockerfile
-            debug_data['tag'] = name
-            debug_data['path'] = path
-            debug_data['nocache'] = str(nocache)
-            debug_data['pull'] = str(pull)
-            raise windlass.exc.WindlassBuildException(
-                "Failed to build {}".format(name),
-                out=output,
-                errors=errors,
-                artifact_name=name,
-                debug_data=debug_data)
-        logging.info("Successfully built %s from path %s", name, path)
-        return client.images.get(name)
+        with windlass.limits.limit('build'):
+            logging.info("Building %s from path %s", name, path)
+            stream = client.api.build(tag=name,
+                                      nocache=nocache,
+                                      buildargs=bargs,
+                                      dockerfile=dockerfile,
+                                      pull=pull,
+                                      labels=labels,
+                                      **source)
+            for data in json_stream(stream):
+                if 'stream' in data:
+                    for out in data['stream'].split('\n\r'):
+                        logging.debug('%s: %s', name, out.strip())
+                        output.append(out.strip())
+                elif 'error' in data:
+                    errors.append(data['error'])
     finally:
-        client.close()
+        if context is not None:
+            context.close()
+    if errors:
+        build_failed(name, path, dockerfile, nocache, pull, bargs, output,
+                     errors)
+    logging.info("Successfully built %s from path %s", name, path)
+    return client.images.get(name)
+
+
+def build_failed(name, path, dockerfile, nocache, pull, bargs, output,
+                 errors):
+    logging.error(
+        'Failed to build %s. Error details will be shown at the end.',
+        name)
+    debug_data = {'buildargs.%s' % k: v for k, v in bargs.items()}
+    debug_data['dockerfile'] = dockerfile
+    debug_data['tag'] = name
+    debug_data['path'] = path
+    debug_data['nocache'] = str(nocache)
+    debug_data['pull'] = str(pull)
+    raise windlass.exc.WindlassBuildException(
+        "Failed to build {}".format(name),
+        out=list(output),
+        errors=errors,
+        artifact_name=name,
+        debug_data=debug_data)
+
+
+def cache_option(cache, repopath, export=False):
+    """Return the buildx --cache-from or --cache-to value of a cache setting
+
+    A setting is a registry reference, a local directory starting with /,
+    . or ~, relative to repopath, or is given to buildx as it is if it
+    has the type=... form. Exported caches keep the layers of every stage.
+    """
+    if '=' in cache:
+        return cache
+    if cache.startswith(('/', '.', '~')):
+        directory = os.path.join(repopath, os.path.expanduser(cache))
+        if export:
+            return 'type=local,dest=%s,mode=max' % directory
+        return 'type=local,src=%s' % directory
+    if export:
+        return 'type=registry,ref=%s,mode=max' % cache
+    return 'type=registry,ref=%s' % cache
+
+
+def build_buildkit(name, path, nocache=False, dockerfile=None, pull=True,
+                   labels=None, cache_from=(), cache_to=()):
+    """Build an image with docker buildx, so BuildKit
+
+    This runs the independent stages of the Dockerfile in parallel, and
+    imports and exports the layer caches in cache_from and cache_to, lists
+    of buildx cache options (see cache_option).
+    """
+    bargs = build_args()
+    cmd = ['docker', 'buildx', 'build', '--load', '--progress', 'plain',
+           '--tag', name,
+           '--file', os.path.join(path, dockerfile or 'Dockerfile')]
+    # Values are read from the environment, so they aren't in the command
+    for key in sorted(bargs):
+        cmd += ['--build-arg', key]
+    for key, value in sorted((labels or {}).items()):
+        cmd += ['--label', '%s=%s' % (key, value)]
+    if nocache:
+        cmd.append('--no-cache')
+    if pull:
+        cmd.append('--pull')
+    for cache in cache_from:
+        cmd += ['--cache-from', cache]
+    for cache in cache_to:
+        cmd += ['--cache-to', cache]
+    cmd.append(path)
+    env = dict(os.environ, **bargs)
+
+    output = collections.deque(maxlen=BUILD_OUTPUT_CONTEXT)
+    with windlass.limits.limit('build'):
+        logging.info("Building %s from path %s with BuildKit", name, path)
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env,
+            universal_newlines=True)
+        for line in proc.stdout:
+            logging.debug('%s: %s', name, line.rstrip())
+            output.append(line.rstrip())
+        proc.stdout.close()
+        returncode = proc.wait()
+    if returncode != 0:
+        build_failed(name, path, dockerfile, nocache, pull, bargs, output,
+                     ['docker buildx build exited with %d' % returncode])
+    logging.info("Successfully built %s from path %s", name, path)
+    return windlass.dockerclient.client().images.get(name)
+
+
+def base_image_digests(client, images, pull=True):
+    """Return the digests of the base images a build uses, or None
+
+    When pulling, these are the digests in their registries, as the build
+    pulls any newer image. Otherwise, or for images only built locally,
+    they are the IDs of the local images.
+    """
+    import docker
+
+    digests = []
+    for image in images:
+        if pull:
+            try:
+                digests.append(client.api.inspect_distribution(
+                    image)['Descriptor']['digest'])
+                continue
+            except docker.errors.APIError as e:
+                logging.debug('No registry digest of %s: %s', image, e)
+        try:
+            digests.append(client.images.get(image).id)
+        except docker.errors.APIError as e:
+            logging.debug('No digest of base image %s: %s', image, e)
+            return None
+    return digests
+
+
+def image_fingerprint(path, dockerfile=None, pull=True):
+    """Return the fingerprint of building the context path, or None
+
+    None is returned if the base images can't be found.
+    """
+    bargs = build_args()
+    with open(os.path.join(path, dockerfile or 'Dockerfile')) as f:
+        images = windlass.fingerprint.base_images(f.read(), bargs)
+    if images is None:
+        return None
+    client = windlass.dockerclient.client()
+    digests = base_image_digests(client, images, pull)
+    if digests is None:
+        return None
+    return windlass.fingerprint.fingerprint(path, dockerfile, bargs, digests)
+
+
+def locate_fingerprinted_image(name, fingerprint, remotes=()):
+    """Return where an image built with fingerprint is, without fetching it
+
+    Returns (image, remote): the local image with the fingerprint, or else
+    the first (connector, name, tag) of remotes with it, the other being
+    None. Both are None if there is no such image.
+    """
+    client = windlass.dockerclient.client()
+    images = client.images.list(filters={'label': '%s=%s' % (
+        windlass.fingerprint.LABEL, fingerprint)})
+    if images:
+        return images[0], None
+
+    for remote in remotes:
+        connector, remote_name, remote_tag = remote
+        try:
+            labels = connector.image_labels(remote_name, remote_tag)
+        except Exception as e:
+            logging.info(
+                '%s: Not checking %s for an up to date image: %s',
+                name, connector.remote_path(remote_name), e)
+            continue
+        if (labels or {}).get(windlass.fingerprint.LABEL) == fingerprint:
+            return None, remote
+    return None, None
+
+
+def find_fingerprinted_image(name, fingerprint, remotes=()):
+    """Return an image built with fingerprint, tagged as name, or None
+
+    Local images are looked for first, then each of remotes, a list of
+    (connector, name, tag) of where the image may have been uploaded,
+    is checked and the image pulled from the first with the fingerprint.
+    """
+    repository, tag = windlass.tools.split_image(name)
+    image, remote = locate_fingerprinted_image(name, fingerprint, remotes)
+    if image is not None:
+        logging.info('%s: Image %s is up to date', name, image.short_id)
+        image.tag(repository, tag)
+        return image
+    if remote is None:
+        return None
+
+    connector, remote_name, remote_tag = remote
+    remote = connector.remote_path(remote_name)
+    logging.info(
+        '%s: Pulling up to date image %s:%s', name, remote, remote_tag)
+    client = windlass.dockerclient.client()
+    with windlass.limits.limit('docker', remote):
+        output = client.api.pull(
+            remote, remote_tag, stream=True,
+            auth_config=connector.auth_config)
+        check_docker_stream(output)
+    image = client.images.get('%s:%s' % (remote, remote_tag))
+    image.tag(repository, tag)
+    return image
 
 
 def build_image_from_local_repo(repopath, imagepath, name, tags=[],
-                                nocache=False, dockerfile=None, pull=True):
-    logging.info('%s: Building image from local directory %s',
-                 name, os.path.join(repopath, imagepath))
+                                nocache=False, dockerfile=None, pull=True,
+                                remotes=(), skip_unchanged=True,
+                                buildkit=False, cache_from=(), cache_to=(),
+                                narrow_context=False, context_cache=None):
+    """Build an image, tagged with the commit of the repository
+
+    Unless nocache is set or skip_unchanged isn't, an image built from the
+    same sources, locally or in one of remotes, is used instead of building
+    it again (see find_fingerprinted_image). If buildkit is set the image
+    is built with build_buildkit, using the caches in cache_from and
+    cache_to, otherwise with build_verbosly.
+    """
+    from git import Repo
+
+    path = os.path.join(repopath, imagepath)
+    logging.info('%s: Building image from local directory %s', name, path)
     repo = Repo(repopath)
-    image = build_verbosly(name,
-                           os.path.join(repopath, imagepath),
-                           nocache=nocache,
-                           dockerfile=dockerfile,
-                           pull=pull)
+    image = None
+    labels = None
+    if skip_unchanged and not nocache:
+        fingerprint = image_fingerprint(path, dockerfile, pull)
+        if fingerprint is not None:
+            labels = {windlass.fingerprint.LABEL: fingerprint}
+            image = find_fingerprinted_image(name, fingerprint, remotes)
+    if image is None and buildkit:
+        image = build_buildkit(name,
+                               path,
+                               nocache=nocache,
+                               dockerfile=dockerfile,
+                               pull=pull,
+                               labels=labels,
+                               cache_from=cache_from,
+                               cache_to=cache_to)
+    elif image is None:
+        image = build_verbosly(name,
+                               path,
+                               nocache=nocache,
+                               dockerfile=dockerfile,
+                               pull=pull,
+                               labels=labels,
+                               narrow_context=narrow_context,
+                               context_cache=context_cache)
     if repo.head.is_detached:
         commit = repo.head.commit.hexsha
     else:
@@ -193,26 +454,113 @@ class Image(windlass.api.Artifact):
     def __str__(self):
         return '<Docker image %s (%s)>' % (self.name, self.version)
 
+    def source_paths(self):
+        if 'remote' in self.data:
+            return []
+        if 'context' not in self.data:
+            return None
+        paths = [self.data['context']]
+        dockerfile = self.data.get('dockerfile')
+        if not windlass.contexts.in_context(dockerfile):
+            if os.path.isabs(dockerfile):
+                # Not in the repository
+                return paths
+            directory = os.path.dirname(os.path.normpath(
+                os.path.join(self.data['context'], dockerfile)))
+            if directory.split(os.sep)[0] == os.pardir:
+                return None
+            # The top of the repository is always checked out
+            if directory:
+                paths.append(directory)
+        return paths
+
+    def plan(self, operation, version=None, docker_image_registries=None,
+             docker_image_registry=None, skip_unchanged=True, **kwargs):
+        """Plan the operation, with the checks build and upload skip on
+
+        A build is skip-up-to-date if an image with the same fingerprint
+        is local or in docker_image_registries, and a push
+        skip-already-present if docker_image_registry has the local image
+        as version. Nothing is built, pulled or tagged to find out.
+        """
+        if operation == 'build' and 'remote' in self.data:
+            # Building a remote image pulls it
+            return {'action': 'pull', 'bytes': None}
+        if operation == 'download':
+            return {'action': 'pull', 'bytes': None}
+        if operation == 'build' and skip_unchanged and \
+                self._plan_up_to_date(version, docker_image_registries):
+            return {'action': 'skip-up-to-date', 'bytes': 0}
+        if operation in ('push', 'upload') and docker_image_registry:
+            return self._plan_push(version, docker_image_registry)
+        return super().plan(operation, **kwargs)
+
+    def _plan_up_to_date(self, version, docker_image_registries):
+        """Return whether the build would use an existing image"""
+        if 'context' not in self.data:
+            return False
+        path = os.path.join(
+            self.metadata.get('repopath', '.'), self.data['context'])
+        remotes = [
+            (registry.connector, self.imagename, version or self.version)
+            for registry in docker_image_registries or []]
+        try:
+            fingerprint = image_fingerprint(path, self.data.get('dockerfile'))
+            if fingerprint is None:
+                return False
+            image, remote = locate_fingerprinted_image(
+                self.data['name'], fingerprint, remotes)
+        except Exception as e:
+            logging.debug(
+                '%s: Unable to check for an up to date image: %s',
+                self.name, e)
+            return False
+        return image is not None or remote is not None
+
+    def _plan_push(self, version, docker_image_registry):
+        """Plan pushing the local image to docker_image_registry"""
+        local_name = self.url(self.version)
+        connector = docker_image_registry.connector
+        try:
+            client = windlass.dockerclient.client()
+            size = client.images.get(local_name).attrs.get('Size')
+            uploaded = connector.is_uploaded(
+                client, local_name, connector.remote_path(self.imagename),
+                version or self.version)
+        except Exception as e:
+            # Not built yet, or docker isn't available
+            logging.debug(
+                '%s: Unable to check %s is pushed: %s',
+                self.name, local_name, e)
+            return {'action': 'push', 'bytes': None}
+        if uploaded:
+            return {'action': 'skip-already-present', 'bytes': 0}
+        return {'action': 'push', 'bytes': size}
+
+    def build_size(self):
+        if 'remote' in self.data or 'context' not in self.data:
+            return None
+        context = os.path.join(
+            self.metadata.get('repopath', '.'), self.data['context'])
+        if not os.path.isdir(context):
+            return None
+        return windlass.tools.tree_size(context)
+
     def pull_image(self, remoteimage, imagename, tag):
         """Pull the remoteimage down
 
         And tag it with the imagename and tag.
         """
-        client = docker.from_env(
-            version='auto',
-            timeout=180
-        )
-        try:
-            logging.info("%s: Pulling image from %s", imagename, remoteimage)
+        client = windlass.dockerclient.client()
+        logging.info("%s: Pulling image from %s", imagename, remoteimage)
 
+        with windlass.limits.limit('docker', remoteimage):
             output = client.api.pull(remoteimage, stream=True)
             check_docker_stream(output)
-            client.api.tag(remoteimage, imagename, tag)
+        client.api.tag(remoteimage, imagename, tag)
 
-            image = client.images.get('%s:%s' % (imagename, tag))
-            return image
-        finally:
-            client.close()
+        image = client.images.get('%s:%s' % (imagename, tag))
+        return image
 
     def url(self, version=None, docker_image_registry=None, **kwargs):
         if version is None:
@@ -223,7 +571,19 @@ class Image(windlass.api.Artifact):
                 docker_image_registry.rstrip('/'), self.imagename, version)
         return '%s:%s' % (self.imagename, version)
 
-    def build(self):
+    def build(self, version=None, docker_image_registries=None,
+              skip_unchanged=True, buildkit=False, context_cache=None,
+              **kwargs):
+        """Build the image, unless one built from the same sources exists
+
+        An image with the same fingerprint is looked for locally, then as
+        version, defaulting to the version of the image, in each of
+        docker_image_registries.
+
+        The image is built with BuildKit if buildkit is set, or the image
+        sets buildkit, cache_from or cache_to. Otherwise the context sent
+        to docker is taken from context_cache, a ContextCache, if given.
+        """
         # How to pass in no-docker-cache and docker-pull arguments.
         image_def = self.data
 
@@ -238,26 +598,47 @@ class Image(windlass.api.Artifact):
             repopath = self.metadata['repopath']
 
             dockerfile = image_def.get('dockerfile', None)
+            cache_from = [
+                cache_option(cache, repopath)
+                for cache in self._list_setting('cache_from')]
+            cache_to = [
+                cache_option(cache, repopath, export=True)
+                for cache in self._list_setting('cache_to')]
+            buildkit = bool(buildkit or image_def.get('buildkit') or
+                            cache_from or cache_to)
+            remotes = [
+                (registry.connector, self.imagename, version or self.version)
+                for registry in docker_image_registries or []]
             logging.debug('Expecting repository at %s' % repopath)
             build_image_from_local_repo(repopath,
                                         image_def['context'],
                                         image_def['name'],
                                         nocache=False,
                                         dockerfile=dockerfile,
-                                        pull=True)
+                                        pull=True,
+                                        remotes=remotes,
+                                        skip_unchanged=skip_unchanged,
+                                        buildkit=buildkit,
+                                        cache_from=cache_from,
+                                        cache_to=cache_to,
+                                        narrow_context=image_def.get(
+                                            'narrow_context', False),
+                                        context_cache=context_cache)
             logging.info('Get image %s completed', image_def['name'])
 
+    def _list_setting(self, key):
+        value = self.data.get(key) or []
+        return [value] if isinstance(value, str) else value
+
     def _delete_image(self, image):
-        client = docker.from_env(
-            version='auto',
-            timeout=180)
+        import docker
+
+        client = windlass.dockerclient.client()
         try:
             client.api.remove_image(image)
         except docker.errors.ImageNotFound:
             # Image isn't on system so no worries
             pass
-        finally:
-            client.close()
 
     @windlass.api.fall_back('docker_image_registry')
     def delete(self, version=None, docker_image_registry=None, **kwargs):
@@ -274,66 +655,58 @@ class Image(windlass.api.Artifact):
     @windlass.retry.simple()
     @windlass.api.fall_back('docker_image_registry')
     def download(self, version=None, docker_image_registry=None, **kwargs):
-        client = docker.from_env(
-            version='auto',
-            timeout=180)
-        try:
-            if version is None and self.version is None:
-                raise Exception('Must specify version of image to download.')
+        client = windlass.dockerclient.client()
+        if version is None and self.version is None:
+            raise Exception('Must specify version of image to download.')
 
-            if docker_image_registry is None:
-                raise Exception(
-                    'docker_image_registry not set for image download. '
-                    'Where should we download from?')
+        if docker_image_registry is None:
+            raise Exception(
+                'docker_image_registry not set for image download. '
+                'Where should we download from?')
 
-            tag = version or self.version
+        tag = version or self.version
 
-            logging.info('Pinning image: %s to pin: %s', self.imagename, tag)
-            remoteimage = '%s/%s:%s' % (
-                docker_image_registry, self.imagename, tag
-            )
+        logging.info('Pinning image: %s to pin: %s', self.imagename, tag)
+        remoteimage = '%s/%s:%s' % (
+            docker_image_registry, self.imagename, tag
+        )
 
-            # Pull the remoteimage down and tag it with the name of artifact
-            # and the requested version
-            self.pull_image(remoteimage, self.imagename, tag)
+        # Pull the remoteimage down and tag it with the name of artifact
+        # and the requested version
+        self.pull_image(remoteimage, self.imagename, tag)
 
-            if tag != self.version:
-                # Tag the image with the version but without the repository
-                client.api.tag(remoteimage, self.imagename, self.version)
+        if tag != self.version:
+            # Tag the image with the version but without the repository
+            client.api.tag(remoteimage, self.imagename, self.version)
 
-            # Apply devtag to this image also. Note that not all artifacts
-            # support a devtag
-            client.api.tag(remoteimage, self.imagename, self.devtag)
-        finally:
-            client.close()
+        # Apply devtag to this image also. Note that not all artifacts
+        # support a devtag
+        client.api.tag(remoteimage, self.imagename, self.devtag)
 
     def update_version(self, version):
         """Tag the image with a new version tag and update internal version.
 
         Does not attempt to remove the old version tag.
         """
-        client = docker.from_env(
-            version='auto',
-            timeout=180)
-        try:
-            if version == self.version:
-                logging.debug(
-                    "update_version(image): No version change (%s)", version
-                )
-                return
-            client.api.tag(
-                '%s:%s' % (self.imagename, self.version),
-                self.imagename, tag=version,
+        client = windlass.dockerclient.client()
+        if version == self.version:
+            logging.debug(
+                "update_version(image): No version change (%s)", version
             )
-            return self.set_version(version)
-        finally:
-            client.close()
+            return
+        client.api.tag(
+            '%s:%s' % (self.imagename, self.version),
+            self.imagename, tag=version,
+        )
+        return self.set_version(version)
 
     @windlass.retry.simple()
     @windlass.api.fall_back('docker_image_registry', first_only=True)
     def upload(self, version=None, docker_image_registry=None,
                docker_user=None, docker_password=None,
                **kwargs):
+        import docker
+
         # Start to phase out passing of version to upload.
         if version != self.version:
             logging.debug(
@@ -362,7 +735,7 @@ class Image(windlass.api.Artifact):
         local_fullname = self.url(self.version)
 
         # raises exception if imagename is missing
-        client = docker.from_env(version='auto', timeout=180)
+        client = windlass.dockerclient.client()
         try:
             client.images.get(local_fullname)
         except docker.errors.ImageNotFound as e:
@@ -371,8 +744,6 @@ class Image(windlass.api.Artifact):
                 artifact_name=self.name,
                 errors=[str(e)]
             )
-        finally:
-            client.close()
 
         # Upload image with this tag
         upload_tag = version or self.version
@@ -389,64 +760,49 @@ class Image(windlass.api.Artifact):
     def export_stream(self, version=None):
         img_name = self.imagename + ':' + self.version
 
-        client = docker.from_env(version='auto', timeout=180)
-        try:
-            img = client.images.get(img_name)
-            return img.save()
-        finally:
-            client.close()
+        client = windlass.dockerclient.client()
+        img = client.images.get(img_name)
+        return img.save()
 
     def export(self, export_dir='.', export_name=None, version=None):
-        client = docker.from_env(
-            version='auto',
-            timeout=180)
-        try:
-            img_name = self.imagename + ':' + self.version
-            img = client.images.get(img_name)
-
-            if export_name is None:
-                ver = version or img.short_id[7:]
-                export_name = "%s-%s.tar" % (self.name, ver)
-            export_path = os.path.join(export_dir, export_name)
-            logging.debug("Exporting image %s to %s", img_name, export_path)
+        client = windlass.dockerclient.client()
+        img_name = self.imagename + ':' + self.version
+        img = client.images.get(img_name)
 
-            os.makedirs(os.path.dirname(export_path), exist_ok=True)
-            with open(export_path, 'wb') as f:
-                stream = self.export_stream()
-                try:
-                    for chunk in stream:
-                        f.write(chunk)
-                finally:
-                    stream.close()
+        if export_name is None:
+            ver = version or img.short_id[7:]
+            export_name = "%s-%s.tar" % (self.name, ver)
+        export_path = os.path.join(export_dir, export_name)
+        logging.debug("Exporting image %s to %s", img_name, export_path)
 
-            return export_path
+        os.makedirs(os.path.dirname(export_path), exist_ok=True)
+        with open(export_path, 'wb') as f:
+            stream = self.export_stream()
+            try:
+                for chunk in stream:
+                    f.write(chunk)
+            finally:
+                stream.close()
 
-        finally:
-            client.close()
+        return export_path
 
     def export_signable(self, export_dir='.', export_name=None, version=None):
         """Write the image ID (sha256 hash) to the export file"""
-        client = docker.from_env(
-            version='auto',
-            timeout=180)
-        try:
-            img_name = self.imagename + ':' + self.version
-            img = client.images.get(img_name)
-
-            if export_name is None:
-                # img.short_id starts 'sha256:...' - strip the prefix.
-                ver = version or img.short_id[7:]
-                export_name = "%s-%s.id" % (self.imagename, ver)
-            export_path = os.path.join(export_dir, export_name)
-            logging.debug(
-                "Exporting image ID for %s to %s", img_name, export_path
-            )
-
-            os.makedirs(os.path.dirname(export_path), exist_ok=True)
-            with open(export_path, 'w') as f:
-                f.write(img.id)
+        client = windlass.dockerclient.client()
+        img_name = self.imagename + ':' + self.version
+        img = client.images.get(img_name)
+
+        if export_name is None:
+            # img.short_id starts 'sha256:...' - strip the prefix.
+            ver = version or img.short_id[7:]
+            export_name = "%s-%s.id" % (self.imagename, ver)
+        export_path = os.path.join(export_dir, export_name)
+        logging.debug(
+            "Exporting image ID for %s to %s", img_name, export_path
+        )
 
-            return export_path
+        os.makedirs(os.path.dirname(export_path), exist_ok=True)
+        with open(export_path, 'w') as f:
+            f.write(img.id)
 
-        finally:
-            client.close()
+        return export_path
@@ -0,0 +1,105 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import windlass.fingerprint
+import windlass.tools
+
+
+def default_path(*keys):
+    """Return the path of the journal of a run in the cache directory
+
+    keys, e.g. the directory windlass runs in and its products files,
+    identify the run, so resuming it finds the journal it started.
+    """
+    digest = hashlib.sha256(json.dumps(keys).encode('utf-8')).hexdigest()
+    return windlass.tools.cache_dir('journals', digest[:16] + '.jsonl')
+
+
+class Journal(object):
+    """Append only record of the work a run has completed
+
+    Each line of the file is the json of one completed operation on an
+    artifact, written as soon as it finishes so it survives the run
+    failing or being killed. Entries are identified by the artifact name,
+    the operation, the version and the key of the task, e.g. the registry
+    of a push. digest is the digest or url the operation returned, if any.
+
+    With resume the entries already in the file are kept and reported as
+    completed, otherwise the file is started again. The journal defaults
+    to the one of the current directory, see default_path, and is never
+    part of the contexts of the images.
+    """
+
+    def __init__(self, path=None, resume=False):
+        if path is None:
+            path = default_path(os.getcwd())
+        self.path = path
+        self.resume = resume
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        windlass.fingerprint.exclude(path)
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        if resume:
+            self._read()
+        else:
+            open(path, 'w').close()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                self.entries[self._key(**entry)] = entry
+            except (ValueError, TypeError):
+                # The last line is cut short if a run was killed while
+                # writing it.
+                logging.debug('Ignoring journal entry %r', line)
+
+    @staticmethod
+    def _key(artifact, operation, version=None, key=None, **kwargs):
+        return (artifact, operation, version, key)
+
+    def completed(self, artifact, operation, version=None, key=None):
+        """Return the entry of a completed operation, or None"""
+        return self.entries.get(self._key(artifact, operation, version, key))
+
+    def record(self, artifact, operation, version=None, key=None,
+               digest=None):
+        entry = {
+            'artifact': artifact,
+            'operation': operation,
+            'version': version,
+            'key': key,
+            'digest': digest,
+        }
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[self._key(**entry)] = entry
@@ -0,0 +1,132 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+"""
+Limit how many workers use a resource at the same time
+
+The pool size limits how many artifacts are processed at once, but builds
+are bound by the cpu and disk of the docker daemon while pushes and uploads
+are bound by the network. Wrapping the use of a resource with limit() caps
+the number of workers using it, across all the workers of a run.
+
+Resources are:
+
+build  - local docker builds
+docker - docker pushes and pulls
+http   - http uploads and downloads of charts and generic artifacts
+host   - per destination host cap, applied in addition to docker and http
+"""
+
+import contextlib
+import logging
+import multiprocessing.managers
+import threading
+import urllib.parse
+
+RESOURCES = ['build', 'docker', 'http', 'host']
+
+# Default docker registry when an image name doesn't contain one.
+DEFAULT_REGISTRY_HOST = 'registry.hub.docker.com'
+
+_semaphores = None
+
+
+class Semaphores(object):
+    """Bounded semaphores for each resource, created on first use
+
+    limits is a dictionary of resource to the maximum number of users,
+    resources missing from limits are not limited.
+    """
+
+    def __init__(self, limits):
+        self.limits = dict(limits)
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def _get(self, resource, key):
+        with self.lock:
+            if (resource, key) not in self.semaphores:
+                self.semaphores[(resource, key)] = threading.BoundedSemaphore(
+                    self.limits[resource])
+            return self.semaphores[(resource, key)]
+
+    def acquire(self, resource, key=None):
+        self._get(resource, key).acquire()
+
+    def release(self, resource, key=None):
+        self._get(resource, key).release()
+
+    def get_limits(self):
+        return self.limits
+
+
+class LimitsManager(multiprocessing.managers.BaseManager):
+    """Share Semaphores between the worker processes of a pool"""
+
+
+LimitsManager.register('Semaphores', Semaphores)
+
+
+def configure(semaphores):
+    """Set the Semaphores used by limit() in this process
+
+    Used as the initializer of worker processes. Pass None to remove the
+    limits.
+    """
+    global _semaphores
+    _semaphores = semaphores
+
+
+def host_of(url):
+    """Return the host a url or docker image reference points at"""
+    if '://' in url:
+        return urllib.parse.urlparse(url).netloc
+    first = url.split('/', 1)[0]
+    if '/' in url and ('.' in first or ':' in first or first == 'localhost'):
+        return first
+    return DEFAULT_REGISTRY_HOST
+
+
+@contextlib.contextmanager
+def limit(resource, url=None):
+    """Hold a slot of resource, and of the host of url, within the block
+
+    Does nothing if no limits are configured in this process.
+    """
+    semaphores = _semaphores
+    if semaphores is None:
+        yield
+        return
+
+    limits = semaphores.get_limits()
+    held = []
+    # Always take the host before the resource so workers can't deadlock,
+    # and don't hold a resource slot while waiting on a busy host.
+    if url and limits.get('host'):
+        held.append(('host', host_of(url)))
+    if limits.get(resource):
+        held.append((resource, None))
+
+    acquired = []
+    try:
+        for name, key in held:
+            logging.debug('Waiting for %s %s', name, key or '')
+            semaphores.acquire(name, key)
+            acquired.append((name, key))
+        yield
+    finally:
+        for name, key in reversed(acquired):
+            semaphores.release(name, key)
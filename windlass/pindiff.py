@@ -16,13 +16,13 @@
 #
 from argparse import ArgumentParser
 
-from git import Repo
-from prettytable import PrettyTable
-
 from windlass.pins import diff_pins_dir
 
 
 def main():
+    from git import Repo
+    from prettytable import PrettyTable
+
     parser = ArgumentParser()
     parser.add_argument('--repository', type=str, default='.')
     parser.add_argument(
@@ -20,10 +20,6 @@ import importlib
 import logging
 import os.path
 
-import git
-import jinja2
-import ruamel.yaml
-
 import windlass.charts
 import windlass.generic
 import windlass.images
@@ -57,6 +53,8 @@ class Pins(object):
                 **kwargs)
 
     def get_pins_files_globs(self, repodir=None):
+        import git
+
         globs = self.get_value(
             'pins_files_globs', self.default_pins_files_globs)
         if not isinstance(globs, list):
@@ -73,6 +71,8 @@ class Pins(object):
         return files_globs
 
     def iter_pin_files(self, repodir=None):
+        import git
+
         pin_files_globs = self.get_pins_files_globs(repodir)
         pin_files_globs.reverse
         if isinstance(repodir, git.Commit):
@@ -129,6 +129,8 @@ class ImagePins(Pins):
         self.key = self.config.get('key', 'images')
 
     def write_pins(self, artifacts, repository, repodir=None, metadata=None):
+        import ruamel.yaml
+
         pin_file = self.get_pin_file(repository)
         if repodir:
             full_pin_file = os.path.join(repodir, pin_file)
@@ -188,6 +190,8 @@ class ImagePins(Pins):
         return [pin_file]
 
     def read_pins(self, repodir=None):
+        import ruamel.yaml
+
         pins = []
 
         ignore = self.config.get('ignore', [])
@@ -224,6 +228,8 @@ class LandscapePins(Pins):
     default_pins_files_globs = '{pins_dir}/*.yaml'
 
     def write_pins(self, artifacts, repository, repodir=None, metadata=None):
+        import ruamel.yaml
+
         written_files = []
         for artifact in self.iter_artifacts(
                 artifacts, artifacttype=windlass.charts.Chart):
@@ -283,6 +289,8 @@ class LandscapePins(Pins):
         return written_files
 
     def read_pins(self, repodir=None):
+        import ruamel.yaml
+
         pins = []
 
         ignore = self.config.get('ignore', [])
@@ -330,6 +338,8 @@ class GenericPins(Pins):
         self.key = self.config.get('key', 'generic')
 
     def write_pins(self, artifacts, repository, repodir=None, metadata=None):
+        import ruamel.yaml
+
         pin_file = self.get_pin_file(repository)
         if repodir:
             full_pin_file = os.path.join(repodir, pin_file)
@@ -387,6 +397,8 @@ class GenericPins(Pins):
         return [pin_file]
 
     def read_pins(self, repodir=None):
+        import ruamel.yaml
+
         pins = []
 
         ignore = self.config.get('ignore', [])
@@ -426,6 +438,9 @@ class OverrideYamlConfiguration(object):
 
         Write out yaml configuration based on the documentation in README.md
         """
+        import jinja2
+        import ruamel.yaml
+
         yaml = ruamel.yaml.YAML()
         updated = []
         for override, override_config in self.config.items():
@@ -569,6 +584,9 @@ def import_class(class_string):
 
 
 def read_configuration(repodir=None):
+    import git
+    import ruamel.yaml
+
     configuration = 'product-integration.yaml'
     if isinstance(repodir, git.Commit):
         if configuration in repodir.tree:
@@ -14,18 +14,17 @@
 # under the License.
 #
 import base64
-import boto3
-import botocore.exceptions
 import collections
-import docker
 import logging
 import os
-import requests
 import urllib.parse
 
 import windlass.api
+import windlass.distribution
+import windlass.dockerclient
 import windlass.exc
 import windlass.images
+import windlass.limits
 import windlass.retry
 
 
@@ -55,7 +54,18 @@ class remote_retry(windlass.retry.simple):
             self.retry_on.update(retry_on)
 
 
-class DockerConnector(object):
+class Connector(object):
+    """Base of the connectors used to transfer artifacts to a remote"""
+
+    def upload(self, *args, **kwargs):
+        raise NotImplementedError('upload not implemented')
+
+    async def aupload(self, *args, **kwargs):
+        """Upload without blocking the event loop, see upload"""
+        return await windlass.api.run_blocking(self.upload, *args, **kwargs)
+
+
+class DockerConnector(Connector):
     """Interface with a remote docker registry.
 
     Supports multiple registries for download, with each being tried in turn
@@ -71,41 +81,82 @@ class DockerConnector(object):
         else:
             self.registry_list = registry_list
 
+    @property
+    def auth_config(self):
+        if self.username is None:
+            return None
+        return {'username': self.username, 'password': self.password}
+
+    def remote_path(self, name):
+        """Return the repository in the registry name is uploaded to"""
+        return '%s/%s' % (self.registry_list[0], name)
+
+    def registry_client(self, path):
+        """Return a RegistryClient for, and the repository of, path"""
+        registry, repository = path.split('/', 1)
+        client = windlass.distribution.RegistryClient(
+            registry, self.username, self.password)
+        return client, repository
+
+    def image_labels(self, name, tag):
+        """Return the labels of the image name:tag uploaded, or None"""
+        client, repository = self.registry_client(self.remote_path(name))
+        return client.image_labels(repository, tag)
+
+    def is_uploaded(self, dcli, local_name, upload_path, upload_tag):
+        """Return whether upload_path:upload_tag is the image local_name
+
+        The digest of the tag in the registry is compared with those the
+        local image was pushed or pulled with, so pushing an image already
+        there, e.g. when promoting it from another registry, is skipped.
+        """
+        repo_digests = dcli.images.get(local_name).attrs.get(
+            'RepoDigests') or []
+        digests = set(
+            repo_digest.split('@', 1)[1] for repo_digest in repo_digests
+            if '@' in repo_digest)
+        if not digests:
+            return False
+        client, repository = self.registry_client(upload_path)
+        try:
+            return client.manifest_digest(repository, upload_tag) in digests
+        except Exception as e:
+            logging.warning(
+                'Unable to check %s:%s is uploaded, pushing it: %s',
+                upload_path, upload_tag, e)
+            return False
+
     @remote_retry()
     def upload(self, local_name, upload_name=None, upload_tag=None):
+        dcli = windlass.dockerclient.client()
+        auth_config = self.auth_config
+
+        local_image_name, local_image_tag = local_name.split(':')
+        if upload_name is None:
+            upload_name = local_image_name
+        if upload_tag is None:
+            upload_tag = local_image_tag
+        upload_path = '%s/%s' % (self.registry_list[0], upload_name)
+        upload_url = '%s:%s' % (upload_path, upload_tag)
+        if self.is_uploaded(dcli, local_name, upload_path, upload_tag):
+            logging.info(
+                '%s: Already pushed as %s', local_name, upload_url)
+            return upload_url
         try:
-            dcli = docker.from_env(version='auto')
-
-            if self.username is not None:
-                auth_config = {
-                    'username': self.username,
-                    'password': self.password
-                }
-            else:
-                auth_config = None
-
-            local_image_name, local_image_tag = local_name.split(':')
-            if upload_name is None:
-                upload_name = local_image_name
-            if upload_tag is None:
-                upload_tag = local_image_tag
-            upload_path = '%s/%s' % (self.registry_list[0], upload_name)
-            upload_url = '%s:%s' % (upload_path, upload_tag)
-            try:
-                dcli.api.tag(local_name, upload_path, upload_tag)
+            dcli.api.tag(local_name, upload_path, upload_tag)
 
-                logging.info('%s: Pushing as %s', local_name, upload_url)
+            with windlass.limits.limit('docker', upload_path):
+                logging.info(
+                    '%s: Pushing as %s', local_name, upload_url)
                 output = dcli.images.push(
                     upload_path, upload_tag, auth_config=auth_config,
                     stream=True
                 )
                 windlass.images.check_docker_stream(output)
-                logging.info('%s: Successfully pushed', local_name)
-                return upload_url
-            finally:
-                dcli.api.remove_image(upload_url)
+            logging.info('%s: Successfully pushed', local_name)
+            return upload_url
         finally:
-            dcli.close()
+            dcli.api.remove_image(upload_url)
 
     def download_docker(self, image_name):
         pass
@@ -165,6 +216,8 @@ class ECRConnector(DockerConnector):
         super().__init__([reg], user, passwd)
 
     def get_ecrc(self):
+        import boto3
+
         return boto3.client(
             'ecr', aws_access_key_id=self.creds.key_id,
             aws_secret_access_key=self.creds.secret_key,
@@ -183,7 +236,7 @@ class ECRConnector(DockerConnector):
     # This happens for a key_id that does not (yet) exist - e.g. just after
     # vault creates an ephemeral credentials.  Longer backoff than usual to
     # give AWS more time.
-    @remote_retry(retry_on=[botocore.exceptions.ClientError], max_retries=5, retry_backoff=30)  # noqa
+    @remote_retry(retry_on=['botocore.exceptions.ClientError'], max_retries=5, retry_backoff=30)  # noqa
     def _docker_login(self):
         """Get a docker login for the ECR registry
 
@@ -252,6 +305,9 @@ class ECRConnector(DockerConnector):
                 lifecyclePolicyText=self.new_repo_lifecycle_policy,
             )
 
+    def remote_path(self, name):
+        return super().remote_path(self.path_prefixes[0] + name)
+
     def upload(self, local_name, upload_name=None, upload_tag=None):
         local_image_name, local_image_tag = local_name.split(':')
         if upload_name is None:
@@ -262,7 +318,7 @@ class ECRConnector(DockerConnector):
         return super().upload(local_name, upload_path, upload_tag)
 
 
-class S3Connector(object):
+class S3Connector(Connector):
     def __init__(self, creds, bucket, path_prefix=None):
         self.creds = creds
         self.bucket = bucket
@@ -277,6 +333,8 @@ class S3Connector(object):
     @property
     def s3c(self):
         if not self._s3c:
+            import boto3
+
             key_id, secret_key, region = self.creds
             self._s3c = boto3.client(
                 's3',
@@ -289,17 +347,20 @@ class S3Connector(object):
     def upload(self, upload_name, stream):
         key = self.path_prefix + upload_name
         logging.info("Upload to s3://%s/%s", self.bucket, key)
-        self.s3c.upload_fileobj(stream, self.bucket, key)
+        with windlass.limits.limit('http', self._obj_url(upload_name)):
+            self.s3c.upload_fileobj(stream, self.bucket, key)
         return self._obj_url(upload_name)
 
 
-class HTTPBasicAuthConnector(object):
+class HTTPBasicAuthConnector(Connector):
     def __init__(self, url, username, password):
         self.base_url = url
         self.username = username
         self.password = password
 
     def upload(self, upload_name, stream, properties={}):
+        import requests
+
         auth = requests.auth.HTTPBasicAuth(
             self.username, self.password
         )
@@ -310,11 +371,12 @@ class HTTPBasicAuthConnector(object):
         props = ';'.join(['%s=%s' % (k, v) for k, v in properties.items()])
         if props:
             upload_url = '%s;%s' % (upload_url, props)
-        resp = requests.put(
-            upload_url,
-            data=stream,
-            auth=auth,
-            verify='/etc/ssl/certs')
+        with windlass.limits.limit('http', upload_url):
+            resp = requests.put(
+                upload_url,
+                data=stream,
+                auth=auth,
+                verify='/etc/ssl/certs')
         if resp.status_code in (
                 requests.codes.unauthorized, requests.codes.forbidden):
             # No retries in this case.
@@ -345,6 +407,8 @@ class HTTPBasicAuthConnector2Phase(HTTPBasicAuthConnector):
         self.temp_path = temp_path
 
     def upload(self, upload_name, stream, properties={}):
+        import requests
+
         if self.temp_path:
             # Don't upload the artifact if the artifact exists in the
             # final location.
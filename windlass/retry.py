@@ -15,11 +15,11 @@
 #
 
 import functools
+import importlib
 import logging
 import time
 import traceback
 import types
-import urllib3.exceptions
 
 import windlass.exc
 
@@ -38,10 +38,22 @@ def ensure_debug_message(excobj):
     return excobj
 
 
+def exception_class(exception):
+    """Return the exception class, importing it if it is a dotted name"""
+    if isinstance(exception, str):
+        module, name = exception.rsplit('.', 1)
+        return getattr(importlib.import_module(module), name)
+    return exception
+
+
 class simple(object):
     """Retry decorator
 
     Add this decorator to any method that we need to retry.
+
+    retry_on - exception classes to retry on, or their dotted names which
+               are only imported once an exception is raised, so modules
+               of heavy dependencies aren't imported to decorate a method.
     """
 
     def __init__(self, max_retries=3, retry_backoff=5, retry_on=None):
@@ -49,12 +61,16 @@ class simple(object):
         self.retry_backoff = retry_backoff
 
         self.retry_on = {
-            urllib3.exceptions.ReadTimeoutError,
+            'urllib3.exceptions.ReadTimeoutError',
             windlass.exc.RetryableFailure,
         }
         if retry_on:
             self.retry_on.update(retry_on)
 
+    def retryable(self, e):
+        return any(
+            isinstance(e, exception_class(r)) for r in self.retry_on)
+
     def __call__(self, func):
         attempts = []
 
@@ -69,7 +85,7 @@ class simple(object):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
-                    if not any(isinstance(e, r) for r in self.retry_on):
+                    if not self.retryable(e):
                         raise
                     logging.info(
                         '%s: problem occurred retrying, backing '
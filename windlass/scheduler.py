@@ -0,0 +1,285 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+from collections import defaultdict
+from collections import deque
+from collections import OrderedDict
+import logging
+
+import windlass.exc
+
+
+class DependencyGraph(object):
+    """Track the order in which nodes may be processed
+
+    Nodes are any hashable object, normally an artifact. A node becomes
+    ready once every node it depends on has been marked as done, so work
+    can be started as soon as its own dependencies are finished rather
+    than waiting on unrelated work.
+
+    Nodes are handed out by ready() in the order they become ready, with
+    nodes that are ready together kept in the order they were added, or
+    ordered by rank once prioritise() has been called.
+    Nodes should be added before the dependencies they list are done.
+    """
+
+    def __init__(self):
+        self.depends = OrderedDict()
+        self.dependants = defaultdict(OrderedDict)
+        self.started = set()
+        self.completed = set()
+        # Outstanding dependency count of each node, and the nodes which
+        # have become ready but not yet been handed out.
+        self.waiting = None
+        self.runnable = deque()
+        # Length of the longest path of work from each node to the end of
+        # the graph, set by prioritise.
+        self.ranks = None
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        """Build the graph for a list of artifacts
+
+        Edges come from the depends_on list of each artifact. Dependencies
+        on artifacts that are not being processed are assumed to be
+        satisfied already.
+
+        The priority of artifacts is converted into edges, each artifact
+        depends on all artifacts of the next highest priority. This keeps
+        the behaviour of running all higher priority artifacts first.
+        """
+        graph = cls()
+        artifacts = list(artifacts)
+
+        by_name = defaultdict(list)
+        tiers = defaultdict(list)
+        for artifact in artifacts:
+            by_name[artifact.name].append(artifact)
+            tiers[artifact.priority].append(artifact)
+        priorities = sorted(tiers.keys(), reverse=True)
+
+        for artifact in artifacts:
+            depends_on = []
+            for name in artifact.depends_on:
+                if name not in by_name:
+                    logging.debug(
+                        '%s: dependency %s is not being processed, '
+                        'assuming it is available', artifact.name, name)
+                    continue
+                depends_on.extend(by_name[name])
+
+            idx = priorities.index(artifact.priority)
+            if idx > 0:
+                depends_on.extend(tiers[priorities[idx - 1]])
+
+            graph.add(artifact, depends_on)
+
+        graph.check()
+        return graph
+
+    def add(self, node, depends_on=()):
+        self.depends.setdefault(node, set()).update(depends_on)
+        for dependency in depends_on:
+            self.dependants[dependency][node] = None
+        if self.waiting is not None:
+            self.waiting[node] = self._count_waiting(node)
+            if not self.waiting[node]:
+                self.runnable.append(node)
+
+    def _sort(self):
+        """Return the nodes in dependency order, and any nodes in cycles"""
+        pending = {
+            node: len(deps & self.depends.keys())
+            for node, deps in self.depends.items()}
+        queue = [node for node, count in pending.items() if count == 0]
+        order = []
+        while queue:
+            node = queue.pop()
+            order.append(node)
+            for dependant in self.dependants[node]:
+                pending[dependant] -= 1
+                if pending[dependant] == 0:
+                    queue.append(dependant)
+
+        cycle = [node for node, count in pending.items() if count > 0]
+        return order, cycle
+
+    def check(self):
+        """Raise DependencyCycleException if the graph cannot complete"""
+        _, cycle = self._sort()
+        if cycle:
+            raise windlass.exc.DependencyCycleException(
+                'Dependency cycle between %s' % ', '.join(
+                    str(getattr(node, 'name', node)) for node in cycle),
+                nodes=cycle)
+
+    def prioritise(self, cost):
+        """Hand out the ready nodes on the longest path of work first
+
+        cost(node) returns the expected duration of a node. The rank of a
+        node is its cost plus the highest rank of its dependants, i.e. the
+        remaining work on the critical path through it. Without
+        dependencies this starts the longest nodes first.
+
+        Call again after adding nodes to rank them.
+        """
+        order, _ = self._sort()
+        ranks = {}
+        for node in reversed(order):
+            ranks[node] = cost(node) + max(
+                (ranks[dependant] for dependant in self.dependants[node]
+                 if dependant in ranks),
+                default=0)
+        self.ranks = ranks
+
+    def _count_waiting(self, node):
+        return len([
+            dependency for dependency in self.depends[node]
+            if dependency in self.depends and
+            dependency not in self.completed])
+
+    def ready(self):
+        """Return the nodes that can be started, marking them as started"""
+        if self.waiting is None:
+            # Count outstanding dependencies once, after this done()
+            # only needs to look at the dependants of the finished node.
+            self.waiting = {}
+            for node in self.depends:
+                self.waiting[node] = self._count_waiting(node)
+                if not self.waiting[node] and node not in self.started:
+                    self.runnable.append(node)
+
+        nodes = list(self.runnable)
+        self.runnable.clear()
+        if self.ranks is not None:
+            # sorted is stable, so ties stay in the order they were added
+            nodes.sort(key=lambda node: -self.ranks.get(node, 0))
+        self.started.update(nodes)
+        return nodes
+
+    def done(self, node):
+        if node in self.completed:
+            return
+        self.completed.add(node)
+        if self.waiting is None:
+            return
+        for dependant in self.dependants[node]:
+            if dependant not in self.waiting:
+                continue
+            self.waiting[dependant] -= 1
+            if not self.waiting[dependant] and dependant not in self.started:
+                self.runnable.append(dependant)
+
+    def fail(self, node):
+        """Mark node as failed, skipping everything that depends on it
+
+        Returns the skipped nodes, which are never handed out by ready().
+        """
+        self.completed.add(node)
+        skipped = []
+        queue = [node]
+        while queue:
+            for dependant in self.dependants[queue.pop()]:
+                if dependant in self.completed or dependant in self.started:
+                    continue
+                self.started.add(dependant)
+                self.completed.add(dependant)
+                skipped.append(dependant)
+                queue.append(dependant)
+        return skipped
+
+    def finished(self):
+        return len(self.completed) == len(self.depends)
+
+    def __len__(self):
+        return len(self.depends)
+
+
+class Task(object):
+    """Follow up work on an artifact
+
+    Scheduled after the artifact itself is processed, with processor called
+    as processor(artifact, **kwargs). The key tells apart the tasks of an
+    artifact, e.g. the registry a push is to. Durations of the task are
+    recorded under operation, defaulting to the name of processor.
+    """
+
+    def __init__(self, artifact, processor, kwargs=None, key=None,
+                 operation=None):
+        self.artifact = artifact
+        self.processor = processor
+        self.kwargs = kwargs or {}
+        self.key = key
+        # Name the duration of the task is recorded under in the history
+        self.operation = operation or getattr(
+            processor, '__name__', type(processor).__name__)
+
+    @property
+    def name(self):
+        return '%s (%s)' % (self.artifact.name, self.key)
+
+    def __repr__(self):
+        return '<Task %s>' % self.name
+
+
+class ExecutorPool(object):
+    """Run work on a concurrent.futures executor like a multiprocessing.Pool
+
+    Windlass.run submits work with apply_async and aborts it with
+    terminate, this provides those for any executor. Work that is already
+    running on the executor can not be interrupted, terminate only cancels
+    work that has not started yet.
+
+    If owned is set the executor is shutdown when the pool is terminated
+    or closed.
+    """
+
+    def __init__(self, executor, owned=False):
+        self.executor = executor
+        self.owned = owned
+        self.futures = set()
+
+    def apply_async(self, func, args=(), kwds={}, callback=None,
+                    error_callback=None):
+        future = self.executor.submit(func, *args, **kwds)
+        self.futures.add(future)
+
+        def done(future):
+            self.futures.discard(future)
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                if error_callback:
+                    error_callback(error)
+            elif callback:
+                callback(future.result())
+
+        future.add_done_callback(done)
+        return future
+
+    def terminate(self):
+        for future in list(self.futures):
+            future.cancel()
+        self.close()
+
+    def close(self):
+        if self.owned:
+            self.executor.shutdown(wait=False)
+
+    def join(self):
+        if self.owned:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,249 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+"""
+Split the artifacts of a run into shards processed by separate jobs
+
+The split only depends on the artifacts and, if given, the durations of
+a history file no job writes to, so every job computes the same shards as
+long as they load the same products and history snapshot. Artifacts
+connected by depends_on are kept in the same shard, priorities only order
+the artifacts within each shard.
+"""
+
+from argparse import ArgumentParser
+import json
+import logging
+import os
+import sys
+import tempfile
+
+
+def parse_shard(value):
+    """Parse 'i/n' into (i, n), shards are numbered from 1"""
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise ValueError('Shard %r is not of the form i/n' % value)
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError('Shard %r is out of range' % value)
+    return index, count
+
+
+def groups(artifacts):
+    """Return the artifacts grouped with the artifacts they depend on
+
+    Priorities don't group artifacts, they are converted into dependencies
+    between the artifacts of each shard when it is processed, see
+    DependencyGraph.from_artifacts.
+    """
+    by_name = {artifact.name: artifact for artifact in artifacts}
+    parent = {artifact: artifact for artifact in artifacts}
+
+    def find(artifact):
+        while parent[artifact] is not artifact:
+            parent[artifact] = parent[parent[artifact]]
+            artifact = parent[artifact]
+        return artifact
+
+    for artifact in artifacts:
+        for name in artifact.depends_on:
+            if name in by_name:
+                parent[find(by_name[name])] = find(artifact)
+
+    grouped = {}
+    for artifact in artifacts:
+        grouped.setdefault(find(artifact), []).append(artifact)
+    return list(grouped.values())
+
+
+def costs(artifacts, history=None):
+    """Return the expected cost of each artifact
+
+    This is the recorded seconds if the history has every artifact,
+    otherwise the size of what the artifacts are built from. Artifacts
+    with an unknown cost count as the average of the others.
+    """
+    estimates = {}
+    if history is not None:
+        estimates = {
+            artifact: history.total(artifact.name)
+            for artifact in artifacts}
+    if not estimates or None in estimates.values():
+        estimates = {
+            artifact: artifact.build_size() for artifact in artifacts}
+
+    known = [cost for cost in estimates.values() if cost]
+    default = sum(known) / len(known) if known else 1
+    return {
+        artifact: cost or default for artifact, cost in estimates.items()}
+
+
+def split(artifacts, count, history=None):
+    """Return count lists of artifacts with about the same cost each
+
+    Groups of dependent artifacts are placed, most expensive first, in the
+    shard with the least cost so far. The artifacts of a shard keep the
+    order they are given in.
+    """
+    artifacts = list(artifacts)
+    cost = costs(artifacts, history)
+    shards = [[] for _ in range(count)]
+    totals = [0] * count
+
+    ordered = sorted(
+        groups(artifacts),
+        key=lambda group: (
+            -sum(cost[artifact] for artifact in group),
+            min(artifact.name for artifact in group)))
+    for group in ordered:
+        index = min(range(count), key=lambda index: (totals[index], index))
+        shards[index].extend(group)
+        totals[index] += sum(cost[artifact] for artifact in group)
+
+    position = {artifact: i for i, artifact in enumerate(artifacts)}
+    for index in range(count):
+        shards[index].sort(key=position.get)
+        logging.debug(
+            'Shard %d/%d: %d artifacts, cost %.1f',
+            index + 1, count, len(shards[index]), totals[index])
+    return shards
+
+
+def select(artifacts, index, count, history=None):
+    """Return the artifacts of shard index of count
+
+    history must be the same for every shard, e.g. a snapshot none of the
+    jobs write to, otherwise the shards can overlap or miss artifacts.
+    """
+    return split(artifacts, count, history)[index - 1]
+
+
+def write_summary(path, index, count, artifacts, names, history=None,
+                  succeeded=True, failed=()):
+    """Write the summary of a shard as json for merge_summaries
+
+    names is the names of the artifacts of every shard, those the run was
+    split from. failed is the names of the artifacts that failed, if
+    known.
+    """
+    summary = {
+        'shard': [index, count],
+        'succeeded': succeeded,
+        'artifacts': [artifact.name for artifact in artifacts],
+        'all_artifacts': sorted(names),
+        'failed': list(failed),
+        'durations': history.updates if history is not None else {},
+    }
+    dirname = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(
+            'w', dir=dirname, delete=False) as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+    os.replace(f.name, path)
+
+
+def merge_summaries(paths):
+    """Combine the summaries of all the shards of a run
+
+    Raises ValueError if a shard is missing, the shards were split from
+    different artifacts, or an artifact was processed by more than one
+    shard or by none.
+    """
+    merged = {
+        'succeeded': True, 'artifacts': [], 'failed': [], 'durations': {}}
+    seen = {}
+    count = None
+    names = None
+    for path in paths:
+        with open(path) as f:
+            summary = json.load(f)
+        if count is not None and summary['shard'][1] != count:
+            raise ValueError('%s is a shard of %d, not %d' % (
+                path, summary['shard'][1], count))
+        if names is not None and summary['all_artifacts'] != names:
+            raise ValueError(
+                '%s was split from other artifacts than %s' % (
+                    path, paths[0]))
+        index, count = summary['shard']
+        names = summary['all_artifacts']
+        if index in seen:
+            raise ValueError('%s and %s are both shard %d' % (
+                seen[index], path, index))
+        seen[index] = path
+        merged['succeeded'] = merged['succeeded'] and summary['succeeded']
+        for name in summary['artifacts']:
+            if name in merged['artifacts']:
+                raise ValueError(
+                    '%s is in more than one shard, %s' % (name, path))
+            merged['artifacts'].append(name)
+        merged['failed'].extend(summary['failed'])
+        for operation, entries in summary['durations'].items():
+            merged['durations'].setdefault(operation, {}).update(entries)
+
+    missing = set(range(1, (count or 0) + 1)) - set(seen)
+    if missing:
+        raise ValueError('Missing summaries of shards %s' % ', '.join(
+            str(index) for index in sorted(missing)))
+    unprocessed = set(names or []) - set(merged['artifacts'])
+    if unprocessed:
+        raise ValueError('%s are in no shard' % ', '.join(
+            sorted(unprocessed)))
+    unknown = set(merged['artifacts']) - set(names or [])
+    if unknown:
+        raise ValueError('%s are not artifacts of the run' % ', '.join(
+            sorted(unknown)))
+    return merged
+
+
+def main():
+    parser = ArgumentParser(
+        description='Merge the summaries of the shards of a windlass run')
+    parser.add_argument('summaries', nargs='+',
+                        help='Summaries written by each shard.')
+    parser.add_argument('--output', metavar='PATH',
+                        help='Write the merged summary here instead of '
+                        'to stdout.')
+    parser.add_argument('--history-file', metavar='PATH',
+                        help='Record the durations of the shards in this '
+                        'history file, e.g. the one the next run is '
+                        'split by.')
+    ns = parser.parse_args()
+
+    try:
+        merged = merge_summaries(ns.summaries)
+    except ValueError as e:
+        logging.error('%s', e)
+        sys.exit(1)
+
+    if ns.history_file:
+        import windlass.history
+
+        history = windlass.history.History(ns.history_file)
+        history.merge(merged['durations'])
+        history.save()
+
+    if ns.output:
+        with open(ns.output, 'w') as f:
+            json.dump(merged, f, indent=2, sort_keys=True)
+    else:
+        json.dump(merged, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    if not merged['succeeded']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import logging
 import os
 
 
@@ -58,3 +59,62 @@ def all_blob_names(tree, parent=''):
             yield b
     for b in tree.blobs:
         yield os.path.join(parent, tree.name, b.name)
+
+
+def cache_dir(*paths):
+    """Return the path of windlass's cache directory, or a path in it
+
+    This is $XDG_CACHE_HOME/windlass, defaulting to ~/.cache/windlass.
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'windlass', *paths)
+
+
+def tree_size(path):
+    """Return the total size in bytes of the files under path
+
+    Version control directories are not counted.
+    """
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        if '.git' in dirnames:
+            dirnames.remove('.git')
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def deep_merge(base, other):
+    """Return base with other merged into it
+
+    Dictionaries are merged key by key. Lists are concatenated, except
+    that an entry of other with the same name as an entry of base, such as
+    an artifact defined again by a later products file, replaces it. Any
+    other value in other replaces the one in base. Neither is modified.
+    """
+    if isinstance(base, dict) and isinstance(other, dict):
+        merged = dict(base)
+        for key, value in other.items():
+            merged[key] = deep_merge(base[key], value) \
+                if key in base else value
+        return merged
+    if isinstance(base, list) and isinstance(other, list):
+        merged = list(base)
+        names = {
+            entry['name']: idx for idx, entry in enumerate(merged)
+            if isinstance(entry, dict) and 'name' in entry}
+        for entry in other:
+            name = entry.get('name') if isinstance(entry, dict) else None
+            if name in names:
+                logging.debug('Overriding the definition of %s', name)
+                merged[names[name]] = entry
+            else:
+                if name is not None:
+                    names[name] = len(merged)
+                merged.append(entry)
+        return merged
+    return other
@@ -16,38 +16,107 @@
 #
 
 from argparse import ArgumentParser
+import json
 import logging
+import multiprocessing
 import os
 import sys
 
 import windlass.api
+import windlass.configcache
+import windlass.contexts
+import windlass.gitcache
+import windlass.history
+import windlass.journal
+import windlass.limits
 import windlass.pins
 import windlass.registries
 import windlass.remotes
+import windlass.scheduler
+import windlass.sharding
+import windlass.workqueue
 
 
-def process(artifact, ns, **kwargs):
-    # Optimize building and pushing to registry in one call
+def build(artifact, ns, version=None, **kwargs):
+    """Build or download the artifact, the first stage of processing
+
+    version is the version downloaded, or the version the build is
+    expected to be pushed as.
+    """
     if not ns.push_only:
         if ns.download:
-            artifact.download(
-                version=ns.download_version,
+            return artifact.download(
+                version=version,
                 docker_image_registry=ns.download_docker_registry,
                 charts_url=ns.download_charts_url,
                 generic_url=ns.download_generic_url,
                 **kwargs)
         else:
-            artifact.build()
+            return artifact.build(
+                version=version,
+                docker_image_registries=ns.push_docker_registry,
+                skip_unchanged=not ns.always_build,
+                buildkit=ns.buildkit,
+                context_cache=None if ns.no_context_cache
+                else windlass.contexts.ContextCache())
+
+
+def push(artifact, ns, docker_image_registry, version=None, **kwargs):
+    """Push the artifact to one registry, scheduled after build
+
+    Returns where the artifact was pushed to.
+    """
+    return artifact.upload(
+        version=version,
+        docker_image_registry=docker_image_registry,
+        charts_url=ns.push_charts_url,
+        generic_url=ns.push_generic_url,
+        **kwargs)
+
+
+def push_tasks(ns):
+    """Return the followups for run pushing each artifact to each registry"""
+    def followups(artifact):
+        if ns.no_push or ns.build_only:
+            return []
+        return [
+            windlass.scheduler.Task(
+                artifact, push,
+                {'docker_image_registry': registry,
+                 'version': ns.push_version},
+                key=str(registry))
+            for registry in ns.push_docker_registry
+        ]
+    return followups
+
 
+def stage_version(ns):
+    """Return the version of the first stage, downloaded or built"""
+    return ns.download_version if ns.download else ns.push_version
+
+
+def process(artifact, ns, **kwargs):
+    """Build and push the artifact to every registry in one call
+
+    Kept for API users, main schedules the pushes as separate tasks.
+    """
+    build(artifact, ns, version=stage_version(ns), **kwargs)
     if not ns.no_push:
         if not ns.build_only:
             for registry in ns.push_docker_registry:
-                artifact.upload(
-                    version=ns.push_version,
-                    docker_image_registry=registry,
-                    charts_url=ns.push_charts_url,
-                    generic_url=ns.push_generic_url,
-                    **kwargs)
+                push(artifact, ns, registry, version=ns.push_version,
+                     **kwargs)
+
+
+def write_shard_summary(ns, g, names, error=None):
+    index, count = ns.shard
+    path = ns.shard_summary or 'windlass-shard-%d-of-%d.json' % (index, count)
+    failed = []
+    if isinstance(error, windlass.exc.MultipleFailuresException):
+        failed = [name for name, _ in error.failures]
+    windlass.sharding.write_summary(
+        path, index, count, g.artifacts, names, g.history,
+        succeeded=error is None, failed=failed)
 
 
 def main():
@@ -89,9 +158,21 @@ configuration''')
     group.add_argument('--push-only', action='store_true',
                        help='Publish images only')
 
+    parser.add_argument('--plan', action='store_true',
+                        help='''Print what would be done to each artifact,
+with its expected duration and bytes to transfer, as json and exit
+without processing any.''')
     parser.add_argument('--no-push', action='store_true',
                         help='Under no circumstances try and push '
                         'artifacts upstream.')
+    parser.add_argument('--always-build', action='store_true',
+                        help='''Build images even if one built from the
+same sources, Dockerfile, build args and base images is already local or
+in the push registries, which are otherwise used instead.''')
+    parser.add_argument('--buildkit', action='store_true',
+                        help='''Build images with docker buildx, which
+uses BuildKit, instead of only those setting buildkit, cache_from or
+cache_to.''')
 
     download_group = parser.add_argument_group('Download options')
     download_group.add_argument(
@@ -127,10 +208,113 @@ repository is located in the workspace then we don't try and check it out.
 
 If no workspace specified this defaults to the environmental variable
 WORKSPACE or else if that isn't present to your parent directory.''')
+    parser.add_argument('--git-cache',
+                        default=windlass.gitcache.DEFAULT_GIT_CACHE,
+                        help='''Directory mirrors of the repositories not
+in the workspace are kept in between runs, so only their changes are
+fetched.''')
+    parser.add_argument('--no-config-cache', action='store_true',
+                        help='''Parse the products every time, instead
+of using the configuration cached by an earlier run with the same
+products.''')
+    parser.add_argument('--no-context-cache', action='store_true',
+                        help='''Make the build context sent to docker
+every time, instead of reusing the one made by an earlier build when none
+of its files changed.''')
+    parser.add_argument('--full-checkouts', action='store_true',
+                        help='''Mirror and check out every file of the
+repositories not in the workspace, instead of only the contexts and charts
+of the artifacts used from them.''')
 
     parser.add_argument('--pool-size', type=int,
                         help='''Set size of the process pool. This is the
 amount of artifacts to process at any one time.''')
+    parser.add_argument('--executor', choices=windlass.api.EXECUTORS,
+                        default='process',
+                        help='''Process artifacts in a pool of processes or
+threads, or on an asyncio event loop. Threads avoid the cost of forking
+workers and are enough when artifacts are only downloaded or uploaded.''')
+    parser.add_argument('--concurrency', type=int,
+                        default=windlass.api.DEFAULT_CONCURRENCY,
+                        help='''How many artifacts the asyncio executor
+processes at once, instead of --pool-size. The transfers are still bounded
+by the limits below.''')
+
+    parser.add_argument('--start-method',
+                        choices=multiprocessing.get_all_start_methods(),
+                        help='''How worker processes are started. forkserver
+starts workers from a server process with windlass and its dependencies
+already imported.''')
+
+    parser.add_argument('--schedule', choices=windlass.api.SCHEDULES,
+                        default='lpt',
+                        help='''Order to start artifacts in. lpt starts the
+artifacts with the longest expected work left first, using the durations of
+previous runs, fifo starts them in the order they become ready.''')
+    parser.add_argument('--history-file',
+                        help='''File the duration of each artifact is
+recorded in, used by the lpt schedule. Defaults to one in the cache
+directory. With --shard it is only read, and the shards are only balanced by
+its durations if it is given.''')
+
+    parser.add_argument('--keep-going', action='store_true',
+                        help='Keep processing artifacts after a failure, '
+                        'skipping only the artifacts that depend on it, '
+                        'and report every failure at the end.')
+    parser.add_argument('--resume', action='store_true',
+                        help='''Skip the builds and pushes a previous run
+recorded as completed in the journal, e.g. when retrying a failed run.''')
+    parser.add_argument('--journal',
+                        help='''File each completed build and push is
+recorded in. It is started again unless --resume is given. Defaults to a
+file in the cache directory for the current directory and products.''')
+
+    distributed_group = parser.add_argument_group(
+        'Distributed runs',
+        'Share the artifacts between windlass processes on several hosts.')
+    distributed_group.add_argument(
+        '--work-queue', metavar='DIR',
+        help='Directory shared by all the hosts of the run, e.g. over NFS. '
+        'Each artifact is processed by the host that claims it first. Use '
+        'a new directory for each run.')
+    distributed_group.add_argument(
+        '--lease-ttl', type=int, default=windlass.workqueue.DEFAULT_TTL,
+        metavar='SECONDS',
+        help='How long a host that stops responding keeps its artifacts '
+        'before other hosts take them over.')
+
+    shard_group = parser.add_argument_group(
+        'Sharding',
+        'Split the artifacts between separate jobs. All the jobs must load '
+        'the same products, and the same --history-file if one is given. '
+        'windlass-merge-shards checks and merges the summaries of the '
+        'jobs.')
+    shard_group.add_argument(
+        '--shard', type=windlass.sharding.parse_shard, metavar='I/N',
+        help='Only process shard I of N, the shards are balanced by the '
+        'durations in --history-file or the size of the artifacts.')
+    shard_group.add_argument(
+        '--shard-summary', metavar='PATH',
+        help='Where to write the json summary of the shard, defaults to '
+        'windlass-shard-I-of-N.json.')
+
+    limits_group = parser.add_argument_group(
+        'Concurrency limits',
+        'Limit how many artifacts use a resource at once, across the pool.')
+    limits_group.add_argument('--max-builds', type=int, dest='limit_build',
+                              metavar='N',
+                              help='Concurrent local docker builds.')
+    limits_group.add_argument('--max-docker-transfers', type=int,
+                              dest='limit_docker', metavar='N',
+                              help='Concurrent docker pushes and pulls.')
+    limits_group.add_argument('--max-http-transfers', type=int,
+                              dest='limit_http', metavar='N',
+                              help='Concurrent chart and generic artifact '
+                              'uploads and downloads.')
+    limits_group.add_argument('--max-per-host', type=int, dest='limit_host',
+                              metavar='N',
+                              help='Concurrent docker and http transfers to '
+                              'any one registry or server.')
 
     ns = parser.parse_args()
 
@@ -156,16 +340,69 @@ amount of artifacts to process at any one time.''')
 
     windlass.api.setupLogging(ns.debug, ns.timestamps)
 
+    limits = {}
+    for resource in windlass.limits.RESOURCES:
+        value = getattr(ns, 'limit_' + resource)
+        if value:
+            limits[resource] = value
+
+    # The jobs of a sharded run are all split by the same history, so none
+    # of them writes to it, their durations are in the summaries instead.
+    history = windlass.history.History(
+        ns.history_file or windlass.history.DEFAULT_HISTORY_FILE,
+        read_only=bool(ns.shard))
+    journal = None
+    if ns.resume or not ns.plan:
+        # A plan only reads the journal to resume, never starts it again
+        journal = windlass.journal.Journal(
+            ns.journal or windlass.journal.default_path(
+                os.getcwd(), [os.path.abspath(p) for p in ns.products]),
+            resume=ns.resume)
+    work_queue = None
+    if ns.work_queue:
+        work_queue = windlass.workqueue.DirectoryWorkQueue(
+            ns.work_queue, ttl=ns.lease_ttl)
+
     # We have specified a product integration repository. Load all
     # artifacts from the configuration in this repository.
     if ns.product_integration_repo:
         artifacts = windlass.pins.read_pins(ns.product_integration_repo)
-        g = windlass.api.Windlass(artifacts=artifacts, pool_size=ns.pool_size)
+        g = windlass.api.Windlass(
+            artifacts=artifacts,
+            pool_size=ns.pool_size,
+            executor=ns.executor,
+            concurrency=ns.concurrency,
+            limits=limits,
+            start_method=ns.start_method,
+            schedule=ns.schedule,
+            history=history,
+            journal=journal,
+            keep_going=ns.keep_going,
+            work_queue=work_queue)
     else:
         g = windlass.api.Windlass(
             ns.products,
             workspace=ns.workspace,
-            pool_size=ns.pool_size)
+            git_cache=windlass.gitcache.GitCache(
+                ns.git_cache,
+                partial=not ns.full_checkouts,
+                sparse=not ns.full_checkouts),
+            config_cache=None if ns.no_config_cache
+            else windlass.configcache.ConfigCache(),
+            pool_size=ns.pool_size,
+            executor=ns.executor,
+            concurrency=ns.concurrency,
+            limits=limits,
+            start_method=ns.start_method,
+            schedule=ns.schedule,
+            history=history,
+            journal=journal,
+            keep_going=ns.keep_going,
+            work_queue=work_queue)
+
+    if ns.shard:
+        names = g.shard(
+            *ns.shard, history=history if ns.history_file else None)
 
     docker_user = os.environ.get('DOCKER_USER', None)
     docker_password = os.environ.get('DOCKER_TOKEN', None)
@@ -175,21 +412,49 @@ amount of artifacts to process at any one time.''')
         for registry in ns.push_docker_registry
     ]
 
+    operation = 'download' if ns.download else 'build'
+    if ns.plan:
+        # Given what build and push pass the artifacts, so the plan has
+        # the builds and pushes they would skip.
+        plan = g.plan(
+            None if ns.push_only else operation,
+            artifact_name=ns.artifact_name,
+            followups=push_tasks(ns),
+            ns=ns,
+            version=stage_version(ns),
+            docker_image_registries=ns.push_docker_registry,
+            skip_unchanged=not ns.always_build)
+        json.dump(plan, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+
     # for each docker registry, build a config object, can also be
     # read in from a config file in the future
 
     try:
-        g.run(
-            process,
-            artifact_name=ns.artifact_name,
-            parallel=not ns.no_parallel,
-            # following args are for the process function
-            ns=ns,
-            docker_user=docker_user,
-            docker_password=docker_password)
-    except windlass.exc.WindlassException:
+        with g:
+            # Each push is scheduled separately once the artifact is built,
+            # so workers can build the next artifact while earlier ones are
+            # pushed to all the registries in parallel.
+            g.run(
+                build,
+                artifact_name=ns.artifact_name,
+                parallel=not ns.no_parallel,
+                followups=push_tasks(ns),
+                operation=operation,
+                # following args are for the build and push functions, the
+                # version is also what the journal records them for
+                ns=ns,
+                version=stage_version(ns),
+                docker_user=docker_user,
+                docker_password=docker_password)
+    except windlass.exc.WindlassException as e:
+        if ns.shard:
+            write_shard_summary(ns, g, names, e)
         logging.error('Exited due to error.')
         sys.exit(1)
+    if ns.shard:
+        write_shard_summary(ns, g, names)
     logging.info('Windlassed: %s', ','.join(g.configs))
 
 
@@ -0,0 +1,367 @@
+#
+# (c) Copyright 2019 Hewlett Packard Enterprise Development LP
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+
+"""
+Share the artifacts of a run between windlass processes on several hosts
+
+Every process runs the same products, and before processing an artifact
+claims it in a work queue shared by all of them. Artifacts claimed by
+another process are waited on, so dependencies are honoured across hosts
+and each process only returns once every artifact of the run is done.
+
+A claim is a lease which the owner renews while it processes the artifact
+and its followups. If the owner dies the lease expires and the artifact is
+reclaimed by another process.
+
+Artifacts depending on an artifact processed on another host need it to be
+available there, e.g. pushed to a registry.
+"""
+
+from collections import OrderedDict
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import windlass.exc
+import windlass.scheduler
+
+DEFAULT_TTL = 60
+DEFAULT_POLL_INTERVAL = 1
+
+DONE = 'done'
+FAILED = 'failed'
+LEASED = 'leased'
+EXPIRED = 'expired'
+
+
+class WorkQueue(object):
+    """Shared state of the items of a distributed run
+
+    ttl is the number of seconds a claim lasts without being renewed,
+    poll_interval how often the state of items claimed by other processes
+    is checked.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+
+    def claim(self, item, owner):
+        """Return True if owner now holds the lease of item
+
+        Fails if the item is done, failed or leased by another owner,
+        leases that have expired are taken over.
+        """
+        raise NotImplementedError('claim not implemented')
+
+    def renew(self, item, owner):
+        """Extend the lease of item, returns False if owner lost it"""
+        raise NotImplementedError('renew not implemented')
+
+    def complete(self, item, owner):
+        raise NotImplementedError('complete not implemented')
+
+    def fail(self, item, owner, message):
+        raise NotImplementedError('fail not implemented')
+
+    def state(self, item):
+        """Return a dictionary with the state, owner and message of item
+
+        The state is one of DONE, FAILED, LEASED, EXPIRED or None if the
+        item was never claimed.
+        """
+        raise NotImplementedError('state not implemented')
+
+
+class MemoryWorkQueue(WorkQueue):
+    """Work queue shared by the threads of one process, used by tests"""
+
+    def __init__(self, ttl=DEFAULT_TTL, poll_interval=0.01):
+        super().__init__(ttl, poll_interval)
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def _state(self, item):
+        entry = dict(self.items.get(item, {'state': None}))
+        if entry['state'] == LEASED and entry['expires'] <= time.time():
+            entry['state'] = EXPIRED
+        return entry
+
+    def claim(self, item, owner):
+        with self.lock:
+            if self._state(item)['state'] not in (None, EXPIRED):
+                return False
+            self.items[item] = {
+                'state': LEASED,
+                'owner': owner,
+                'expires': time.time() + self.ttl,
+            }
+            return True
+
+    def renew(self, item, owner):
+        with self.lock:
+            entry = self.items.get(item)
+            if entry is None or entry['state'] != LEASED or \
+                    entry['owner'] != owner:
+                return False
+            entry['expires'] = time.time() + self.ttl
+            return True
+
+    def complete(self, item, owner):
+        with self.lock:
+            self.items[item] = {'state': DONE, 'owner': owner}
+
+    def fail(self, item, owner, message):
+        with self.lock:
+            self.items[item] = {
+                'state': FAILED, 'owner': owner, 'message': message}
+
+    def state(self, item):
+        with self.lock:
+            return self._state(item)
+
+
+class DirectoryWorkQueue(WorkQueue):
+    """Work queue in a directory shared by the hosts, e.g. over NFS
+
+    Each item has a lease file, created exclusively to claim the item, and
+    a done or failed file once it is finished. Renewing a lease, and
+    removing an expired one before claiming the item again, hold an flock
+    on the item's lock file, so an owner renewing late can't overwrite the
+    lease of the process that took the item over. Clocks of the hosts must
+    agree to well within the ttl.
+
+    Use a new directory for each run.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL,
+                 poll_interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(ttl, poll_interval)
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _path(self, item, kind):
+        return os.path.join(
+            self.path, '%s.%s' % (urllib.parse.quote(item, safe=''), kind))
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            # Missing, or still being written by its owner
+            return None
+
+    def _write(self, path, data):
+        with tempfile.NamedTemporaryFile(
+                'w', dir=self.path, prefix='.', delete=False) as f:
+            json.dump(data, f)
+        os.replace(f.name, path)
+
+    @contextlib.contextmanager
+    def _locked(self, item):
+        """Hold the lock of item, serialising renewals and reclaims"""
+        with open(self._path(item, 'lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _lease(self, owner):
+        return {'owner': owner, 'expires': time.time() + self.ttl}
+
+    def claim(self, item, owner):
+        if self.state(item)['state'] in (DONE, FAILED):
+            return False
+        lease = self._path(item, 'lease')
+        try:
+            fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            with self._locked(item):
+                current = self._read(lease)
+                if current is None or current['expires'] > time.time():
+                    return False
+                logging.warning(
+                    '%s: lease of %s expired, reclaiming',
+                    item, current['owner'])
+                os.unlink(lease)
+            return self.claim(item, owner)
+
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._lease(owner), f)
+        if self.state(item)['state'] in (DONE, FAILED):
+            # Finished while we claimed it
+            os.unlink(lease)
+            return False
+        return True
+
+    def renew(self, item, owner):
+        lease = self._path(item, 'lease')
+        with self._locked(item):
+            current = self._read(lease)
+            if current is None or current['owner'] != owner:
+                return False
+            self._write(lease, self._lease(owner))
+        return True
+
+    def _finish(self, item, kind, data):
+        self._write(self._path(item, kind), data)
+        try:
+            os.unlink(self._path(item, 'lease'))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, item, owner):
+        self._finish(item, DONE, {'owner': owner})
+
+    def fail(self, item, owner, message):
+        self._finish(item, FAILED, {'owner': owner, 'message': message})
+
+    def state(self, item):
+        for kind in (DONE, FAILED):
+            data = self._read(self._path(item, kind))
+            if data is not None:
+                data['state'] = kind
+                return data
+        lease = self._read(self._path(item, 'lease'))
+        if lease is None:
+            return {'state': None}
+        lease['state'] = LEASED if lease['expires'] > time.time() \
+            else EXPIRED
+        return lease
+
+
+def default_owner():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+class Coordinator(object):
+    """Claim the nodes of a run's dependency graph in a work queue
+
+    An artifact and its followup tasks are processed by the process that
+    claims the artifact, which completes the item once they have all
+    finished. Nodes claimed elsewhere are waited on with poll().
+    """
+
+    def __init__(self, workqueue, graph, operation, owner=None):
+        self.workqueue = workqueue
+        self.graph = graph
+        self.operation = operation
+        self.owner = owner or default_owner()
+        # Artifacts claimed here, with the number of their tasks left
+        self.local = {}
+        # Nodes processed by other processes
+        self.waiting = OrderedDict()
+        self.stopped = threading.Event()
+        self.heartbeat = threading.Thread(target=self._renew_leases)
+        self.heartbeat.daemon = True
+
+    def __enter__(self):
+        self.heartbeat.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.heartbeat.join()
+
+    def _renew_leases(self):
+        while not self.stopped.wait(self.workqueue.ttl / 3):
+            for artifact in list(self.local):
+                if not self.workqueue.renew(self._item(artifact), self.owner):
+                    logging.warning(
+                        '%s: lost the lease, it may be processed twice',
+                        artifact.name)
+
+    def _item(self, artifact):
+        return '%s:%s' % (self.operation, artifact.name)
+
+    @staticmethod
+    def _artifact(node):
+        if isinstance(node, windlass.scheduler.Task):
+            return node.artifact
+        return node
+
+    def _claim(self, artifact):
+        if not self.workqueue.claim(self._item(artifact), self.owner):
+            return False
+        self.local[artifact] = len([
+            dependant for dependant in self.graph.dependants[artifact]
+            if isinstance(dependant, windlass.scheduler.Task)])
+        return True
+
+    def claim(self, node):
+        """Return True if node is to be processed by this process"""
+        if isinstance(node, windlass.scheduler.Task):
+            claimed = node.artifact in self.local
+        else:
+            claimed = self._claim(node)
+        if not claimed:
+            self.waiting[node] = None
+        return claimed
+
+    def done(self, node):
+        artifact = self._artifact(node)
+        if artifact not in self.local:
+            return
+        if node is not artifact:
+            self.local[artifact] -= 1
+        if not self.local[artifact]:
+            del self.local[artifact]
+            self.workqueue.complete(self._item(artifact), self.owner)
+
+    def failed(self, node, error):
+        artifact = self._artifact(node)
+        if self.local.pop(artifact, None) is not None:
+            self.workqueue.fail(self._item(artifact), self.owner, str(error))
+
+    def poll(self):
+        """Check on the nodes processed elsewhere
+
+        Returns a list of (node, error) for the nodes that have finished,
+        error is None if they succeeded, and a list of nodes whose lease
+        expired and have been claimed by this process.
+        """
+        finished = []
+        reclaimed = []
+        for node in list(self.waiting):
+            if isinstance(node, windlass.scheduler.Task):
+                # Its artifact is done, including the tasks
+                finished.append((node, None))
+                del self.waiting[node]
+                continue
+            state = self.workqueue.state(self._item(node))
+            if state['state'] == DONE:
+                finished.append((node, None))
+            elif state['state'] == FAILED:
+                finished.append((node, windlass.exc.RemoteFailureException(
+                    '%s failed on %s' % (node.name, state['owner']),
+                    owner=state['owner'],
+                    message=state.get('message'))))
+            elif state['state'] in (None, EXPIRED) and self._claim(node):
+                reclaimed.append(node)
+            else:
+                continue
+            del self.waiting[node]
+        return finished, reclaimed